@@ -0,0 +1,207 @@
+"""
+    Data-flow state initialization benchmark.
+
+    python -m benchmarks.dataflow_states -s small -s medium
+    python -m benchmarks.dataflow_states -i ir_examples/example1.ir -o states.json
+
+    Runs the anticipated-expressions pass of lazy code motion over every
+    function, once with the lattice values of the sets and once encoded as
+    bit vectors, and compares the states that DataFlowAnalysisFramework
+    shares by all blocks with the previous setup, which deep-copied the safe
+    value into the in and out state of every block. Reports the time of the
+    initialization and of analyze() and the tracemalloc peak of the
+    initialization, and checks that both setups reach the same result.
+"""
+import gc
+import json
+import platform
+import tempfile
+import time
+import tracemalloc
+from copy import deepcopy
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import click
+from tabulate import tabulate
+
+from benchmarks.ir_generator import write_ir
+from benchmarks.optimizer_stages import SCALES, git_revision
+from cof.analysis.dataflow.bitvector import BitVectorSemilattice
+from cof.analysis.dataflow.framework import DataFlowAnalysisFramework
+from cof.base.cfg import ControlFlowGraph
+from cof.base.mir.context import use_context
+from cof.early.lazy_code_motion import ExpressionUniverse, LCMAnticipatedExprSemilattice, LCMAnticipatedExprTransferCluster
+from ir_file_parser import Parser
+
+
+class DeepCopyFramework(DataFlowAnalysisFramework):
+    """
+    DataFlowAnalysisFramework with the state initialization it had before
+    the states were shared.
+    """
+
+    def _initialize_states(self, init_value, safe_value):
+        for block in self.working_cfg.all_blocks():
+            self.in_states[block] = deepcopy(safe_value)
+            self.out_states[block] = deepcopy(safe_value)
+
+        entry_block = self.working_cfg.entry_block()
+        if self.direction == 'forward':
+            self.out_states[entry_block] = deepcopy(init_value)
+        else:
+            self.in_states[entry_block] = deepcopy(init_value)
+
+
+SETUPS: Dict[str, type] = {
+    'shared': DataFlowAnalysisFramework,
+    'deepcopy': DeepCopyFramework,
+}
+LATTICES: List[str] = ['sets', 'bit vectors']
+
+
+def prepare(filename: Path) -> Tuple[Parser, list]:
+    """
+    :return: the parser, whose context has to stay alive, and the lattice
+    and transfer function of both lattices for every function.
+    """
+    parser = Parser(str(filename))
+    parser.parse()
+
+    problems = [ ]
+    with use_context(parser.context):
+        for func in parser.func_list:
+            cfg = ControlFlowGraph(func.insts)
+            cfg.initialize()
+            exprs = ExpressionUniverse(cfg)
+            lattice = LCMAnticipatedExprSemilattice(exprs.all_exprs)
+            problems.append((cfg, {
+                'sets': (lattice, LCMAnticipatedExprTransferCluster(
+                    exprs.universe.decode_map(exprs.e_use_sets),
+                    exprs.universe.decode_map(exprs.e_kill_sets),
+                )),
+                'bit vectors': (
+                    BitVectorSemilattice(lattice, exprs.universe),
+                    LCMAnticipatedExprTransferCluster(exprs.e_use_sets, exprs.e_kill_sets),
+                ),
+            }))
+    return parser, problems
+
+
+def run_setup(problems: list, setup: str, lattice_name: str) -> dict:
+    """
+    :return: seconds of the initialization and of analyze() and the
+    results, summed over all functions.
+    """
+    framework = SETUPS[setup]
+    result = {'init': 0.0, 'analyze': 0.0, 'results': [ ]}
+    gc.collect()
+    for cfg, lattices in problems:
+        lattice, transfer = lattices[lattice_name]
+
+        start = time.perf_counter()
+        analysis = framework(cfg, lattice, transfer, 'backward', lattice.bottom(), lattice.top())
+        result['init'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        result['results'].append(analysis.analyze(strategy='worklist'))
+        result['analyze'] += time.perf_counter() - start
+    return result
+
+
+def init_peak(problems: list, setup: str, lattice_name: str) -> int:
+    """
+    :return: the largest tracemalloc peak in bytes of initializing the
+    states of a function.
+    """
+    framework = SETUPS[setup]
+    peak = 0
+    gc.collect()
+    for cfg, lattices in problems:
+        lattice, transfer = lattices[lattice_name]
+        bottom, top = lattice.bottom(), lattice.top()
+        tracemalloc.start()
+        analysis = framework(cfg, lattice, transfer, 'backward', bottom, top)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        del analysis
+    return peak
+
+
+def report_input(name: str, filename: Path, repeat: int) -> dict:
+    parser, problems = prepare(filename)
+    rows: List[dict] = [ ]
+    with use_context(parser.context):
+        for lattice_name in LATTICES:
+            results = { }
+            for setup in SETUPS:
+                runs = [run_setup(problems, setup, lattice_name) for _ in range(repeat)]
+                best = min(runs, key=lambda r: r['init'] + r['analyze'])
+                results[setup] = best.pop('results')
+                best['peak'] = init_peak(problems, setup, lattice_name)
+                rows.append({'lattice': lattice_name, 'setup': setup, **best})
+            rows[-1]['same'] = rows[-2]['same'] = results['shared'] == results['deepcopy']
+
+    return {
+        'name': name,
+        'functions': len(problems),
+        'blocks': sum(len(cfg.all_blocks()) for cfg, _ in problems),
+        'rows': rows,
+    }
+
+
+def print_report(report: dict):
+    rows = [[
+        r['lattice'],
+        r['setup'],
+        f"{1000 * r['init']:.2f}",
+        f"{r['peak'] / 1e6:.3f}",
+        f"{1000 * r['analyze']:.2f}",
+        "yes" if r['same'] else "NO",
+    ] for r in report['rows']]
+    headers = ["Lattice", "States", "Init (ms)", "Init peak (MB)", "Analyze (ms)", "Same result"]
+    click.echo(f"{report['name']} ({report['functions']} functions, {report['blocks']} blocks):")
+    click.echo(tabulate(rows, headers=headers, tablefmt="simple"))
+    click.echo()
+
+
+@click.command(help="""
+比较数据流分析中所有基本块共享的初始状态与逐块深拷贝的初始状态的耗时和内存。
+""")
+@click.option('--input-file', '-i', 'input_files', multiple=True,
+              type=click.Path(exists=True, dir_okay=False, readable=True, path_type=Path),
+              help='输入的IR文件，可多次指定。')
+@click.option('--scale', '-s', 'scales', multiple=True, type=click.Choice(list(SCALES)),
+              help='生成的合成IR规模，可多次指定，未指定输入时默认 small。')
+@click.option('--repeat', '-r', type=click.IntRange(min=1), default=3, show_default=True,
+              help='每种初始状态的运行次数，取最快的一次。')
+@click.option('--output-file', '-o', type=click.Path(dir_okay=False, writable=True, path_type=Path),
+              help='结果JSON文件。')
+def main(input_files, scales, repeat, output_file):
+    if not input_files and not scales:
+        scales = ('small',)
+
+    reports: List[dict] = [ ]
+    for filename in input_files:
+        reports.append(report_input(str(filename), filename, repeat))
+        print_report(reports[-1])
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name in scales:
+            filename = Path(tmp_dir) / f"{name}.ir"
+            write_ir(SCALES[name], filename)
+            reports.append(report_input(name, filename, repeat))
+            print_report(reports[-1])
+
+    if output_file:
+        output_file.write_text(json.dumps({
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'repeat': repeat,
+            'inputs': reports,
+        }, indent=2) + "\n", encoding='utf-8')
+
+
+if __name__ == '__main__':
+    main()
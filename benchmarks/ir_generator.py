@@ -0,0 +1,212 @@
+"""
+    Synthetic MIR generator.
+
+    python -m benchmarks.ir_generator -o big.ir --functions 100 --blocks 200
+
+    Emits structured code in the syntax of ir_file_parser: straight-line
+    blocks, if/else diamonds and loops nested up to a given depth. The
+    same shape and seed always give the same file.
+"""
+import random
+from pathlib import Path
+from typing import Iterator, List, Tuple
+
+import click
+
+
+class IRShape:
+    """
+    Size and structure of a generated module.
+    """
+
+    def __init__(
+            self,
+            functions: int = 10,
+            blocks: int = 20,
+            insts_per_block: int = 6,
+            loop_depth: int = 2,
+            variables: int = 8,
+            redundancy: float = 0.3,
+            branch_density: float = 0.3,
+            seed: int = 0,
+    ):
+        # number of functions and of labeled blocks per function
+        self.functions: int = functions
+        self.blocks: int = blocks
+        # assignments per straight-line block
+        self.insts_per_block: int = insts_per_block
+        # maximum nesting depth of loops
+        self.loop_depth: int = loop_depth
+        # variables per function
+        self.variables: int = variables
+        # probability that an assignment recomputes an expression of the function
+        self.redundancy: float = redundancy
+        # probability that a region starts a branch (diamond or loop) instead of a block
+        self.branch_density: float = branch_density
+        self.seed: int = seed
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+
+_ARITH_OPS = ['+', '-', '*']
+_COMPARE_OPS = ['<', '<=', '>', '>=', '!=']
+
+
+class _FunctionGenerator:
+
+    def __init__(self, shape: IRShape, index: int, rnd: random.Random):
+        self.shape: IRShape = shape
+        self.rnd: random.Random = rnd
+        self.name: str = f"f{index}"
+        self.vars: List[str] = [f"v{i}" for i in range(max(shape.variables, 2))]
+        # expressions computed so far, recomputed with probability shape.redundancy
+        self.exprs: List[Tuple[str, str, str]] = [ ]
+        self.num_labels: int = 0
+        self.lines: List[str] = [ ]
+
+    def _label(self) -> str:
+        self.num_labels += 1
+        return f"{self.name}_L{self.num_labels}"
+
+    def _operand(self) -> str:
+        if self.rnd.random() < 0.2:
+            return str(self.rnd.randint(0, 9))
+        return self.rnd.choice(self.vars)
+
+    def _assign(self):
+        dest = self.rnd.choice(self.vars)
+        if self.exprs and self.rnd.random() < self.shape.redundancy:
+            left, op, right = self.rnd.choice(self.exprs)
+        else:
+            left, op, right = self._operand(), self.rnd.choice(_ARITH_OPS), self._operand()
+            self.exprs.append((left, op, right))
+        self.lines.append(f"    {dest} := {left} {op} {right}")
+
+    def _statements(self):
+        for _ in range(self.shape.insts_per_block):
+            self._assign()
+
+    def _condition(self) -> str:
+        cond = f"c{self.num_labels}"
+        self.lines.append(f"    {cond} := {self.rnd.choice(self.vars)} {self.rnd.choice(_COMPARE_OPS)} {self._operand()}")
+        return cond
+
+    def _block(self):
+        self.lines.append(f"{self._label()}:")
+        self._statements()
+
+    def _diamond(self, blocks: int, depth: int):
+        then_label, join_label = self._label(), self._label()
+        cond = self._condition()
+        self.lines.append(f"    %if {cond} %goto &{then_label}")
+        self._statements()
+        self._region(blocks // 2, depth)
+        self.lines.append(f"    %goto &{join_label}")
+        self.lines.append(f"{then_label}:")
+        self._statements()
+        self._region(blocks - blocks // 2, depth)
+        self.lines.append(f"{join_label}:")
+        self._statements()
+
+    def _loop(self, blocks: int, depth: int):
+        header_label, body_label, exit_label = self._label(), self._label(), self._label()
+        counter = self.rnd.choice(self.vars)
+        self.lines.append(f"{header_label}:")
+        cond = self._condition()
+        self.lines.append(f"    %if {cond} %goto &{body_label}")
+        self.lines.append(f"    %goto &{exit_label}")
+        self.lines.append(f"{body_label}:")
+        self._statements()
+        self._region(blocks, depth + 1)
+        self.lines.append(f"    {counter} := {counter} + 1")
+        self.lines.append(f"    %goto &{header_label}")
+        self.lines.append(f"{exit_label}:")
+        self._statements()
+
+    def _region(self, blocks: int, depth: int):
+        """
+        Emit about the given number of labeled blocks.
+        """
+        while blocks > 0:
+            if blocks >= 3 and self.rnd.random() < self.shape.branch_density:
+                inner = self.rnd.randint(0, (blocks - 3) // 2)
+                if depth < self.shape.loop_depth and self.rnd.random() < 0.5:
+                    self._loop(inner, depth)
+                else:
+                    self._diamond(inner, depth)
+                blocks -= 3 + inner
+            else:
+                self._block()
+                blocks -= 1
+
+    def generate(self) -> List[str]:
+        self.lines.append(f"$function {self.name} ( n )")
+        self.lines.append("    %entry")
+        self.lines.append("    %init n")
+        for var in self.vars:
+            self.lines.append(f"    {var} := {self.rnd.randint(0, 9)}")
+        self._region(self.shape.blocks, 0)
+        self.lines.append(f"    printf ( {' '.join(self.vars[:3])} )")
+        self.lines.append("    %exit")
+        self.lines.append("$end function")
+        self.lines.append("")
+        return self.lines
+
+
+def generate_ir(shape: IRShape) -> Iterator[str]:
+    """
+    :return: the lines of the module, without line ends.
+    """
+    rnd = random.Random(shape.seed)
+    for i in range(shape.functions):
+        yield from _FunctionGenerator(shape, i, rnd).generate()
+
+
+def write_ir(shape: IRShape, filename) -> int:
+    """
+    Write the generated module to filename.
+    :return: the number of lines written.
+    """
+    num_lines = 0
+    with open(filename, mode='w', encoding='utf-8') as file:
+        for line in generate_ir(shape):
+            file.write(line)
+            file.write("\n")
+            num_lines += 1
+    return num_lines
+
+
+@click.command(help="""
+生成指定规模和结构的合成IR文件，用于性能测试。
+""")
+@click.option('--output-file', '-o', required=True, type=click.Path(dir_okay=False, writable=True, path_type=Path),
+              help='输出的IR文件路径。')
+@click.option('--functions', type=click.IntRange(min=1), default=10, show_default=True, help='函数个数。')
+@click.option('--blocks', type=click.IntRange(min=1), default=20, show_default=True, help='每个函数的基本块个数(近似)。')
+@click.option('--insts-per-block', type=click.IntRange(min=1), default=6, show_default=True,
+              help='每个基本块的赋值指令个数。')
+@click.option('--loop-depth', type=click.IntRange(min=0), default=2, show_default=True, help='循环的最大嵌套深度。')
+@click.option('--variables', type=click.IntRange(min=2), default=8, show_default=True, help='每个函数的变量个数。')
+@click.option('--redundancy', type=click.FloatRange(0, 1), default=0.3, show_default=True,
+              help='赋值重复计算已有表达式的概率。')
+@click.option('--branch-density', type=click.FloatRange(0, 1), default=0.3, show_default=True,
+              help='生成分支或循环(而非顺序基本块)的概率。')
+@click.option('--seed', type=int, default=0, show_default=True, help='随机数种子。')
+def main(output_file, functions, blocks, insts_per_block, loop_depth, variables, redundancy, branch_density, seed):
+    shape = IRShape(
+        functions=functions,
+        blocks=blocks,
+        insts_per_block=insts_per_block,
+        loop_depth=loop_depth,
+        variables=variables,
+        redundancy=redundancy,
+        branch_density=branch_density,
+        seed=seed,
+    )
+    num_lines = write_ir(shape, output_file)
+    click.echo(f"{output_file}: {num_lines} lines")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+    Binary MIR (.mirb) benchmark.
+
+    python -m benchmarks.mirb_throughput input.ir [more.ir ...] [-r 5]
+
+    Every file is parsed, saved as .mirb to a temporary directory and
+    loaded again, repeat times each. The best runs of parsing and loading
+    are compared, together with the file sizes.
+"""
+import gc
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable
+
+import click
+
+from cof.base.mir.context import use_context
+from cof.base.mir.mirb import load_mirb, save_mirb
+from ir_file_parser import Parser
+
+
+def best_of(repeat: int, run: Callable[[], object]) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def parse_file(filename: Path) -> Parser:
+    parser = Parser(str(filename))
+    parser.parse()
+    parser.insts.assign_addr()
+    return parser
+
+
+@click.command(help="""
+比较文本IR解析与二进制MIR(.mirb)加载的速度和文件大小。
+""")
+@click.argument('input_files', nargs=-1, required=True,
+                type=click.Path(exists=True, dir_okay=False, readable=True, path_type=Path))
+@click.option('--repeat', '-r', type=click.IntRange(min=1), default=3, show_default=True,
+              help='每个文件的解析/加载次数，取最快的一次。')
+def main(input_files, repeat):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for filename in input_files:
+            mirb_file = str(Path(tmp_dir) / (filename.stem + '.mirb'))
+            parser = parse_file(filename)
+            with use_context(parser.context):
+                save_seconds = best_of(1, lambda: save_mirb(parser.insts, parser.func_list, mirb_file))
+            del parser
+
+            parse_seconds = best_of(repeat, lambda: parse_file(filename))
+            load_seconds = best_of(repeat, lambda: load_mirb(mirb_file))
+            click.echo(
+                f"{filename}: {filename.stat().st_size:,} -> {Path(mirb_file).stat().st_size:,} bytes, "
+                f"parse {parse_seconds:.3f} s, save {save_seconds:.3f} s, load {load_seconds:.3f} s, "
+                f"load {parse_seconds / load_seconds:.1f}x faster"
+            )
+
+
+if __name__ == '__main__':
+    main()
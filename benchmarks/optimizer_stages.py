@@ -0,0 +1,180 @@
+"""
+    Optimizer stage benchmark.
+
+    python -m benchmarks.optimizer_stages -s small -s medium -o results.json [--compare old.json]
+    python -m benchmarks.optimizer_stages -s large --until sccp
+
+    Generates a module for every scale (see benchmarks.ir_generator) and
+    times the stages of the optimizer over all of its functions: parsing,
+    ControlFlowGraph construction, initialize(), minimal_ssa(), the SSA
+    edges, sccp_analysis() and lazy_code_motion_optimize(). The best of
+    repeat runs of every stage is written to a JSON file, which can be
+    compared with the results of another commit.
+"""
+import gc
+import json
+import platform
+import subprocess
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import click
+
+from benchmarks.ir_generator import IRShape, write_ir
+from cof.analysis.loop import LoopAnalyzer
+from cof.analysis.sccp import sccp_analysis
+from cof.base.cfg import ControlFlowGraph
+from cof.base.mir.context import use_context
+from cof.early.lazy_code_motion import lazy_code_motion_optimize
+from ir_file_parser import Parser
+
+STAGES: List[str] = ['parse', 'cfg', 'initialize', 'minimal_ssa', 'ssa_edges', 'sccp', 'lcm']
+
+SCALES: Dict[str, IRShape] = {
+    'small': IRShape(functions=10, blocks=20),
+    'medium': IRShape(functions=40, blocks=60, loop_depth=3),
+    'large': IRShape(functions=100, blocks=150, loop_depth=3),
+    'deep': IRShape(functions=10, blocks=300, loop_depth=8, branch_density=0.6),
+    'wide': IRShape(functions=20, blocks=100, variables=64, redundancy=0.6),
+}
+
+
+def run_once(filename: Path, stages: List[str]) -> Dict[str, float]:
+    """
+    Run the stages in order, later stages than stages[-1] are skipped.
+    :return: seconds per stage, summed over all functions.
+    """
+    seconds: Dict[str, float] = defaultdict(float)
+    gc.collect()
+
+    start = time.perf_counter()
+    parser = Parser(str(filename))
+    parser.parse()
+    seconds['parse'] = time.perf_counter() - start
+
+    with use_context(parser.context):
+        for func in parser.func_list:
+            if 'cfg' not in stages:
+                continue
+            start = time.perf_counter()
+            cfg = ControlFlowGraph(func.insts)
+            seconds['cfg'] += time.perf_counter() - start
+
+            if 'initialize' not in stages:
+                continue
+            start = time.perf_counter()
+            cfg.initialize()
+            seconds['initialize'] += time.perf_counter() - start
+
+            if 'minimal_ssa' not in stages:
+                continue
+            start = time.perf_counter()
+            cfg.minimal_ssa()
+            seconds['minimal_ssa'] += time.perf_counter() - start
+
+            if 'ssa_edges' not in stages:
+                continue
+            start = time.perf_counter()
+            ssa_edges = cfg.ssa_edges_comp(LoopAnalyzer(cfg).analyze_loops())
+            seconds['ssa_edges'] += time.perf_counter() - start
+
+            if 'sccp' not in stages:
+                continue
+            start = time.perf_counter()
+            sccp_analysis(cfg, ssa_edges)
+            seconds['sccp'] += time.perf_counter() - start
+
+            if 'lcm' not in stages:
+                continue
+            start = time.perf_counter()
+            lazy_code_motion_optimize(cfg)
+            seconds['lcm'] += time.perf_counter() - start
+
+    return seconds
+
+
+def count_insts(filename: Path) -> int:
+    parser = Parser(str(filename))
+    parser.parse()
+    return sum(len(f.insts.ret_insts()) for f in parser.func_list)
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True, cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark_scale(name: str, shape: IRShape, repeat: int, stages: List[str], tmp_dir: str) -> dict:
+    filename = Path(tmp_dir) / f"{name}.ir"
+    lines = write_ir(shape, filename)
+
+    best: Dict[str, float] = {stage: float('inf') for stage in stages}
+    for _ in range(repeat):
+        for stage, seconds in run_once(filename, stages).items():
+            best[stage] = min(best[stage], seconds)
+
+    return {
+        'name': name,
+        'shape': shape.to_dict(),
+        'lines': lines,
+        'insts': count_insts(filename),
+        'seconds': best,
+    }
+
+
+def print_scale(result: dict, previous: Optional[dict]):
+    click.echo(f"{result['name']}: {result['lines']} lines, {result['insts']} insts")
+    for stage, seconds in result['seconds'].items():
+        line = f"  {stage:<12} {seconds:10.4f} s"
+        if previous and stage in previous['seconds'] and seconds > 0:
+            old = previous['seconds'][stage]
+            line += f"   was {old:10.4f} s  ({old / seconds:.2f}x)"
+        click.echo(line)
+
+
+@click.command(help="""
+在不同规模的合成IR上测量优化器各阶段的耗时，并将结果保存为JSON。
+""")
+@click.option('--scale', '-s', 'scales', multiple=True, type=click.Choice(list(SCALES)),
+              help='测试规模，可多次指定，默认 small 和 medium。')
+@click.option('--repeat', '-r', type=click.IntRange(min=1), default=3, show_default=True,
+              help='每个规模的运行次数，每个阶段取最快的一次。')
+@click.option('--until', type=click.Choice(STAGES), default=STAGES[-1], show_default=True,
+              help='只运行到此阶段为止。')
+@click.option('--output-file', '-o', type=click.Path(dir_okay=False, writable=True, path_type=Path),
+              help='结果JSON文件。')
+@click.option('--compare', type=click.Path(exists=True, dir_okay=False, readable=True, path_type=Path),
+              help='与之前保存的结果JSON文件比较。')
+def main(scales, repeat, until, output_file, compare):
+    stages = STAGES[:STAGES.index(until) + 1]
+    previous: Dict[str, dict] = { }
+    if compare:
+        previous = {r['name']: r for r in json.loads(compare.read_text(encoding='utf-8'))['scales']}
+
+    results = [ ]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name in scales or ('small', 'medium'):
+            result = benchmark_scale(name, SCALES[name], repeat, stages, tmp_dir)
+            print_scale(result, previous.get(name))
+            results.append(result)
+
+    if output_file:
+        output_file.write_text(json.dumps({
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'repeat': repeat,
+            'scales': results,
+        }, indent=2) + "\n", encoding='utf-8')
+
+
+if __name__ == '__main__':
+    main()
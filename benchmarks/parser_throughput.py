@@ -0,0 +1,58 @@
+"""
+    Parser throughput benchmark.
+
+    python -m benchmarks.parser_throughput input.ir [more.ir ...] [-r 5]
+
+    Every file is parsed repeat times, the best run is reported in source
+    lines (including comments and blank lines) per second.
+"""
+import gc
+import time
+from pathlib import Path
+from typing import Tuple
+
+import click
+
+from ir_file_parser import Parser
+
+
+def _count_lines(filename: Path) -> int:
+    with open(filename, 'rb') as ir_file:
+        return sum(1 for _ in ir_file)
+
+
+def _count_insts(parser: Parser) -> int:
+    return len(parser.insts.ret_insts()) + sum(len(f.insts.ret_insts()) for f in parser.func_list)
+
+
+def parse_once(filename: Path) -> Tuple[float, int]:
+    """
+    :return: seconds spent in Parser.parse() and the number of parsed instructions.
+    """
+    gc.collect()
+    start = time.perf_counter()
+    parser = Parser(str(filename))
+    parser.parse()
+    seconds = time.perf_counter() - start
+    return seconds, _count_insts(parser)
+
+
+@click.command(help="""
+测量IR解析器的吞吐量(行/秒)。
+""")
+@click.argument('input_files', nargs=-1, required=True,
+                type=click.Path(exists=True, dir_okay=False, readable=True, path_type=Path))
+@click.option('--repeat', '-r', type=click.IntRange(min=1), default=3, show_default=True,
+              help='每个文件的解析次数，取最快的一次。')
+def main(input_files, repeat):
+    for filename in input_files:
+        lines = _count_lines(filename)
+        best, insts = min(parse_once(filename) for _ in range(repeat))
+        click.echo(
+            f"{filename}: {lines} lines, {insts} insts, "
+            f"{best:.3f} s, {lines / best:,.0f} lines/s, {insts / best:,.0f} insts/s"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+    SSA flavor report.
+
+    python -m benchmarks.ssa_flavors -s medium -s deep
+    python -m benchmarks.ssa_flavors -i ir_examples/sccp_example.ir -o flavors.json
+
+    Builds SSA form with every flavor of ControlFlowGraph.construct_ssa()
+    and reports the phi functions inserted, the construction time (including
+    the liveness analysis of pruned SSA) and the time of what runs on the
+    SSA form afterwards: the SSA edges, sccp_analysis(), constant folding
+    and printing the instructions.
+"""
+import gc
+import json
+import platform
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import click
+from tabulate import tabulate
+
+from benchmarks.ir_generator import write_ir
+from benchmarks.optimizer_stages import SCALES, git_revision
+from cof.analysis.dataflow import DataFlowAnalyzer
+from cof.analysis.loop import LoopAnalyzer
+from cof.analysis.sccp import sccp_analysis
+from cof.base.cfg import ControlFlowGraph, ssa_flavors
+from cof.base.mir.context import use_context
+from cof.early.const_folding import constant_folding
+from ir_file_parser import Parser
+
+
+def run_flavor(filename: Path, flavor: str) -> dict:
+    """
+    :return: phi functions, SSA values and seconds of the flavor, summed over all functions.
+    """
+    parser = Parser(str(filename))
+    parser.parse()
+    gc.collect()
+
+    result = {'phis': 0, 'values': 0, 'construct': 0.0, 'downstream': 0.0}
+    with use_context(parser.context):
+        for func in parser.func_list:
+            cfg = ControlFlowGraph(func.insts)
+            cfg.initialize()
+
+            start = time.perf_counter()
+            live_in = DataFlowAnalyzer(cfg).live_vars(verbose=False) if flavor == 'pruned' else None
+            result['phis'] += cfg.construct_ssa(flavor, live_in)
+            result['construct'] += time.perf_counter() - start
+            result['values'] += len(cfg.ssa_values)
+
+            start = time.perf_counter()
+            ssa_edges = cfg.ssa_edges_comp(LoopAnalyzer(cfg).analyze_loops())
+            constant_folding(sccp_analysis(cfg, ssa_edges))
+            str(cfg.insts)
+            result['downstream'] += time.perf_counter() - start
+
+    result['total'] = result['construct'] + result['downstream']
+    return result
+
+
+def report_input(name: str, filename: Path, repeat: int) -> dict:
+    flavors: Dict[str, dict] = { }
+    for flavor in ssa_flavors:
+        runs = [run_flavor(filename, flavor) for _ in range(repeat)]
+        flavors[flavor] = min(runs, key=lambda r: r['total'])
+    return {'name': name, 'flavors': flavors}
+
+
+def print_report(report: dict):
+    minimal = report['flavors']['minimal']
+    rows = [ ]
+    for flavor, r in report['flavors'].items():
+        rows.append([
+            flavor,
+            r['phis'],
+            f"{100 * r['phis'] / minimal['phis']:.1f}%" if minimal['phis'] else "-",
+            r['values'],
+            f"{r['construct']:.4f}",
+            f"{r['downstream']:.4f}",
+            f"{r['total']:.4f}",
+        ])
+    headers = ["Flavor", "Phis", "% Minimal", "Values", "Construct (s)", "Downstream (s)", "Total (s)"]
+    click.echo(f"{report['name']}:")
+    click.echo(tabulate(rows, headers=headers, tablefmt="simple"))
+    click.echo()
+
+
+@click.command(help="""
+比较各种SSA构造方式插入的φ函数个数、构造耗时以及后续阶段的耗时。
+""")
+@click.option('--input-file', '-i', 'input_files', multiple=True,
+              type=click.Path(exists=True, dir_okay=False, readable=True, path_type=Path),
+              help='输入的IR文件，可多次指定。')
+@click.option('--scale', '-s', 'scales', multiple=True, type=click.Choice(list(SCALES)),
+              help='生成的合成IR规模，可多次指定，未指定输入时默认 medium。')
+@click.option('--repeat', '-r', type=click.IntRange(min=1), default=3, show_default=True,
+              help='每种构造方式的运行次数，取最快的一次。')
+@click.option('--output-file', '-o', type=click.Path(dir_okay=False, writable=True, path_type=Path),
+              help='结果JSON文件。')
+def main(input_files, scales, repeat, output_file):
+    if not input_files and not scales:
+        scales = ('medium',)
+
+    reports: List[dict] = [ ]
+    for filename in input_files:
+        reports.append(report_input(str(filename), filename, repeat))
+        print_report(reports[-1])
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name in scales:
+            filename = Path(tmp_dir) / f"{name}.ir"
+            write_ir(SCALES[name], filename)
+            reports.append(report_input(name, filename, repeat))
+            print_report(reports[-1])
+
+    if output_file:
+        output_file.write_text(json.dumps({
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'repeat': repeat,
+            'inputs': reports,
+        }, indent=2) + "\n", encoding='utf-8')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,31 +1,118 @@
 #!/usr/bin/python
-from typing import List, Tuple
+import contextlib
+from typing import Iterator, List, Tuple
 
 import click
 from pathlib import Path
 
 from cof import CodeOptimizer
+from cof.base.cfg import ssa_flavors
+from cof.base.dominator import dominator_engines
+from cof.cache import DEFAULT_CACHE_SIZE, FunctionCache
+from cof.base.mir.context import MIRContext, current_context, use_context
 from cof.base.mir.function import MIRFunction
-from cof.base.mir.inst import MIRInsts
+from cof.base.mir.inst import MIRInst, MIRInsts
+from cof.base.mir.mirb import MIRB_SUFFIX, load_mirb, save_mirb
+from cof.timing import PassTimer, time_pass, use_timer
+from cof.trace import CHANNELS, tracing, verbosity_level
 from ir_file_parser import Parser
 
 
-def parse_ir_file(filename: str) -> Tuple[MIRInsts, List[MIRFunction]]:
+def parse_ir_file(filename: str) -> Tuple[MIRInsts, List[MIRFunction], MIRContext]:
     p = Parser(filename)
     p.parse()
     p.insts.assign_addr()
-    return p.insts, p.func_list
+    return p.insts, p.func_list, p.context
+
+
+def is_mirb_file(filename) -> bool:
+    return Path(filename).suffix == MIRB_SUFFIX
+
+
+def read_mir_module(filename: str) -> Tuple[MIRInsts, List[MIRFunction], MIRContext]:
+    """
+    Load a .mirb file or parse a text IR file.
+    """
+    if is_mirb_file(filename):
+        with time_pass('load'):
+            return load_mirb(filename)
+    return parse_ir_file(filename)
 
 
 # ++++++++ Output ++++++++
-def output_mir(insts, output_file):
+def output_mir(insts, output_file, func_list: List[MIRFunction] = None):
+    """
+    Write the module as text, or in the binary format if output_file ends
+    with .mirb, which also needs the function list.
+    """
+    output_path = Path(output_file)
+    output_dir = output_path.parent
+    if output_dir and not output_dir.exists():
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+    with time_pass('output'):
+        if is_mirb_file(output_file):
+            save_mirb(insts, func_list, str(output_file))
+            return
+
+        with open(output_file, mode='w', encoding='utf-8') as file:
+            file.write(str(insts))
+
+
+def output_mir_stream(insts: MIRInsts, functions: Iterator[MIRFunction], output_file):
+    """
+    Write the module while functions are still being parsed and optimized.
+
+    The top level instructions up to the definition of a function are
+    written as soon as it is yielded, the rest after the last one. Addresses
+    are assigned on the way, exactly as MIRInsts.assign_addr() does, so the
+    output equals output_mir() after optimizing the whole module. Written
+    instructions are removed from insts and released together with the
+    body of the function, see MIRContext.release().
+    """
     output_path = Path(output_file)
     output_dir = output_path.parent
     if output_dir and not output_dir.exists():
         output_dir.mkdir(parents=True, exist_ok=True)
 
+    context = current_context()
+    written = 0
+    first = True
+    addr = 0
+
+    def write_next() -> MIRInst:
+        nonlocal written, first, addr
+        inst = insts.ret_inst_by_idx(written)
+        inst.addr = addr
+        if inst.is_func():
+            addr = inst.operand1.value.insts.assign_addr(base=addr)
+        addr += 1
+
+        if not first:
+            file.write("\n")
+        file.write(str(inst))
+        written += 1
+        first = False
+        return inst
+
     with open(output_file, mode='w', encoding='utf-8') as file:
-        file.write(str(insts))
+        for func in functions:
+            with time_pass('output'):
+                while True:
+                    inst = write_next()
+                    if inst.is_func() and inst.operand1.value is func:
+                        break
+
+                context.release(func.insts.ret_insts())
+                func.insts = MIRInsts()
+                top_insts = insts.ret_insts_by_pos(0, written)
+                insts.remove_insts_by_pos(0, written)
+                context.release(top_insts)
+                written = 0
+
+        with time_pass('output'):
+            while written < insts.num:
+                write_next()
 
 
 @click.group(help="""
@@ -39,6 +126,8 @@ def output_mir(insts, output_file):
   cc-pass.py optimize -i input.ir -o output.ir --sccp --pre=lcm
   cc-pass.py analyze input.ir --format=json
   cc-pass.py config config.json --validate
+
+以 .mirb 结尾的输入/输出文件使用二进制MIR格式，加载时无需重新解析。
 """)
 def cli():
     """编译器优化通道工具集。"""
@@ -48,6 +137,31 @@ def cli():
 cli_optimize_pre_option: List[str] = ['lcm', 'dae', 'cse', '']
 cli_optimize_ssa_period: List[str] = ['always', 'never', 'postpone']
 cli_analysis_formats: List[str] = ['text']
+cli_time_passes_formats: List[str] = ['table', 'json']
+
+
+def parse_log_channels(ctx, param, value):
+    if not value:
+        return None
+    channels = [c.strip() for c in value.split(',') if c.strip()]
+    unknown = [c for c in channels if c not in CHANNELS]
+    if unknown:
+        raise click.BadParameter(f"未知的日志通道: {', '.join(unknown)}，可选: {', '.join(CHANNELS)}")
+    return channels
+
+
+def trace_options(command):
+    """
+    The logging options shared by the commands, see cof.trace.
+    """
+    command = click.option('--log-channels', callback=parse_log_channels, metavar='CHANNELS',
+                           help=f"只启用这些日志通道(逗号分隔)，可选: {', '.join(CHANNELS)}。")(command)
+    command = click.option('--trace-file', type=click.Path(dir_okay=False, writable=True, path_type=Path),
+                           metavar='FILE',
+                           help='将调试级别的跟踪事件以JSONL格式写入文件。')(command)
+    command = click.option('--verbose', '-v', count=True,
+                           help='显示详细处理信息，-v 显示处理进度，-vv 显示IR和分析过程。')(command)
+    return command
 
 @click.command(help="""
 对中间表示(IR)代码执行优化转换。
@@ -69,11 +183,27 @@ SSA周期控制:\n
   never      不转换为SSA形式\n
   postpone   延迟SSA转换到必要时\n
 
+SSA构造方式:\n
+\b
+  minimal      在定义的迭代支配边界处插入φ函数\n
+  semi-pruned  只为跨基本块使用的变量插入φ函数\n
+  pruned       只在变量活跃的基本块插入φ函数(需要活跃变量分析)\n
+
 示例:\n
 \b
   $ cc-pass.py optimize -i input.ir -o output.ir --sccp\n
   $ cc-pass.py optimize -i input.ir -o output.ir --sccp --pre=lcm\n
-  $ cc-pass.py optimize -i input.ir -o output.ir --sccp --pre=lcm --dry-run -v
+  $ cc-pass.py optimize -i input.ir -o output.ir --sccp --pre=lcm --dry-run -v\n
+  $ cc-pass.py optimize -i input.ir -o output.ir --sccp --pre=lcm --jobs 8\n
+  $ cc-pass.py optimize -i input.ir -o output.mirb --sccp\n
+  $ cc-pass.py optimize -i output.mirb -o final.ir --pre=lcm\n
+  $ cc-pass.py optimize -i input.ir -o output.ir --sccp --cache-dir .cc-pass-cache\n
+  $ cc-pass.py optimize -i input.ir -o output.ir --sccp --ssa-flavor pruned\n
+  $ cc-pass.py optimize -i input.ir -o output.ir --sccp --dominator-engine lengauer-tarjan\n
+  $ cc-pass.py optimize -i input.ir -o output.ir --sccp --pre=lcm --time-passes\n
+  $ cc-pass.py optimize -i input.ir -o output.ir --sccp --time-passes=json --time-passes-file times.json\n
+  $ cc-pass.py optimize -i input.ir -o output.ir --sccp -vv --log-channels ir,sccp\n
+  $ cc-pass.py optimize -i input.ir -o output.ir --sccp --trace-file trace.jsonl
 """)
 @click.option('--sccp', is_flag=True,
               help="启用稀疏条件常量传播优化。")
@@ -84,21 +214,45 @@ SSA周期控制:\n
               default='always', show_default=True,
               metavar='PERIOD',
               help='控制SSA形式的更新时机。')
+@click.option('--ssa-flavor', type=click.Choice(ssa_flavors),
+              default='minimal', show_default=True,
+              metavar='FLAVOR',
+              help=f"SSA构造方式，可选: {', '.join(ssa_flavors)}。")
+@click.option('--dominator-engine', type=click.Choice(list(dominator_engines)),
+              default='cooper-harvey-kennedy', show_default=True,
+              metavar='ENGINE',
+              help=f"计算支配关系的算法，可选: {', '.join(dominator_engines)}。")
 @click.option('--input-file', '-i',
               type=click.Path(exists=True, readable=True, path_type=Path),
               required=True,
               metavar='FILE',
-              help='输入的IR文件路径。')
+              help='输入的IR文件路径，.mirb 为二进制MIR文件。')
 @click.option('--output-file', '-o',
               type=click.Path(writable=True, path_type=Path),
               required=True,
               metavar='FILE',
-              help='输出的IR文件路径。')
-@click.option('--verbose', '-v', is_flag=True,
-              help='显示详细处理信息和优化进度。')
+              help='输出的IR文件路径，.mirb 为二进制MIR文件。')
+@click.option('--jobs', '-j', type=click.IntRange(min=1), default=1, show_default=True,
+              metavar='N',
+              help='并行优化函数的进程数。')
+@click.option('--cache-dir', type=click.Path(file_okay=False, writable=True, path_type=Path),
+              metavar='DIR',
+              help='函数优化结果的缓存目录，未改变的函数直接使用缓存结果。')
+@click.option('--cache-size', type=click.IntRange(min=1), default=DEFAULT_CACHE_SIZE // (1024 * 1024),
+              show_default=True, metavar='MB',
+              help='缓存目录的大小上限，超出时删除最久未使用的结果。')
+@click.option('--time-passes', type=click.Choice(cli_time_passes_formats), is_flag=False, flag_value='table',
+              metavar='FORMAT',
+              help='报告每个阶段的耗时、tracemalloc内存峰值和计数器，格式为 table(默认) 或 json。'
+                   '内存跟踪会使优化变慢。')
+@click.option('--time-passes-file', type=click.Path(dir_okay=False, writable=True, path_type=Path),
+              metavar='FILE',
+              help='将 --time-passes 报告写入文件，默认输出到标准错误。')
+@trace_options
 @click.option('--dry-run', is_flag=True,
               help='只显示将要执行的操作而不实际执行优化。')
-def optimize(sccp, pre, ssa_period, input_file, output_file, verbose, dry_run):
+def optimize(sccp, pre, ssa_period, ssa_flavor, dominator_engine, input_file, output_file, jobs, cache_dir, cache_size,
+             time_passes, time_passes_file, verbose, trace_file, log_channels, dry_run):
     """对中间表示(IR)代码执行优化。"""
     # 验证输入文件
     if not input_file.is_file():
@@ -120,9 +274,15 @@ def optimize(sccp, pre, ssa_period, input_file, output_file, verbose, dry_run):
         click.echo(f"  SCCP优化:        {'启用' if sccp else '禁用'}")
         click.echo(f"  PRE算法:        {pre if pre else '无'}")
         click.echo(f"  SSA更新时机:    {ssa_period}")
+        click.echo(f"  SSA构造方式:    {ssa_flavor}")
+        click.echo(f"  支配算法:       {dominator_engine}")
+        click.echo(f"  并行进程数:     {jobs}")
+        click.echo(f"  缓存目录:       {cache_dir if cache_dir else '无'}")
+        click.echo(f"  阶段计时:       {time_passes if time_passes else '否'}")
         click.echo(f"  输入文件:       {input_file}")
         click.echo(f"  输出文件:       {output_file}")
         click.echo(f"  详细模式:       {'是' if verbose else '否'}")
+        click.echo(f"  跟踪文件:       {trace_file if trace_file else '无'}")
         click.echo(f"  试运行模式:     {'是' if dry_run else '否'}")
         click.echo("=" * 50)
 
@@ -137,30 +297,62 @@ def optimize(sccp, pre, ssa_period, input_file, output_file, verbose, dry_run):
             click.echo(f"开始读取输入文件: {input_file}")
 
         pre = '' if pre not in cli_optimize_pre_option else pre
-
-        global_insts, func_list = parse_ir_file(str(input_file))
-        optimizer = CodeOptimizer(
-            global_insts,
-            func_list,
-            sccp_enable=sccp,
-            pre_algorithm=pre,
-            ssa_period=ssa_period,
-        )
-
-        if verbose:
-            click.echo("开始执行优化过程...")
-
-        optimizer.optimize()
-
-        if verbose:
-            click.echo(f"开始写入输出文件: {output_file}")
-
-        output_mir(global_insts, str(output_file))
+        cache = FunctionCache(str(cache_dir), cache_size * 1024 * 1024) if cache_dir else None
+
+        timer = PassTimer() if time_passes else None
+        with tracing(verbosity_level(verbose), log_channels, trace_file), \
+                (use_timer(timer) if timer else contextlib.nullcontext()):
+            if is_mirb_file(input_file):
+                with time_pass('load'):
+                    insts, func_list, context = load_mirb(str(input_file))
+                functions = iter(func_list)
+            else:
+                # functions are optimized while the file is still read, the
+                # text format is also written meanwhile and keeps nothing
+                parser = Parser(str(input_file))
+                insts, func_list, context = parser.insts, parser.func_list, parser.context
+                functions = parser.iter_functions(keep=is_mirb_file(output_file))
+
+            with use_context(context):
+                optimizer = CodeOptimizer(
+                    insts,
+                    func_list,
+                    sccp_enable=sccp,
+                    pre_algorithm=pre,
+                    ssa_period=ssa_period,
+                    jobs=jobs,
+                    cache=cache,
+                    ssa_flavor=ssa_flavor,
+                    dominator_engine=dominator_engine,
+                )
+
+                if verbose:
+                    click.echo("开始执行优化过程...")
+
+                if is_mirb_file(output_file):
+                    # the binary format is written once the whole module is optimized
+                    for _ in optimizer.optimize_stream(functions):
+                        pass
+                    output_mir(insts, str(output_file), func_list)
+                else:
+                    if verbose:
+                        click.echo(f"边优化边写入输出文件: {output_file}")
+                    output_mir_stream(insts, optimizer.optimize_stream(functions), str(output_file))
 
         # 显示完成信息
         click.echo("✓ 优化完成!")
+        if cache:
+            click.echo(f"✓ 缓存命中 {cache.hits} 个函数，未命中 {cache.misses} 个")
         click.echo(f"✓ 结果已保存到: {output_file}")
 
+        if timer:
+            report = timer.report_json() if time_passes == 'json' else timer.report_table()
+            if time_passes_file:
+                time_passes_file.write_text(report + "\n", encoding='utf-8')
+                click.echo(f"✓ 阶段计时报告已保存到: {time_passes_file}")
+            else:
+                click.echo(report, err=True)
+
     except Exception as e:
         raise click.ClickException(f"优化过程中出错: {str(e)}")
 
@@ -204,9 +396,8 @@ def optimize(sccp, pre, ssa_period, input_file, output_file, verbose, dry_run):
 @click.option('--report_format', '-f', type=click.Choice(cli_analysis_formats),
               default='text', show_default=True,
               help='分析报告的输出格式。')
-@click.option('--verbose', '-v', is_flag=True,
-              help='显示更详细的分析信息。')
-def analyze(input_file, output_file, ssa_form, report_format, verbose):
+@trace_options
+def analyze(input_file, output_file, ssa_form, report_format, verbose, trace_file, log_channels):
     """分析IR文件并显示统计信息。"""
     click.echo(f"分析文件: {input_file}")
     click.echo(f"输出格式: {format}")
@@ -232,18 +423,19 @@ def analyze(input_file, output_file, ssa_form, report_format, verbose):
         click.echo("正在生成分析报告...")
 
     if ssa_form:
-        global_insts, func_list = parse_ir_file(str(input_file))
-        optimizer = CodeOptimizer(
-            global_insts,
-            func_list,
-            sccp_enable=False,
-            pre_algorithm='',
-            ssa_period='always',
-            analysis_only=True,
-        )
-
-        optimizer.optimize()
-        output_mir(global_insts, str(output_file))
+        global_insts, func_list, context = read_mir_module(str(input_file))
+        with use_context(context), tracing(verbosity_level(verbose), log_channels, trace_file):
+            optimizer = CodeOptimizer(
+                global_insts,
+                func_list,
+                sccp_enable=False,
+                pre_algorithm='',
+                ssa_period='always',
+                analysis_only=True,
+            )
+
+            optimizer.optimize()
+            output_mir(global_insts, str(output_file), func_list)
 
     click.echo("分析完成!")
 
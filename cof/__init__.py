@@ -1,10 +1,78 @@
-from typing import List, Dict
+import contextlib
+import io
+import pickle
+import sys
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import List, Dict, Tuple, Iterable, Iterator, Deque, Optional
 
 from cof.analysis.sccp import sccp_analysis
-from cof.base.cfg import ControlFlowGraph
+from cof.base.cfg import ControlFlowGraph, ssa_flavors
+from cof.base.dominator import dominator_engines
+from cof.cache import FunctionCache, FunctionLayout, function_key, function_layout
+from cof.base.mir.context import MIRContext, current_context, use_context
 from cof.base.mir.function import MIRFunction
-from cof.base.mir.inst import MIRInsts
+from cof.base.mir.inst import MIRInsts, MIRInstId
 from cof.lc import LocalCodeOptimizer
+from cof.timing import PassRecord, PassTimer, current_timer, time_pass, use_timer
+from cof.trace import INFO, TraceSettings, channel, configure_worker, current_settings, write_events
+
+_log = channel('optimizer')
+
+
+def _optimize_function(
+        func_data: bytes,
+        last_id: MIRInstId,
+        sccp_enable: bool,
+        pre_algorithm: str,
+        ssa_period: str,
+        ssa_flavor: str = 'minimal',
+        time_passes: bool = False,
+        trace_settings: Optional[TraceSettings] = None,
+        dominator_engine: str = 'cooper-harvey-kennedy',
+) -> Tuple[bytes, str, Optional[Dict[str, PassRecord]], Optional[List[dict]]]:
+    """
+    Optimize a single function in a worker process.
+
+    The worker optimizes in a context of its own, which continues numbering
+    from the parent's last id, so new instructions never reuse an id of the
+    input. Its registry only has to resolve the branch targets of this
+    function.
+
+    Functions and results are passed pickled, instructions are rows of the
+    context they are unpickled in and have to be loaded while it is active.
+
+    :param time_passes: record the stages like the parent's PassTimer does.
+    :param trace_settings: logging configuration of the parent.
+    :return: the pickled optimized instructions, everything the optimizer
+    printed, the timing records if time_passes and the trace events if the
+    parent writes a trace file.
+    """
+    events = configure_worker(trace_settings) if trace_settings else None
+    context = MIRContext(last_id)
+    with use_context(context):
+        func: MIRFunction = pickle.loads(func_data)
+    for inst in func.insts.ret_insts():
+        context.register(inst)
+
+    log = io.StringIO()
+    timer = PassTimer() if time_passes else None
+    with use_context(context), contextlib.redirect_stdout(log), \
+            (use_timer(timer) if timer else contextlib.nullcontext()):
+        with time_pass('cfg'):
+            cfg = ControlFlowGraph(func.insts)
+        lco = LocalCodeOptimizer(
+            cfg,
+            sccp_enable=sccp_enable,
+            pre_algorithm=pre_algorithm,
+            ssa_period=ssa_period,
+            ssa_flavor=ssa_flavor,
+            dominator_engine=dominator_engine,
+        )
+        lco.initialize()
+        lco.optimize()
+
+    return pickle.dumps(func.insts), log.getvalue(), timer.records if timer else None, events
 
 
 class CodeOptimizer:
@@ -20,6 +88,10 @@ class CodeOptimizer:
             pre_algorithm: str,
             ssa_period: str,
             analysis_only: bool = False,
+            jobs: int = 1,
+            cache: Optional[FunctionCache] = None,
+            ssa_flavor: str = 'minimal',
+            dominator_engine: str = 'cooper-harvey-kennedy',
     ):
         self.insts = insts
         self.func_list: List[MIRFunction] = func_list
@@ -27,8 +99,12 @@ class CodeOptimizer:
 
         self.pre_algorithm : str = pre_algorithm
         self.ssa_period : str = ssa_period
+        self.ssa_flavor : str = ssa_flavor
+        self.dominator_engine : str = dominator_engine
         self.sccp_enable : bool = sccp_enable
         self.analysis_only : bool = analysis_only
+        self.jobs : int = jobs
+        self.cache : Optional[FunctionCache] = cache
 
         self._check_params()
 
@@ -37,24 +113,212 @@ class CodeOptimizer:
             self.pre_algorithm = ''
         if self.ssa_period not in CodeOptimizer.ssa_period_type:
             self.ssa_period = 'postpone'
+        if self.ssa_flavor not in ssa_flavors:
+            self.ssa_flavor = 'minimal'
+        if self.dominator_engine not in dominator_engines:
+            raise ValueError(f"unknown dominator engine '{self.dominator_engine}', "
+                             f"expected one of {', '.join(dominator_engines)}")
+        if self.jobs < 1:
+            self.jobs = 1
 
 
     def optimize(self):
-        self.process_local_functions()
+        if self.jobs > 1 and len(self.func_list) > 1:
+            self.process_local_functions_parallel()
+        else:
+            self.process_local_functions()
+
+    def optimize_stream(self, functions: Iterable[MIRFunction]) -> Iterator[MIRFunction]:
+        """
+        Optimize functions while they are still being produced, e.g. by
+        Parser.iter_functions(), and yield every one of them when it is done,
+        in input order.
+
+        Nothing is kept after a function is yielded (func_cfg is not filled)
+        and at most 2 * jobs functions are in flight in parallel mode, so
+        memory does not depend on the number of functions. Addresses are not
+        assigned.
+        """
+        if self.jobs > 1:
+            yield from self._optimize_stream_parallel(functions)
+            return
+
+        for func in functions:
+            if _log.info_on:
+                _log.emit(INFO, f"Processing {func.func_name}", event='function', function=func.func_name)
+            self._optimize_local_function(func)
+            yield func
+
+    # ++++++++ cache ++++++++
+    def _cache_key(self, func: MIRFunction) -> Optional[str]:
+        if self.cache is None:
+            return None
+        # immediate dominators are unique, the dominator engine does not change the result
+        config = (self.sccp_enable, self.pre_algorithm, self.ssa_period, self.ssa_flavor, self.analysis_only)
+        return function_key(func, config)
+
+    def _load_cached(self, func: MIRFunction, key: Optional[str]) -> bool:
+        """
+        Replace the body of func by its cached optimized body.
+        :return: False on a miss
+        """
+        if key is None:
+            return False
+        last_id = current_context().last_id
+        insts = self.cache.load(key, func, last_id)
+        if insts is None:
+            return False
+        self._merge_function(func, insts, last_id)
+        return True
+
+    def _store_cached(self, func: MIRFunction, key: Optional[str], layout: FunctionLayout):
+        if key is not None:
+            self.cache.store(key, func.insts, layout)
+
+    def _optimize_local_function(self, func: MIRFunction) -> Optional[ControlFlowGraph]:
+        """
+        :return: the control flow graph, None if the optimized function was
+        taken from the cache.
+        """
+        key = self._cache_key(func)
+        if self._load_cached(func, key):
+            return None
+        layout = function_layout(func)
+
+        with time_pass('cfg'):
+            cfg = ControlFlowGraph(func.insts)
+        lco = LocalCodeOptimizer(
+            cfg,
+            sccp_enable=self.sccp_enable,
+            pre_algorithm=self.pre_algorithm,
+            ssa_period=self.ssa_period,
+            ssa_flavor=self.ssa_flavor,
+            dominator_engine=self.dominator_engine,
+        )
+        lco.initialize()
+        lco.optimize()
+
+        self._store_cached(func, key, layout)
+        return cfg
 
     def process_local_functions(self):
 
         for func in self.func_list:
-            print(f"Processing {func.func_name}")
-            cfg = ControlFlowGraph(func.insts)
-            self.func_cfg[func] = cfg
-            lco = LocalCodeOptimizer(
-                cfg,
-                sccp_enable=self.sccp_enable,
-                pre_algorithm=self.pre_algorithm,
-                ssa_period=self.ssa_period
-            )
-            lco.initialize()
-            lco.optimize()
-            self.insts.assign_addr()
+            if _log.info_on:
+                _log.emit(INFO, f"Processing {func.func_name}", event='function', function=func.func_name)
+            cfg = self._optimize_local_function(func)
+            if cfg is not None:
+                self.func_cfg[func] = cfg
+
+        self.insts.assign_addr()
+
+    def process_local_functions_parallel(self):
+        """
+        Optimize the functions in a process pool of self.jobs workers.
+
+        Results are merged in the order of func_list, which gives the same
+        instruction ids and output as process_local_functions(). The control
+        flow graphs stay in the workers, so func_cfg is not filled.
+        """
+        for _ in self._optimize_stream_parallel(self.func_list):
+            pass
+
+        self.insts.assign_addr()
+
+    def _optimize_stream_parallel(self, functions: Iterable[MIRFunction]) -> Iterator[MIRFunction]:
+        """
+        Every function is sent to the pool together with the last id of the
+        context at that time, its worker numbers new instructions from there.
+        Cached functions are not sent, they are taken from the cache in turn.
+        """
+        context = current_context()
+        pending: Deque[Tuple[MIRFunction, MIRInstId, Optional[Future], Optional[str]]] = deque()
+
+        with ProcessPoolExecutor(max_workers=self.jobs) as pool:
+            for func in functions:
+                last_id = context.last_id
+                key = self._cache_key(func)
+                if key is not None and self.cache.contains(key):
+                    future = None
+                else:
+                    future = pool.submit(
+                        _optimize_function,
+                        pickle.dumps(func),
+                        last_id,
+                        self.sccp_enable,
+                        self.pre_algorithm,
+                        self.ssa_period,
+                        self.ssa_flavor,
+                        current_timer() is not None,
+                        current_settings(),
+                        self.dominator_engine,
+                    )
+                pending.append((func, last_id, future, key))
+
+                # keep the workers busy without reading ahead too far
+                if len(pending) > 2 * self.jobs:
+                    yield self._finish_function(*pending.popleft())
+
+            while pending:
+                yield self._finish_function(*pending.popleft())
+
+    def _finish_function(
+            self,
+            func: MIRFunction,
+            last_id: MIRInstId,
+            future: Optional[Future],
+            key: Optional[str]
+    ) -> MIRFunction:
+        if future is None:
+            if _log.info_on:
+                _log.emit(INFO, f"Processing {func.func_name}", event='function', function=func.func_name)
+            # the entry may have been evicted by another run since
+            if not self._load_cached(func, key):
+                self._optimize_local_function(func)
+            return func
+
+        layout = function_layout(func)
+        insts_data, log, records, events = future.result()
+        if _log.info_on:
+            _log.emit(INFO, f"Processing {func.func_name}", event='function', function=func.func_name)
+        sys.stdout.write(log)
+        if events:
+            write_events(events)
+        timer = current_timer()
+        if timer is not None and records:
+            timer.merge(records)
+        self._merge_function(func, pickle.loads(insts_data), last_id)
+        self._store_cached(func, key, layout)
+        return func
+
+    def _merge_function(self, func: MIRFunction, insts: MIRInsts, last_id: MIRInstId):
+        """
+        Replace the instructions of func by the optimized ones of a worker
+        or of the cache.
+
+        Every worker numbers its new instructions from last_id + 1, these
+        are renumbered in creation order from the current context, and its
+        registry is updated to the unpickled instruction objects. The
+        replaced instructions are released.
+        """
+        context = current_context()
+        new_insts = sorted(
+            (inst for inst in insts.ret_insts() if inst.unique_id > last_id),
+            key=lambda inst: inst.unique_id
+        )
+        id_map: Dict[MIRInstId, MIRInstId] = { }
+        for inst in new_insts:
+            id_map[inst.unique_id] = context.new_id()
+            inst.unique_id = id_map[inst.unique_id]
+
+        for inst in insts.ret_insts():
+            if (inst.is_if() or inst.is_goto()) and inst.result.value in id_map:
+                inst.result.value = id_map[inst.result.value]
+
+        insts.reindex()
+
+        context.release(func.insts.ret_insts())
+        for inst in insts.ret_insts():
+            context.register(inst)
 
+        func.insts = insts
@@ -4,6 +4,7 @@ from tabulate import tabulate
 
 from cof.analysis.dataflow.anticipated_exprs import AnticipatedExprSemilattice, AnticipatedTransfer, \
     anticipated_exprs_on_state_change
+from cof.analysis.dataflow.bitvector import UniverseIndex, BitVectorSemilattice
 from cof.analysis.dataflow.framework import DataFlowAnalysisFramework
 from cof.analysis.dataflow.live_vars import LiveVarsLattice, LiveVarsTransfer, live_vars_on_state_change
 from cof.analysis.dataflow.reaching_defs import DefPoint, ReachingDefsProductSemilattice, ReachingDefsTransfer, \
@@ -12,6 +13,21 @@ from cof.base.bb import BasicBlock
 from cof.base.cfg import ControlFlowGraphForDataFlowAnalysis
 from cof.base.mir.expr import Expression
 from cof.base.mir.variable import Variable
+from cof.trace import DEBUG, channel
+
+_log = channel('dataflow')
+
+_RESULT_BANNER = "\n\n++++++++++++++++++++++++++++++ Analysis Result ++++++++++++++++++++++++++++++"
+
+
+def _emit_block_sets(result: Dict[BasicBlock, set]):
+    info = ""
+    for b, t in result.items():
+        info += f"Block {b.id}: {{ {", ".join(map(str, t))} }}\n"
+    _log.emit(
+        DEBUG, f"{_RESULT_BANNER}\n{info}", event='result',
+        result={b.id: list(map(str, t)) for b, t in result.items()},
+    )
 
 
 class DataFlowAnalyzer:
@@ -31,11 +47,13 @@ class DataFlowAnalyzer:
             direction='forward',
             init_value=lattice.top(),
             safe_value=lattice.top(),
-            on_state_change=reaching_defs_on_state_change
+            on_state_change=reaching_defs_on_state_change if _log.debug_on else None
         )
 
         analysis.analyze(strategy='worklist')
-        print("\n\n++++++++++++++++++++++++++++++ Analysis Result ++++++++++++++++++++++++++++++")
+        if not _log.debug_on:
+            return
+
         headers = [""]
         table_data = [ ]
         for lat in lattice.lattices:
@@ -47,12 +65,19 @@ class DataFlowAnalyzer:
                 row.append(f"{{ {", ".join(map(str, d))} }}")
             table_data.append(row)
 
-        print(tabulate(table_data, headers=headers, tablefmt="grid"), end="\n\n")
+        _log.emit(
+            DEBUG, f"{_RESULT_BANNER}\n{tabulate(table_data, headers=headers, tablefmt="grid")}\n",
+            event='result', result={b.id: [list(map(str, d)) for d in t] for b, t in analysis.result.items()},
+        )
 
 
 
 
-    def live_vars(self) -> Dict[BasicBlock, Set[Variable]]:
+    def live_vars(self, verbose: bool = True) -> Dict[BasicBlock, Set[Variable]]:
+        """
+        :param verbose: log the live-in sets of the blocks.
+        :return: the live-in set of every block.
+        """
         use_dict, def_dict = self.cfg.collect_use_def()
         all_vars: set[Variable] = set()
         for use_var in use_dict.values():
@@ -60,8 +85,10 @@ class DataFlowAnalyzer:
         for def_var in def_dict.values():
             all_vars.update(def_var)
 
-        lattice = LiveVarsLattice(all_vars)
-        transfer = LiveVarsTransfer(use_dict, def_dict)
+        blocks = self.cfg.all_blocks()
+        universe: UniverseIndex[Variable] = UniverseIndex(all_vars)
+        lattice = BitVectorSemilattice(LiveVarsLattice(all_vars), universe)
+        transfer = LiveVarsTransfer(universe.encode_map(use_dict, blocks), universe.encode_map(def_dict, blocks))
         analysis = DataFlowAnalysisFramework(
             cfg=self.cfg,
             lattice=lattice,
@@ -69,19 +96,16 @@ class DataFlowAnalyzer:
             direction='backward',
             init_value=lattice.top(),
             safe_value=lattice.bottom(),
-            on_state_change=live_vars_on_state_change
+            on_state_change=(lambda b, lat, before, after: live_vars_on_state_change(
+                b, lat, universe.decode(before), universe.decode(after))) if verbose and _log.debug_on else None
         )
 
         analysis.analyze(strategy='worklist')
-        print("\n\n++++++++++++++++++++++++++++++ Analysis Result ++++++++++++++++++++++++++++++")
+        result: Dict[BasicBlock, Set[Variable]] = universe.decode_map(analysis.result)
+        if verbose and _log.debug_on:
+            _emit_block_sets(result)
 
-        info = ""
-        for b, t in analysis.result.items():
-            info += f"Block {b.id}: {{ {", ".join(map(str, t))} }}\n"
-
-        print(info)
-
-        return analysis.result
+        return result
 
 
     def anticipated_exprs(self) -> Dict[BasicBlock, set[Expression]]:
@@ -95,14 +119,10 @@ class DataFlowAnalyzer:
             direction='backward',
             init_value=lattice.bottom(),
             safe_value=lattice.top(),
-            on_state_change=anticipated_exprs_on_state_change,
+            on_state_change=anticipated_exprs_on_state_change if _log.debug_on else None,
         )
         analysis.analyze(strategy='worklist')
-        print("\n\n++++++++++++++++++++++++++++++ Analysis Result ++++++++++++++++++++++++++++++")
-        info = ""
-        for b, t in analysis.result.items():
-            info += f"Block {b.id}: {{ {", ".join(map(str, t))} }}\n"
-
-        print(info)
+        if _log.debug_on:
+            _emit_block_sets(analysis.result)
 
         return analysis.result
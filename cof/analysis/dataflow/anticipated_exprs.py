@@ -12,6 +12,9 @@ from cof.analysis.dataflow.framework import TransferCluster
 from cof.base.bb import BasicBlock
 from cof.base.mir.expr import Expression, ret_expr_from_mir_inst
 from cof.base.semilattice import Semilattice
+from cof.trace import DEBUG, channel
+
+_log = channel('dataflow')
 
 
 class AnticipatedExprSemilattice(Semilattice[Set[Expression]]):
@@ -28,6 +31,9 @@ class AnticipatedExprSemilattice(Semilattice[Set[Expression]]):
     def top(self) -> Set[Expression]:
         return set()
 
+    def height(self) -> int:
+        return len(self.all_exprs)
+
 
 
 class AnticipatedTransfer(TransferCluster[BasicBlock, Set[Expression]]):
@@ -84,4 +90,8 @@ class AnticipatedTransfer(TransferCluster[BasicBlock, Set[Expression]]):
 
 
 def anticipated_exprs_on_state_change(block: BasicBlock, lattice, before: set[Expression], after: set[Expression]):
-    print(f"Block {block.id}: {{ {", ".join(map(str, before))} }}  --->  {{ {", ".join(map(str, after))} }}")
\ No newline at end of file
+    if _log.debug_on:
+        _log.emit(
+            DEBUG, f"Block {block.id}: {{ {", ".join(map(str, before))} }}  --->  {{ {", ".join(map(str, after))} }}",
+            event='state_change', block=block.id, before=list(map(str, before)), after=list(map(str, after)),
+        )
\ No newline at end of file
@@ -19,3 +19,6 @@ class AvailableExprSemilattice(Semilattice[set[Expression]]):
     def partial_order(self, a: set[Expression], b: set[Expression]) -> bool:
         return b.issubset(a)
 
+    def height(self) -> int:
+        return len(self.all_exprs)
+
@@ -0,0 +1,149 @@
+"""
+    Bit-vector backend for set based data-flow problems.
+
+    A UniverseIndex assigns every element of the universe (expressions,
+    variables, ...) a bit position, so a set of facts becomes a single
+    Python int. Python ints are arbitrary precision and their &, | and ~
+    operators run word by word in C, which makes meet and transfer far
+    cheaper than allocating and re-hashing sets.
+
+    BitVector overloads & (meet), | (join) and - (and-not) with the same
+    meaning as the set operators, so existing lattices and transfer clusters
+    written against set[T] work unchanged once their gen/kill maps are
+    encoded with UniverseIndex.encode_map().
+"""
+from typing import Dict, Generic, Iterable, List, TypeVar
+
+from cof.base.semilattice import Semilattice
+
+E = TypeVar('E')
+B = TypeVar('B')
+
+
+class BitVector(int):
+    """
+    An immutable set of facts encoded as bits.
+
+    Only the empty set can be mixed with a BitVector, this covers the
+    `dict.get(block, set())` defaults used by the transfer clusters.
+    """
+    __slots__ = ()
+
+    def __and__(self, other) -> 'BitVector':
+        if isinstance(other, int):
+            return BitVector(int.__and__(self, other))
+        if isinstance(other, (set, frozenset)) and not other:
+            return EMPTY_BIT_VECTOR
+        return NotImplemented
+
+    def __or__(self, other) -> 'BitVector':
+        if isinstance(other, int):
+            return BitVector(int.__or__(self, other))
+        if isinstance(other, (set, frozenset)) and not other:
+            return self
+        return NotImplemented
+
+    def __sub__(self, other) -> 'BitVector':
+        """and-not"""
+        if isinstance(other, int):
+            return BitVector(int.__and__(self, ~other))
+        if isinstance(other, (set, frozenset)) and not other:
+            return self
+        return NotImplemented
+
+    def __rsub__(self, other) -> 'BitVector':
+        if isinstance(other, (set, frozenset)) and not other:
+            return EMPTY_BIT_VECTOR
+        return NotImplemented
+
+    __rand__ = __and__
+    __ror__ = __or__
+
+    def __len__(self) -> int:
+        return self.bit_count()
+
+    def __repr__(self):
+        return f"BitVector({bin(self)})"
+
+
+EMPTY_BIT_VECTOR = BitVector(0)
+
+
+class UniverseIndex(Generic[E]):
+    """
+    Map every element of a universe to a bit position.
+    """
+    def __init__(self, universe: Iterable[E]):
+        self.elements: List[E] = []
+        self.bit_by_element: Dict[E, int] = { }
+
+        for element in universe:
+            if element not in self.bit_by_element:
+                self.bit_by_element[element] = len(self.elements)
+                self.elements.append(element)
+
+        self.full: BitVector = BitVector((1 << len(self.elements)) - 1)
+
+    def __len__(self):
+        return len(self.elements)
+
+    def encode(self, s: Iterable[E]) -> BitVector:
+        bits = 0
+        bit_by_element = self.bit_by_element
+        for element in s:
+            bits |= 1 << bit_by_element[element]
+        return BitVector(bits)
+
+    def decode(self, bits: int) -> set[E]:
+        return set(self.elements_of(bits))
+
+    def elements_of(self, bits: int) -> List[E]:
+        """
+        Return the elements of bits in bit order.
+        """
+        l: List[E] = []
+        elements = self.elements
+        while bits:
+            low = bits & -bits
+            l.append(elements[low.bit_length() - 1])
+            bits ^= low
+        return l
+
+    def encode_map(self, sets: Dict[B, Iterable[E]], keys: Iterable[B]) -> Dict[B, BitVector]:
+        """
+        Encode a per-block set map, every key in keys gets an entry.
+        """
+        return {k: self.encode(sets.get(k, ())) for k in keys}
+
+    def decode_map(self, bit_map: Dict[B, int]) -> Dict[B, set[E]]:
+        return {k: self.decode(v) for k, v in bit_map.items()}
+
+
+class BitVectorSemilattice(Semilattice[BitVector]):
+    """
+    Run a powerset semilattice over BitVectors.
+
+    top and bottom are encoded once. meet is delegated to the wrapped
+    lattice, its & / | on sets map onto the BitVector operators directly.
+    """
+    def __init__(self, lattice: Semilattice[set[E]], universe: UniverseIndex[E]):
+        self.lattice: Semilattice[set[E]] = lattice
+        self.universe: UniverseIndex[E] = universe
+
+        self._top: BitVector = universe.encode(lattice.top())
+        self._bottom: BitVector = universe.encode(lattice.bottom())
+
+    def top(self) -> BitVector:
+        return self._top
+
+    def bottom(self) -> BitVector:
+        return self._bottom
+
+    def meet(self, a: BitVector, b: BitVector) -> BitVector:
+        return self.lattice.meet(a, b)
+
+    def partial_order(self, a: BitVector, b: BitVector) -> bool:
+        return self.meet(a, b) == a
+
+    def height(self) -> int:
+        return len(self.universe)
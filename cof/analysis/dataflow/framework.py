@@ -1,13 +1,30 @@
+import heapq
 from abc import ABC, abstractmethod
-from copy import deepcopy
-from typing import Generic, TypeVar, Dict, Optional, Callable, Iterable
+from typing import Generic, TypeVar, Dict, Optional, Callable, Iterable, List, Tuple
 
 from cof.base.cfg import ControlFlowGraphForDataFlowAnalysis
 from cof.base.semilattice import Semilattice
+from cof.timing import count
 
 T = TypeVar("T")
 B = TypeVar("B")
 
+# iteration strategies of DataFlowAnalysisFramework.analyze()
+strategies: List[str] = ['worklist', 'round-robin']
+
+def freeze(value: T) -> T:
+    """
+    Return an immutable equivalent of a lattice value, so that it can be
+    shared by all blocks instead of being copied per block. sets become
+    frozensets (recursively inside tuples), other values are returned as is.
+    """
+    if isinstance(value, set):
+        return frozenset(value)
+    if isinstance(value, tuple):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
 class TransferCluster(ABC, Generic[B, T]):
     """Transfer Function"""
 
@@ -71,26 +88,36 @@ class DataFlowAnalysisFramework(Generic[B, T]):
 
         self.result: Dict[B, T] = { }
 
+        # Number of worklist pops (or round-robin passes) and transfer applications.
+        self.iteration_count: int = 0
+        self.transfer_count: int = 0
+
         self._initialize_states(init_value, safe_value)
 
     def _initialize_states(self, init_value: T, safe_value: T):
         """Initialize analysis states for all blocks.
 
+        Lattice values are never modified in place, neither by meet nor by
+        the transfer functions, so every block shares one frozen safe value
+        and a new value is only allocated when a transfer changes it.
+
         Args:
             init_value: Value for the entry/exit block
             safe_value: Value for other blocks
         """
+        safe_value = freeze(safe_value)
+
         # Initialize all blocks with safe value
-        for block in self.working_cfg.all_blocks():
-            self.in_states[block] = deepcopy(safe_value)
-            self.out_states[block] = deepcopy(safe_value)
+        blocks = self.working_cfg.all_blocks()
+        self.in_states = dict.fromkeys(blocks, safe_value)
+        self.out_states = dict.fromkeys(blocks, safe_value)
 
         # Set initial value for the starting block
         entry_block = self.working_cfg.entry_block()
         if self.direction == 'forward':
-            self.out_states[entry_block] = deepcopy(init_value)
+            self.out_states[entry_block] = freeze(init_value)
         else:
-            self.in_states[entry_block] = deepcopy(init_value)
+            self.in_states[entry_block] = freeze(init_value)
 
     def analyze(self, strategy='worklist') -> Dict[B, T]:
         """
@@ -100,86 +127,193 @@ class DataFlowAnalysisFramework(Generic[B, T]):
         """
 
         if strategy == 'worklist':
-            return self._analyze_worklist()
+            result = self._analyze_worklist()
+        elif strategy == 'round-robin':
+            result = self._analyze_round_robin()
+        else:
+            raise ValueError(f"unknown strategy '{strategy}', expected one of {', '.join(strategies)}")
+
+        count('dataflow iterations', self.iteration_count)
+        count('transfer applications', self.transfer_count)
+        return result
+
+    def _block_order(self) -> List[B]:
+        """
+        Reverse postorder of the working cfg, i.e. reverse postorder for
+        forward analyses and reverse postorder of the reversed cfg for
+        backward ones. Blocks unreachable from the working entry follow
+        in their original order.
+        """
+        entry_block = self.working_cfg.entry_block()
+        post_order: List[B] = []
+        visited = {entry_block}
+        stack = [(entry_block, iter(self.working_cfg.successors(entry_block.id)))]
+
+        while stack:
+            block, succ_iter = stack[-1]
+            for succ in succ_iter:
+                if succ not in visited:
+                    visited.add(succ)
+                    stack.append((succ, iter(self.working_cfg.successors(succ.id))))
+                    break
+            else:
+                stack.pop()
+                post_order.append(block)
+
+        post_order.reverse()
+        post_order.extend(b for b in self.working_cfg.all_blocks() if b not in visited)
+        return post_order
+
+    def _iteration_limit(self, blocks: List[B]) -> Optional[int]:
+        """
+        Every output state of a monotone framework changes at most
+        lattice.height() times, and each change re-queues the affected
+        blocks once. Hence, the number of visits is bounded by
+        |blocks| + height * |edges|. None if the lattice height is unknown.
+        """
+        height = self.lattice.height()
+        if height is None:
+            return None
+        num_edges = sum(len(self.working_cfg.successors(b.id)) for b in blocks)
+        return len(blocks) + height * num_edges
+
+    def _pass_limit(self, blocks: List[B]) -> Optional[int]:
+        """
+        A pass of round-robin iteration that is not the last changes at
+        least one output state, which changes at most lattice.height()
+        times. Hence, the number of passes is bounded by
+        height * |blocks| + 1. None if the lattice height is unknown.
+        """
+        height = self.lattice.height()
+        if height is None:
+            return None
+        return height * len(blocks) + 1
+
+    def _configure_states(self) -> Tuple[Dict[B, T], Dict[B, T]]:
+        if self.direction == 'forward':
+            # Forward analysis: propagate from predecessors to successors
+            return self.in_states, self.out_states
+        else:
+            # Backward analysis: propagate from successors to predecessors
+            return self.out_states, self.in_states
+
+    def _visit(self, block: B, neighbors: List[B], input_states: Dict[B, T], output_states: Dict[B, T]) -> bool:
+        """
+        Recompute the input and output state of the block.
+        :return: True if the output state changed.
+        """
+        self.transfer_count += 1
+
+        # Only process if there are neighbors (avoid empty list)
+        if neighbors:
+            # Compute new input value by merging neighbor outputs
+            new_input_value = output_states[neighbors[0]]
+            for neighbor in neighbors[1:]:
+                new_input_value = self.lattice.meet(new_input_value, output_states[neighbor])
+
+            # Update input state if changed
+            if new_input_value != input_states[block]:
+                input_states[block] = new_input_value
         else:
-            return { }
+            # No neighbors, keep existing input state
+            new_input_value = input_states[block]
+
+        # Apply transfer function to get new output value
+        new_output_value = self.transfer.apply(block, new_input_value)
+
+        # Check if output state changed
+        if new_output_value != output_states[block]:
+            # Notify state change callback if provided
+            if self.on_state_change:
+                self.on_state_change(block, self.lattice, output_states[block], new_output_value)
+
+            # Update output state
+            output_states[block] = new_output_value
+            return True
+
+        return False
 
     def _analyze_worklist(self) -> Dict[B, T]:
         """Perform worklist algorithm for data flow analysis.
 
+        Blocks are popped in reverse postorder of the working cfg, so a
+        block is normally visited after all of its (non back edge)
+        neighbors. A block is queued at most once at a time.
+
         Returns:
             Dictionary of final states for all blocks
         """
 
-        # Initialize worklist with all blocks except the entry block.
-        worklist = set(self.working_cfg.all_blocks())
         entry_block = self.working_cfg.entry_block()
-        worklist.discard(entry_block)
+        blocks: List[B] = self._block_order()
+        priority: Dict[B, int] = {b: i for i, b in enumerate(blocks)}
 
-        # Track iterations to prevent infinite loops
-        max_iterations = len(worklist) * 10         # Heuristic for convergence limit
-        iteration_count = 0
+        # For forward analysis: predecessors/successors; backward: successors/predecessors
+        neighbors: Dict[B, List[B]] = {b: self.working_cfg.predecessors(b.id) for b in blocks}
+        affected: Dict[B, List[B]] = {b: self.working_cfg.successors(b.id) for b in blocks}
 
-        neighbor_getter = self.working_cfg.predecessors
-        affected_block_getter = self.working_cfg.successors
+        input_states, output_states = self._configure_states()
+        max_iterations = self._iteration_limit(blocks)
 
-        # Configure analysis direction
-        if self.direction == 'forward':
-            # Forward analysis: propagate from predecessors to successors
-            input_states: Dict[B, T] = self.in_states
-            output_states: Dict[B, T] = self.out_states
-        else:
-            # Backward analysis: propagate from successors to predecessors
-            output_states: Dict[B, T] = self.in_states
-            input_states: Dict[B, T] = self.out_states
-            # neighbor_getter = self.working_cfg.successors
-            # affected_block_getter = self.working_cfg.predecessors
-
-        # Process worklist until convergence or iteration limit
-        while worklist and iteration_count < max_iterations:
-
-            iteration_count += 1
-            block = worklist.pop()
-
-            # Get neighbors based on analysis direction
-            neighbors = neighbor_getter(block.id)
-
-            # Only process if there are neighbors (avoid empty list)
-            if neighbors:
-                # Collect neighbor output values
-                neighbor_values = [output_states[b] for b in neighbors]
-                # Compute new input value by merging neighbor outputs
-                new_input_value = neighbor_values[0]
-                for neighbor in neighbor_values[1:]:
-                    new_input_value = self.lattice.meet(new_input_value, neighbor)
-
-                # Update input state if changed
-                if new_input_value != input_states[block]:
-                    input_states[block] = new_input_value
-            else:
-                # No neighbors, keep existing input state
-                new_input_value = input_states[block]
+        # Initialize worklist with all blocks except the entry block.
+        worklist: List[int] = [priority[b] for b in blocks if b != entry_block]
+        heapq.heapify(worklist)
+        on_worklist: List[bool] = [b != entry_block for b in blocks]
 
-            # Apply transfer function to get new output value
-            new_output_value = self.transfer.apply(block, new_input_value)
+        # Process worklist until convergence
+        while worklist:
 
-            # Check if output state changed
-            if new_output_value != output_states[block]:
-                # Notify state change callback if provided
-                if self.on_state_change:
-                    self.on_state_change(block, self.lattice, output_states[block], new_output_value)
+            self.iteration_count += 1
+            if max_iterations is not None and self.iteration_count > max_iterations:
+                raise RuntimeError(
+                    f"Analysis did not converge in {max_iterations} iterations, "
+                    f"the transfer function is not monotone")
 
-                # Update output state
-                output_states[block] = new_output_value
+            index = heapq.heappop(worklist)
+            on_worklist[index] = False
+            block = blocks[index]
 
+            if self._visit(block, neighbors[block], input_states, output_states):
                 # Add affected neighbors to worklist
-                # For forward analysis: successors; backward: predecessors
-                affected_blocks = affected_block_getter(block.id)
-                worklist.update(affected_blocks)
+                for affected_block in affected[block]:
+                    affected_index = priority[affected_block]
+                    if not on_worklist[affected_index] and affected_block != entry_block:
+                        on_worklist[affected_index] = True
+                        heapq.heappush(worklist, affected_index)
+
+        self.result = output_states
+        return self.result
+
+    def _analyze_round_robin(self) -> Dict[B, T]:
+        """Perform round-robin iteration for data flow analysis.
+
+        All blocks except the entry block are visited in reverse postorder
+        of the working cfg until a full pass changes nothing.
+
+        Returns:
+            Dictionary of final states for all blocks
+        """
+
+        entry_block = self.working_cfg.entry_block()
+        blocks: List[B] = [b for b in self._block_order() if b != entry_block]
+        neighbors: Dict[B, List[B]] = {b: self.working_cfg.predecessors(b.id) for b in blocks}
+
+        input_states, output_states = self._configure_states()
+        max_passes = self._pass_limit(blocks)
+
+        change = True
+        while change:
+            change = False
+
+            self.iteration_count += 1
+            if max_passes is not None and self.iteration_count > max_passes:
+                raise RuntimeError(
+                    f"Analysis did not converge in {max_passes} passes, "
+                    f"the transfer function is not monotone")
 
-        # Warn if analysis didn't converge
-        if iteration_count >= max_iterations:
-            print(f"Warning: Analysis did not converge in {max_iterations} iterations")
+            for block in blocks:
+                if self._visit(block, neighbors[block], input_states, output_states):
+                    change = True
 
         self.result = output_states
         return self.result
@@ -4,6 +4,9 @@ from cof.analysis.dataflow.framework import TransferCluster
 from cof.base.bb import BasicBlock
 from cof.base.mir.variable import Variable
 from cof.base.semilattice import Semilattice, T
+from cof.trace import DEBUG, channel
+
+_log = channel('dataflow')
 
 
 class LiveVarsLattice(Semilattice[set[Variable]]):
@@ -22,6 +25,9 @@ class LiveVarsLattice(Semilattice[set[Variable]]):
     def partial_order(self, a: set[Variable], b: set[Variable]) -> bool:
         return b.issubset(a)
 
+    def height(self) -> int:
+        return len(self.all_vars)
+
 class LiveVarsTransfer(TransferCluster):
     def __init__(self, use_dict: Dict[BasicBlock, set[Variable]], def_dict: Dict[BasicBlock, set[Variable]]):
         self.use_dict: Dict[BasicBlock, set[Variable]] = use_dict
@@ -32,4 +38,8 @@ class LiveVarsTransfer(TransferCluster):
 
 
 def live_vars_on_state_change(block: BasicBlock, lattice, before: set[Variable], after: set[Variable]):
-    print(f"Block {block.id}: {{ {", ".join(map(str, before))} }}  --->  {{ {", ".join(map(str, after))} }}")
+    if _log.debug_on:
+        _log.emit(
+            DEBUG, f"Block {block.id}: {{ {", ".join(map(str, before))} }}  --->  {{ {", ".join(map(str, after))} }}",
+            event='state_change', block=block.id, before=list(map(str, before)), after=list(map(str, after)),
+        )
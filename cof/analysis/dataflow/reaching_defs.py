@@ -7,10 +7,15 @@ from cof.base.bb import BasicBlock
 from cof.base.mir.inst import MIRInstAddr
 from cof.base.mir.variable import Variable
 from cof.base.semilattice import Semilattice, T
+from cof.trace import DEBUG, channel
+
+_log = channel('dataflow')
 
 type DefPoint = MIRInstAddr
 
 def reaching_defs_on_state_change(block: BasicBlock, lattice, before: Tuple, after: Tuple):
+    if not _log.debug_on:
+        return
 
     headers = [f"Block {block.id} "]
     row = ["Before"]
@@ -22,7 +27,11 @@ def reaching_defs_on_state_change(block: BasicBlock, lattice, before: Tuple, aft
         row2.append(f"{{ {", ".join(map(str, after[idx]))} }}")
 
     table_data = [row, row2]
-    print(tabulate(table_data, headers=headers, tablefmt="grid"), end="\n\n")
+    _log.emit(
+        DEBUG, tabulate(table_data, headers=headers, tablefmt="grid") + "\n",
+        event='state_change', block=block.id,
+        before=[list(map(str, d)) for d in before], after=[list(map(str, d)) for d in after],
+    )
 
 
 
@@ -44,6 +53,9 @@ class ReachingDefsPowerSetSemilattice(Semilattice[set[DefPoint]]):
     def meet(self, a: set[DefPoint], b: set[DefPoint]) -> set[DefPoint]:
         return a | b
 
+    def height(self) -> int:
+        return len(self.universal_set)
+
 
 class ReachingDefsProductSemilattice(Semilattice['Semilattice']):
 
@@ -92,6 +104,9 @@ class ReachingDefsProductSemilattice(Semilattice['Semilattice']):
             for lat, a_i, b_i in zip(self.lattices, a, b)
         )
 
+    def height(self) -> int:
+        return sum(lat.height() for lat in self.lattices)
+
 
 class ReachingDefsTransfer(TransferCluster):
 
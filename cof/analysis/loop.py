@@ -54,7 +54,8 @@ class LoopAnalyzer:
 
     def analyze_loops(self) -> 'LoopAnalyzer':
         """
-        analysing loop structure in cfg.
+        analysing loop structure in cfg, the immediate dominators of cfg
+        must have been computed.
         :return:
         """
         self._find_natural_loops()
@@ -67,11 +68,11 @@ class LoopAnalyzer:
         :return:
         """
 
-        # recognize back edges
+        # recognize back edges, the edges whose target dominates their source
         header_to_latches: Dict[BasicBlock, List[BasicBlock]] = defaultdict(list)
         for bb in self.cfg.block_by_id.values():
             for succ in bb.succ_bbs.values():
-                if self.cfg.ranks[succ.id] < self.cfg.ranks[bb.id]:
+                if self.cfg.dominates(succ.id, bb.id):
                     header_to_latches[succ].append(bb)
 
         for header, latches in header_to_latches.items():
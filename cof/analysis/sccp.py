@@ -1,4 +1,4 @@
-from collections import deque
+from collections import deque, defaultdict
 from typing import Dict, List, Tuple
 
 from cof.base.mir.eval import mir_eval
@@ -7,6 +7,10 @@ from cof.base.mir.operand import Operand
 from cof.base.ssa import SSAEdgeBuilder, SSAVariable
 from cof.base.cfg import ControlFlowGraph, FlattenBasicBlocks
 from cof.base.semilattice import ConstLattice
+from cof.timing import count
+from cof.trace import DEBUG, channel
+
+_log = channel('sccp')
 
 
 class SCCPAnalyzer:
@@ -16,13 +20,20 @@ class SCCPAnalyzer:
 
         # exec_flag[(a, b)] records whether flowgraph edge a -> b is executable.
         self.exec_flag: Dict[Tuple[MIRInstId, MIRInstId], bool] = { }
-        # lat_cell[ssa_v] records ConstLattice which relates ssa_v in the exit
-        # of the node defined SSAVariable ssa_v
-        self.lat_cell: Dict[str, ConstLattice] = { }
+        # exec_in_count[b] records the number of executable flowgraph edges
+        # leading to b, it is updated whenever an exec_flag flips.
+        self.exec_in_count: Dict[MIRInstId, int] = defaultdict(int)
+        # lat_cell[n] records ConstLattice which relates the SSAVariable with
+        # value number n in the exit of the node defined it
+        self.lat_cell: List[ConstLattice] = [ ]
 
         self.flow_wl: deque[Tuple[MIRInstId, MIRInstId]] = deque()
         self.ssa_wl: deque[Tuple[MIRInstId, MIRInstId]] = deque()
 
+        # Number of worklist rounds and of phi / instruction visits.
+        self.iteration_count: int = 0
+        self.visit_count: int = 0
+
         self.fatten_blocks: FlattenBasicBlocks = FlattenBasicBlocks(cfg)
         self._build()
 
@@ -37,23 +48,24 @@ class SCCPAnalyzer:
         for p in self.fatten_blocks.edges:
             self.exec_flag[p[0], p[1]] = False
 
-        for i in self.cfg.insts.ret_insts():
-            if i.is_assignment():
-                self.lat_cell[str(i.result.value)] = ConstLattice()
+        self.lat_cell = [ConstLattice() for _ in self.cfg.ssa_values]
 
     def run(self):
         while self.flow_wl or self.ssa_wl:
+            self.iteration_count += 1
             if self.flow_wl:
                 e = self.flow_wl.popleft()
                 b = e[1]
 
                 # Propagate constants along flowgraph edges
                 if not self.exec_flag[e]:
-                    self.exec_flag[e] = True
+                    self.mark_executable(e)
                     if self.inst(b).is_phi():
+                        self.visit_count += 1
                         self.visit_phi(self.inst(b))
 
-                    elif self.edge_count(b, self.fatten_blocks.edges) == 1:
+                    elif self.edge_count(b) == 1:
+                        self.visit_count += 1
                         self.visit_inst(b, self.inst(b), self.fatten_blocks.exec_flow)
 
             # Propagate constants along ssa edges
@@ -67,18 +79,17 @@ class SCCPAnalyzer:
                 b = e[1]
 
                 if self.inst(b).is_phi():
+                    self.visit_count += 1
                     self.visit_phi(self.inst(b))
-                elif self.edge_count(b, self.fatten_blocks.edges) >= 1:
+                elif self.edge_count(b) >= 1:
+                    self.visit_count += 1
                     self.visit_inst(b, self.inst(b), self.fatten_blocks.exec_flow)
 
 
     # ++++++++ Helper ++++++++
-    def flow_succ_edge(self, mir_id: MIRInstId) -> set[Tuple[MIRInstId, MIRInstId]]:
-        s = set()
-        succ_inst_id_list = self.fatten_blocks.succ[mir_id]
-        for succ in succ_inst_id_list:
-            s.add((mir_id, succ))
-        return s
+    def flow_succ_edge(self, mir_id: MIRInstId) -> List[Tuple[MIRInstId, MIRInstId]]:
+        # in successor order, the worklist order must not depend on the values of ids
+        return [(mir_id, succ) for succ in self.fatten_blocks.succ[mir_id]]
 
     def flow_succ(self, mir_id: MIRInstId) -> List[MIRInstId]:
         return self.fatten_blocks.succ[mir_id]
@@ -93,20 +104,23 @@ class SCCPAnalyzer:
     def ssa_succ(self, mir_id: MIRInstId) -> List[MIRInstId]:
         return self.ssa_builder.succ[mir_id]
 
-    def edge_count(self, b: MIRInstId, edges: List[Tuple[MIRInstId, MIRInstId]]) -> int:
+    def mark_executable(self, e: Tuple[MIRInstId, MIRInstId]):
+        """
+        Set exec_flag of flowgraph edge e and count it for its destination.
+
+        :param e: a non-executable flowgraph edge
+        """
+        self.exec_flag[e] = True
+        self.exec_in_count[e[1]] += 1
+
+    def edge_count(self, b: MIRInstId) -> int:
         """
         return number of executable flowgraph edges leading to b
 
         :param b:
-        :param edges:
         :return:
         """
-        i: int = 0
-        for e in edges:
-            if e[1] == b and self.exec_flag[e]:
-                i += 1
-
-        return i
+        return self.exec_in_count[b]
 
     def inst(self, mir_id: MIRInstId) -> MIRInst:
         return self.cfg.insts.insts_dict_by_id[mir_id]
@@ -145,12 +159,16 @@ class SCCPAnalyzer:
         op_cl_list: List[ConstLattice] = [ ]
         for o in operand_list:
             if isinstance(o.value, SSAVariable):
-                op_cl = self.lat_cell[str(o.value)]
+                op_cl = self.lat_cell[o.value.value_number]
                 op_cl_list.append(op_cl)
             else:
                 op_cl = ConstLattice.constant(o)
                 op_cl_list.append(op_cl)
 
+        # an operand that is not constant makes the result not constant.
+        if any(op_cl.is_bottom for op_cl in op_cl_list):
+            return ConstLattice.bottom()
+
         # two operands are constant.
         if len(operand_list) == 2 and (op_cl_list[0].value and op_cl_list[1].value):
             result = mir_eval(inst.op, op_cl_list[0].value, op_cl_list[1].value)
@@ -165,10 +183,10 @@ class SCCPAnalyzer:
         var_list = inst.ret_operand_list()
         new_value = ConstLattice()
         for var in var_list:
-            new_value ^= (self.lat_cell[str(var.value)])
+            new_value ^= (self.lat_cell[var.value.value_number])
 
-        if new_value != self.lat_cell[str(inst.result.value)]:
-            self.lat_cell[str(inst.result.value)] ^= new_value
+        if new_value != self.lat_cell[inst.result.value.value_number]:
+            self.lat_cell[inst.result.value.value_number] ^= new_value
 
             for succ_id in self.flow_succ(inst.unique_id):
                 self.flow_wl.append((inst.unique_id, succ_id))
@@ -178,9 +196,9 @@ class SCCPAnalyzer:
 
     def visit_inst(self, k: MIRInstId, inst: MIRInst, exec_flow: Dict[Tuple[MIRInstId, MIRInstId], bool]):
         if inst.is_assignment():
-            target: str = str(inst.result.value)
+            target: int = inst.result.value.value_number
         elif inst.is_if() and inst.operand1.is_ssa_var():
-            target: str = str(inst.operand1.value)
+            target: int = inst.operand1.value.value_number
         else:
             succ = self.flow_succ(k)
             if succ:
@@ -203,7 +221,7 @@ class SCCPAnalyzer:
 
         k_succ_edges_set = self.flow_succ_edge(k)
 
-        if val.is_top:
+        if val.is_top or val.is_bottom:
             for succ_edge in k_succ_edges_set:
                 self.flow_wl.append(succ_edge)
 
@@ -226,5 +244,12 @@ def sccp_analysis(cfg: ControlFlowGraph, ssa_builder: SSAEdgeBuilder) -> SCCPAna
     sccp_optimizer = SCCPAnalyzer(cfg, ssa_builder)
     sccp_optimizer.initialize()
     sccp_optimizer.run()
+    count('sccp iterations', sccp_optimizer.iteration_count)
+    count('sccp visits', sccp_optimizer.visit_count)
+    if _log.debug_on:
+        _log.emit(
+            DEBUG, f"SCCP: {sccp_optimizer.iteration_count} iterations, {sccp_optimizer.visit_count} visits",
+            event='sccp', iterations=sccp_optimizer.iteration_count, visits=sccp_optimizer.visit_count,
+        )
 
     return sccp_optimizer
\ No newline at end of file
@@ -23,6 +23,12 @@ class BranchType(Enum):
 
 
 class BasicBlock:
+
+    __slots__ = (
+        'insts', 'id', 'comment', 'branch_type', 'preorder', 'rank', 'ordered_succ_bbs',
+        'pred_bbs', 'succ_bbs', 'dominator_tree_parent', 'dominator_tree_children_id',
+    )
+
     def __init__(self, bb_id: Optional[BasicBlockId], insts: Optional[List[MIRInst]]):
     # def __init__(self, bb_id: int, start_idx: int, end_idx: int, insts: MIRInsts):
 
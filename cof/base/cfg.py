@@ -1,16 +1,26 @@
-import random
 from abc import ABC, abstractmethod
 from collections import deque, defaultdict
-from typing import Tuple, Optional, Dict, List, Union
+from copy import copy
+from typing import Iterable, Tuple, Optional, Dict, List, Union
 
 from cof.base.bb import BasicBlock, BasicBlockId, BasicBlockBranchType, BranchType
+from cof.base.def_use import DefUseIndex
+from cof.base.dominator import dominator_engines
 from cof.base.mir.args import Args
 from cof.base.mir.expr import Expression, ret_expr_from_mir_inst
 from cof.base.mir.inst import MIRInstAddr, MIRInst, MIRInsts, MIRInstId
 from cof.base.mir.operand import OperandType, Operand
 from cof.base.mir.operator import Op
 from cof.base.mir.variable import Variable
-from cof.base.ssa import SSAEdgeBuilder, SSAEdge, SSAVariable, create_phi_function, has_phi_for_var
+from cof.base.ssa import SSAEdgeBuilder, SSAVariable, create_phi_function
+from cof.timing import count, time_pass
+from cof.trace import DEBUG, channel
+
+_cfg_log = channel('cfg')
+_ssa_log = channel('ssa')
+
+# where phi functions are inserted, see ControlFlowGraph.construct_ssa()
+ssa_flavors: List[str] = ['minimal', 'semi-pruned', 'pruned']
 
 
 class ControlFlowGraphABC(ABC):
@@ -84,9 +94,7 @@ class ControlFlowGraph(ControlFlowGraphForDataFlowAnalysis):
         self.pred: Dict[BasicBlockId, List[BasicBlockId]] = defaultdict(list)
         # direct successor nodes
         self.succ: Dict[BasicBlockId, List[BasicBlockId]] = defaultdict(list)
-        # dominators
-        self.dom: Dict[BasicBlockId, set] = {}
-        # immediate dominators
+        # immediate dominators, dominator sets are derived from it by dominators()
         self.idom: Dict[BasicBlockId, BasicBlockId] = {}
 
         self.post_order: List[BasicBlockId] = []
@@ -99,27 +107,48 @@ class ControlFlowGraph(ControlFlowGraphForDataFlowAnalysis):
         self.ranks: Dict[int, int] = {}
         self.max_rank: int = -1
 
+        # cached analysis results by analysis class, see cof.passes.AnalysisManager
+        self.analyses: Dict[type, object] = { }
+
+        # SSA values indexed by their value number, assigned by _rename_variables()
+        self.ssa_values: List[SSAVariable] = []
+
         self._construct_cfg()
         self._assign_ranks()
         self.reassign_inst_id()
 
+        if _cfg_log.debug_on:
+            _cfg_log.emit(
+                DEBUG, f"CFG: {self.n_bbs} blocks, {len(self.edges)} edges, max rank {self.max_rank}",
+                event='cfg', blocks=self.n_bbs, edges=len(self.edges), max_rank=self.max_rank,
+            )
+
     # ++++++++ Initialization ++++++++
     def _construct_cfg(self):
+        """
+        Partition the instruction list into basic blocks and connect them.
+
+        The offset -> inst and inst -> block indexes are built once, so both
+        block construction and edge construction are linear in the number of
+        instructions plus the number of edges.
+        """
+
+        # offset -> inst
+        inst_by_offset: Dict[MIRInstAddr, MIRInst] = { }
 
         # The Set type guarantees that there are no identical elements.
         leaders_set_by_addr = set()
-        # leaders_set_by_addr.add(0)
-
-        for inst in self.insts.ret_insts():
 
-            # self.insts_dict_by_offset[inst.offset] = inst
+        insts = self.insts.ret_insts()
+        for idx, inst in enumerate(insts):
 
+            inst_by_offset[inst.offset] = inst
 
             match inst.op:
                 case Op.ENTRY:
                     leaders_set_by_addr.add(inst.offset)
                     offset = 1
-                    for instruction in self.insts.ret_insts()[1:]:
+                    for instruction in insts[idx + 1:]:
                         if instruction.is_init():
                             offset += 1
                         else:
@@ -131,12 +160,12 @@ class ControlFlowGraph(ControlFlowGraphForDataFlowAnalysis):
                 case Op.IF:
                     leaders_set_by_addr.add(inst.offset + 1)
                     assert inst.result.type == OperandType.PTR
-                    target = MIRInsts.global_insts_dict_by_id[inst.result.value].offset
+                    target = self.insts.inst_by_id(inst.result.value).offset
                     leaders_set_by_addr.add(target)
 
                 case Op.GOTO:
                     assert inst.result.type == OperandType.PTR
-                    target = MIRInsts.global_insts_dict_by_id[inst.result.value].offset
+                    target = self.insts.inst_by_id(inst.result.value).offset
                     leaders_set_by_addr.add(target)
 
 
@@ -145,40 +174,35 @@ class ControlFlowGraph(ControlFlowGraphForDataFlowAnalysis):
         for leader_idx in range(0, len(sorted_list) - 1):
             block_insts: List[MIRInst] = []
             for i in range(sorted_list[leader_idx], sorted_list[leader_idx+1]):
-                found_inst = self.insts.find_inst_by_key(key="offset", value=i)
+                found_inst = inst_by_offset.get(i, None)
                 if found_inst:
                     block_insts.append(found_inst)
 
-            self.new_a_block(self.n_bbs, block_insts)
+            self._index_block_insts(self.new_a_block(self.n_bbs, block_insts))
 
         # Construct the exit basic block
-        block_insts: List[MIRInst] = [self.insts.find_inst_by_key(key="offset", value=sorted_list[-1])]
+        block_insts: List[MIRInst] = [inst_by_offset.get(sorted_list[-1], None)]
 
         self.exit = self.new_a_block(self.n_bbs, block_insts)
+        self._index_block_insts(self.exit)
         self.root = self.block_by_id[0]
 
         # Updating Edges in the CFG
-        for src_vertex in set(self.block_by_id.values()) - {self.exit}:
+        for src_vertex in self.block_by_id.values():
+
+            if src_vertex is self.exit:
+                continue
 
             # Get the last inst in basic block.
             last_inst = src_vertex.insts.ret_inst_by_idx(-1)
 
             # Handling GOTO statement
             if last_inst.op == Op.GOTO:
-                # target_inst_idx = int(last_inst.result.value)
 
                 # The value of result of branch instruction is instruction unique id.
                 # Get the GOTO target instruction unique id.
                 target_inst_uid = last_inst.result.value
-
-                # anticipated vertex
-                dst_vertex = None
-
-                # iterate all blocks
-                for target_bb in self.block_by_id.values():
-                    if target_bb.insts.inst_by_id(target_inst_uid):
-                        dst_vertex = target_bb
-                        break
+                dst_vertex = self.block_by_inst_id[target_inst_uid]
 
                 # record the next bb
                 src_vertex.branch_type = BasicBlockBranchType.jump
@@ -194,19 +218,7 @@ class ControlFlowGraph(ControlFlowGraphForDataFlowAnalysis):
                 # Get the IF target instruction unique id.
                 if last_inst.op == Op.IF:
                     target_inst_uid = int(last_inst.result.value)
-
-                    # dst_vertex = next((target_bb \
-                    #                    for target_bb in self.block_by_id.values() \
-                    #                    if target_bb.insts.inst_by_id(target_inst_uid)), -1)
-
-                    # anticipated vertex
-                    dst_vertex = None
-
-                    # iterate all blocks
-                    for target_bb in self.block_by_id.values():
-                        if target_bb.insts.inst_by_id(target_inst_uid):
-                            dst_vertex = target_bb
-                            break
+                    dst_vertex = self.block_by_inst_id[target_inst_uid]
 
                     src_vertex.branch_type = BasicBlockBranchType.cond
                     src_vertex.ordered_succ_bbs.append(dst_vertex.id)
@@ -216,22 +228,11 @@ class ControlFlowGraph(ControlFlowGraphForDataFlowAnalysis):
                 else:
                     src_vertex.branch_type = BasicBlockBranchType.jump
 
-                # dst_vertex = next((target_bb \
-                #                    for target_bb in self.block_by_id.values() \
-                #                    if target_bb.insts.inst_exist(lambda ins: ins.offset == (last_inst_idx + 1))), -1)
-
-                # anticipated vertex
-                dst_vertex = None
-
-                # iterate all blocks
-                for target_bb in self.block_by_id.values():
-                    if target_bb.insts.inst_exist(lambda instr: instr.offset == (last_inst.offset + 1)):
-                        dst_vertex = target_bb
-                        break
-
-                assert dst_vertex is not None
+                # The fall-through block holds the instruction right after the last one.
+                fall_through_inst = inst_by_offset.get(last_inst.offset + 1, None)
+                assert fall_through_inst is not None
+                dst_vertex = self.block_by_inst_id[fall_through_inst.unique_id]
 
-                # if dst_vertex:
                 src_vertex.ordered_succ_bbs.append(dst_vertex.id)
                 self.edges.append((src_vertex.id, dst_vertex.id))
                 if last_inst.op == Op.IF:
@@ -254,6 +255,13 @@ class ControlFlowGraph(ControlFlowGraphForDataFlowAnalysis):
             for n in self.succ[k]:
                 v.succ_bbs[n] = self.block_by_id[n]
 
+    def _index_block_insts(self, block: BasicBlock):
+        """
+        Record the owning block of every instruction in block.
+        """
+        for inst_id in block.insts.ret_inst_ids():
+            self.block_by_inst_id[inst_id] = block
+
     def _assign_ranks(self):
         """
         Depth First Search to assign rank for every block.
@@ -365,70 +373,43 @@ class ControlFlowGraph(ControlFlowGraphForDataFlowAnalysis):
 
 
     # ++++++++ Dominator ++++++++
-    def dom_comp(self):
+    def idom_comp(self, strategy: str = 'cooper-harvey-kennedy'):
         """
-        A simple approach to computing all the dominators of each node in a flowgraph.
+        Compute immediate dominators with the selected dominator engine.
+        :param strategy: one of dominator_engines, cooper-harvey-kennedy or lengauer-tarjan
         :return:
         """
+        engine = dominator_engines.get(strategy)
+        if engine is None:
+            raise ValueError(f"unknown dominator engine '{strategy}', expected one of {', '.join(dominator_engines)}")
+        self.idom = engine(self).idom_comp()
 
-        # dominators
-        self.dom: Dict[int, set] = {i: set() for i in range(self.n_bbs)}
-
-        # The algorithm first initializes change = True,
-        change = True
-        # dominators[root_id] = { root_id }
-        root_id = self.root.id
-        self.dom[root_id].add(root_id)
-        # and dominators[i] = { all vertex ids } for each vertex i other than root.
-        for n in self.block_id_set - {root_id}:
-            self.dom[n].update(self.block_id_set)
-
-        while change:
-            change = False
-
-            for n in self.block_id_set - {root_id}:
-                tmp_dominator_set = set(self.block_id_set)
-
-                # For first iteration, p is root_id ( the only member of Pred(B1) )
-                # and so set tmp_dominator_set = { root_id }
-                for p in self.pred[n]:
-                    tmp_dominator_set &= self.dom[p]
-
-                dominator_set = {n} | tmp_dominator_set
-                if dominator_set != self.dom[n]:
-                    change = True
-                    self.dom[n] = dominator_set
-
-    def idom_comp(self):
+    def dominators(self, block_id: BasicBlockId) -> set[BasicBlockId]:
         """
-        In essence, the algorithm first sets tmp[i] to dom[i] - { i }
-        and then checks for each vertex i whether each element in tmp[i]
-        has dominators other than itself and, if so, remove them from tmp[i].
-        :return:
+        Derive the dominator set of a block from the idom tree.
+        :param block_id:
+        :return: all blocks dominating block_id, include itself.
         """
-
-        # immediate dominators
-        self.idom: Dict[int, int] = {i: -1 for i in range(self.n_bbs)}
-
-        root_id = self.root.id
-        tmp = {i: set() for i in range(self.n_bbs)}
-        new_tmp = {i: set() for i in range(self.n_bbs)}
-
-        for n in self.block_id_set:
-            tmp[n] = self.dom[n] - {n}
-            new_tmp[n] = self.dom[n] - {n}
-
-        for n in self.block_id_set - {root_id}:
-            for s in tmp[n]:
-                for t in tmp[n] - {s}:
-                    if t in tmp[s]:
-                        new_tmp[n] -= {t}
-
-        for n in self.block_id_set - {root_id}:
-            if new_tmp[n]:
-                self.idom[n] = random.choice(list(new_tmp[n]))
+        dom_set = {block_id}
+        n = self.idom[block_id]
+        while n != -1:
+            dom_set.add(n)
+            n = self.idom[n]
+        return dom_set
+
+    def dominates(self, a: BasicBlockId, b: BasicBlockId) -> bool:
+        """
+        Check if block a dominates block b.
+        """
+        while b != -1:
+            if a == b:
+                return True
+            b = self.idom[b]
+        return False
 
     def construct_dominator_tree(self):
+        for block in self.block_by_id.values():
+            block.dominator_tree_children_id.clear()
         for child, parent in self.idom.items():
             child_bb: BasicBlock = self.block_by_id[child]
             if parent == -1:
@@ -436,6 +417,7 @@ class ControlFlowGraph(ControlFlowGraphForDataFlowAnalysis):
                 continue
 
             parent_bb: BasicBlock = self.block_by_id[parent]
+            child_bb.dominator_tree_parent = parent_bb
             parent_bb.dominator_tree_children_id.append(child_bb.id)
 
     def post_order_comp(self):
@@ -452,6 +434,7 @@ class ControlFlowGraph(ControlFlowGraphForDataFlowAnalysis):
                 children[parent].append(node)
 
         root = self.root.id
+        self.post_order = []
 
         # iterative post-order traversal
         stack = [(root, False)]
@@ -488,29 +471,21 @@ class ControlFlowGraph(ControlFlowGraphForDataFlowAnalysis):
     def collect_use_def(self) -> Tuple[Dict[BasicBlock, set[Variable]], Dict[BasicBlock, set[Variable]]]:
         def_dict: Dict[BasicBlock, set[Variable]] = defaultdict(set)
 
-        # undefined before use.
+        # undefined before use (upward-exposed uses).
         use_dict: Dict[BasicBlock, set[Variable]] = defaultdict(set)
 
-        # local definitions
-        # local_def_tracker = defaultdict(set)
-
-        block_defs = defaultdict(set)
-
         for block in self.all_blocks():
+            local_defs = def_dict[block]
             for inst in block.insts.ret_ordinary_insts():
-                if inst.is_assignment():
-                    var = inst.ret_dest_variable().value
-                    def_dict[block].add(var)
-                    block_defs[block].add(var)
 
-        for block in self.all_blocks():
-            local_defs = set()
-            for inst in block.insts.ret_ordinary_insts():
+                operands = inst.ret_operand_list()
+                if inst.op == Op.PRINT:
+                    operands = [inst.operand1]
 
-                for operand in inst.ret_operand_list():
+                for operand in operands:
                     var = operand.value
                     if isinstance(var, Variable):
-                        if var not in local_defs and var not in block_defs[block]:
+                        if var not in local_defs:
                             use_dict[block].add(var)
 
                 if inst.is_assignment():
@@ -543,60 +518,100 @@ class ControlFlowGraph(ControlFlowGraphForDataFlowAnalysis):
     # ++++++++ SSA ++++++++
     def _dom_front(self):
         """
-        Dominance Frontier
+        Dominance Frontier, by the runner walk of Cooper, Harvey and Kennedy:
+        a join block is in the frontier of every block on the dominator tree
+        path from each of its predecessors up to (excluding) its immediate
+        dominator.
         :return:
         """
         df: Dict[int, set] = {i: set() for i in range(self.n_bbs)}
+        root = self.root.id
 
-        for i in self.post_order:
-            # Compute local component
-            for y in self.succ[i]:
-                if self.idom[y] != i:
-                    df[i] |= {y}
-            # Add on up component
-            z = self.idom[i]
-            if z != -1:
-                for y in df[z]:
-                    if y != self.idom[i]:
-                        df[i] |= {y}
+        for b in self.post_order:
+            preds = self.pred[b]
+            if len(preds) < 2:
+                continue
+            b_idom = self.idom[b]
+            for runner in preds:
+                # unreachable predecessors are not in the dominator tree
+                if runner != root and self.idom[runner] == -1:
+                    continue
+                while runner != b_idom:
+                    runner_df = df[runner]
+                    if b in runner_df:
+                        # the rest of the path has been walked from another predecessor
+                        break
+                    runner_df.add(b)
+                    runner = self.idom[runner]
         self.df = df
 
+    def iterated_dominance_frontier(self, def_blocks) -> List[BasicBlockId]:
+        """
+        Iterated dominance frontier DF+() of a set of blocks.
+
+        Every block of the set and of DF+() is taken from the worklist once
+        and its dominance frontier is read once, so the cost is the size of
+        the frontiers involved, not of the whole graph.
+
+        Note:
+            The dominance frontiers must have been computed.
+        :param def_blocks: ids of the blocks, e.g. where a variable is defined.
+        :return: the ids of the blocks in DF+(), in ascending order.
+        """
+        worklist: List[BasicBlockId] = list(set(def_blocks))
+        on_worklist: set[BasicBlockId] = set(worklist)
+        idf: set[BasicBlockId] = set()
+
+        while worklist:
+            for y in self.df[worklist.pop()]:
+                if y not in idf:
+                    idf.add(y)
+                    if y not in on_worklist:
+                        on_worklist.add(y)
+                        worklist.append(y)
+
+        return sorted(idf)
+
     def _df_plus(self, sn):
         """
         iterated dominance frontier DF+()
         :param sn:
         :return:
         """
+        self.dfp = set(self.iterated_dominance_frontier(sn))
+        return self.dfp
 
-        def df_set(s: set):
-            dn = set()
-            for x in s:
-                dn |= self.df[x]
-            return dn
-
-        # d: set = set()
-        change = True
-        self.dfp = df_set(sn)
-        while change:
-            change = False
-            d = df_set(sn | self.dfp)
-            if d != self.dfp:
-                self.dfp = d
-                change = True
+    def _rename_variables(self, def_sites: Dict[Variable, List], variables: Iterable[Variable]) -> None:
+        """
+        Rename the variables in a preorder walk of the dominator tree.
 
-    def _rename_variables(self, def_sites: Dict[Variable, List], variables: set[Variable]) -> None:
+        The walk keeps its own stack, so the depth of the dominator tree is
+        not limited by the recursion limit. Every block records only the
+        variables it defined, which are popped from the version stacks when
+        its subtree is done, and the phi operands of its successors are
+        filled in at its exit.
+        """
 
         # initialize version counters
         counters: Dict[Variable, int] = {v: 0 for v in def_sites.keys()}
-        # initialize current version stacks
-        stacks: Dict[Variable, List[int]] = defaultdict(list)
-        # record version at the exit of each block { block: { var: version } }
-        block_versions: Dict[int, dict] = defaultdict(dict)
-        # temporary storage phi operands { block: { var: [operands] }
-        phi_operands: Dict[int, dict] = defaultdict(lambda: defaultdict(list))
 
-        for var in variables:
-            stacks[var].append(0)
+        # every SSA value gets a dense value number, the value number
+        # of the i-th value is i, so value tables can be plain lists.
+        self.ssa_values = []
+
+        def add_value(ssa_var: SSAVariable) -> int:
+            ssa_var.value_number = len(self.ssa_values)
+            self.ssa_values.append(ssa_var)
+            return ssa_var.value_number
+
+        def new_value(var: Variable, version: int) -> int:
+            return add_value(SSAVariable(var, version))
+
+        def use_value(value_number: int) -> SSAVariable:
+            return copy(self.ssa_values[value_number])
+
+        # current value number stacks
+        stacks: Dict[Variable, List[int]] = {var: [new_value(var, 0)] for var in variables}
 
         # We already have built dominator tree.
         # Due to the fact that we set the phi function
@@ -609,7 +624,7 @@ class ControlFlowGraph(ControlFlowGraphForDataFlowAnalysis):
                 if operand.type == OperandType.VAR:
                     if operand.value in stacks:
                         operand.type = OperandType.SSA_VAR
-                        operand.value = SSAVariable(operand.value, stacks[operand.value][-1])
+                        operand.value = use_value(stacks[operand.value][-1])
 
                 elif operand.type == OperandType.ARGS:
                     for arg in operand.value.args:
@@ -617,41 +632,47 @@ class ControlFlowGraph(ControlFlowGraphForDataFlowAnalysis):
                         if isinstance(arg.value, Variable):
                             if arg.value in stacks:
                                 arg.type = OperandType.SSA_VAR
-                                arg.value = SSAVariable(arg.value, stacks[arg.value][-1])
-
-            else:
-                pass
-
-
-        # depth first search
-        def dfs(block_para: BasicBlock):
-
-            nonlocal counters, stacks, block_versions, phi_operands
+                                arg.value = use_value(stacks[arg.value][-1])
+
+        # variables pushed by the blocks on the current dominator tree path,
+        # a block pops down to the length at its entry.
+        pushed: List[Variable] = []
+        # blocks with phi functions, in the order they were first reached
+        phi_blocks: List[BasicBlock] = []
+        reached: set[BasicBlockId] = set()
+
+        # (block, length of pushed at its entry), -1 before its entry
+        worklist: List[Tuple[BasicBlock, int]] = [(self.root, -1)]
+        while worklist:
+            block, entry = worklist.pop()
+
+            if entry != -1:
+                # backtrack, pop the versions defined in the block
+                while len(pushed) > entry:
+                    stacks[pushed.pop()].pop()
+                continue
 
-            # # record stack status at the entry of the current block.
-            # entry_versions = { }
-            # for v in variables:
-            #     entry_versions[v] = stacks[v][-1]
+            worklist.append((block, len(pushed)))
 
             # 1
             # handle all phi insts in current block at first
             # allocate new version for phi result.
-            phi_def_list: List[Variable] = []
-            for phi_inst_in_cbb in block_para.insts.ret_phi_insts():
+            for phi_inst_in_cbb in block.insts.ret_phi_insts():
                 assert isinstance(phi_inst_in_cbb.result.value, SSAVariable)
                 ssa_var: SSAVariable = phi_inst_in_cbb.result.value
+                var: Variable = ssa_var.original_variable
 
                 # construct new varname and assign to phi result
-                counters[ssa_var.original_variable] += 1
-                ssa_var.version = counters[ssa_var.original_variable]
+                counters[var] += 1
+                ssa_var.version = counters[var]
 
                 # add new version into stack
-                stacks[ssa_var.original_variable].append(counters[ssa_var.original_variable])
-                phi_def_list.append(ssa_var.original_variable)
+                stacks[var].append(add_value(ssa_var))
+                pushed.append(var)
 
             # 2
             # rename ordinary instructions
-            for inst_in_cbb in block_para.insts.ret_ordinary_insts():
+            for inst_in_cbb in block.insts.ret_ordinary_insts():
                 # rename (use) operands
                 rename_use_operand(inst_in_cbb.operand1)
                 rename_use_operand(inst_in_cbb.operand2)
@@ -660,100 +681,94 @@ class ControlFlowGraph(ControlFlowGraphForDataFlowAnalysis):
                 if inst_in_cbb.is_assignment():
                     v: Variable = inst_in_cbb.ret_dest_variable().value
                     counters[v] += 1
-                    new_ver = counters[v]
-                    new_var = SSAVariable(v, new_ver, block_id=block_para.id)
+                    new_var = SSAVariable(v, counters[v], block_id=block.id)
 
                     inst_in_cbb.result.type = OperandType.SSA_VAR
                     inst_in_cbb.result.value = new_var
 
-                    stacks[v].append(new_ver)
+                    stacks[v].append(add_value(new_var))
+                    pushed.append(v)
 
             # 3
-            # record variable version at the exit of the current block
-            exit_versions = {}
-            for v in variables:
-                exit_versions[v] = stacks[v][-1]
-            block_versions[block_para.id] = exit_versions
-
-            # 4
-            # collect operands for phi function in all successors.
-            for succ in self.succ[block_para.id]:
-                cbb_idx_in_pred = self.pred[succ].index(block_para.id)
+            # fill in the operands of the phi functions in all successors.
+            for succ in self.succ[block.id]:
                 succ_bb = self.block_by_id[succ]
+                phi_insts = succ_bb.insts.ret_phi_insts()
+                if not phi_insts:
+                    continue
+                if succ not in reached:
+                    reached.add(succ)
+                    phi_blocks.append(succ_bb)
 
-                if succ not in phi_operands:
-                    phi_operands[succ] = {}
-
-                for phi_inst_in_cbb in succ_bb.insts.ret_phi_insts():
-
+                cbb_idx_in_pred = self.pred[succ].index(block.id)
+                for phi_inst_in_cbb in phi_insts:
                     result: Variable = phi_inst_in_cbb.result.value.original_variable
+                    # the last version of the variable in stack.
+                    value_number = stacks[result][-1]
+                    phi_arg_var: SSAVariable = phi_inst_in_cbb.operand2.value.args[cbb_idx_in_pred].value
+                    phi_arg_var.version = self.ssa_values[value_number].version
+                    phi_arg_var.value_number = value_number
+                    phi_arg_var.block_id = block.id
 
-                    if result not in phi_operands[succ]:
-                        phi_operands[succ][result] = [-1] * len(self.pred[succ])  # default version
-
-                    # get the last version of the variable in version stack.
-                    current_ver = stacks[result][-1] if result in stacks and stacks[result] else 0
-                    # save operands
-                    phi_operands[succ][result][cbb_idx_in_pred] = current_ver
-
-            # 5
-            for child_id in block_para.dominator_tree_children_id:
-                dfs(self.block_by_id[child_id])
-
-            # 6
-            # pop up the current scope version when backtracking
-            for inst_in_cbb in reversed(block_para.insts.ret_ordinary_insts()):
-                if inst_in_cbb.is_assignment():
-                    if isinstance(inst_in_cbb.result.value, SSAVariable):
-                        result: SSAVariable = inst_in_cbb.result.value
-                        stacks[result.original_variable].pop()
-                    elif isinstance(inst_in_cbb.result.value, Variable):
-                        result: Variable = inst_in_cbb.result.value
-                        stacks[result].pop()
-                    else:
-                        raise TypeError("Only Variables or SSAVariables are allowed")
-
-            for v in reversed(phi_def_list):
-                stacks[v].pop()
-
-        # enter
-        dfs(self.root)
-
-        # apply phi operands and rename.
-        for block_id, phi_data in phi_operands.items():
-
-            # calculate pred block index
-            pred_index_map: Dict[int, int] = {pred_id: idx for idx, pred_id in enumerate(self.pred[block_id])}
-
-            block: BasicBlock = self.block_by_id[block_id]
-
+            # 4
+            # children are visited in order, before the block is left.
+            for child_id in reversed(block.dominator_tree_children_id):
+                worklist.append((self.block_by_id[child_id], -1))
+
+        # the operands of predecessors not reached by the walk are the
+        # undefined value (var, -1) of the variable.
+        undefined_values: Dict[Variable, int] = { }
+        for block in phi_blocks:
             for phi in block.insts.ret_phi_insts():
-                result_var: SSAVariable = phi.result.value
-                common_var: Variable = result_var.original_variable
-
-                if common_var not in phi_data:
-                    continue
-
+                common_var: Variable = phi.result.value.original_variable
                 phi_args: Args = phi.operand2.value
-                for index, pred_id in enumerate(self.pred[block_id]):
-                    # get index from dict
-                    pred_index = pred_index_map[pred_id]
-                    # obtain the version number of the corresponding predecessor.
-                    version = phi_data[common_var][pred_index]
+                for index, pred_id in enumerate(self.pred[block.id]):
                     phi_arg_var: SSAVariable = phi_args.args[index].value
-                    phi_arg_var.version = version
+                    if phi_arg_var.value_number != -1:
+                        continue
+                    if common_var not in undefined_values:
+                        undefined_values[common_var] = new_value(common_var, -1)
+                    phi_arg_var.version = -1
+                    phi_arg_var.value_number = undefined_values[common_var]
                     phi_arg_var.block_id = pred_id
 
     def minimal_ssa(self):
-        self._dom_front()
-        self._df_plus(self.block_id_set)
+        """
+        Note:
+            The dominance frontiers must have been computed, by initialize() or
+            by the dominance frontier analysis of cof.passes.
+        :return:
+        """
+        self.construct_ssa('minimal')
+
+    def construct_ssa(self, flavor: str = 'minimal', live_in: Optional[Dict[BasicBlock, set[Variable]]] = None) -> int:
+        """
+        Insert phi functions and rename the variables into SSA form.
 
-        variables: set[Variable] = set()
+        The flavor decides which blocks of the iterated dominance frontier of
+        the definitions of a variable get a phi function for it:
+            minimal      all of them
+            semi-pruned  all of them, for the variables used in some block
+                         before they are defined in it (non-local names)
+            pruned       the blocks the variable is live into
 
-        # collect all variables.
-        for inst in self.insts.ir_insts:
+        Note:
+            The dominance frontiers must have been computed, by initialize() or
+            by the dominance frontier analysis of cof.passes.
+        :param flavor: one of ssa_flavors.
+        :param live_in: live-in variables of every block for pruned, computed if None.
+        :return: the number of phi functions inserted.
+        """
+        if flavor not in ssa_flavors:
+            raise ValueError(f"unknown SSA flavor '{flavor}', expected one of {', '.join(ssa_flavors)}")
+
+        # collect all variables, in the order of their first definition, so
+        # the order of the phi functions and of the SSA values does not
+        # depend on the hash seed.
+        variables: Dict[Variable, None] = { }
+        for inst in self.insts.ret_insts():
             if inst.is_assignment():
-                variables.add(inst.ret_dest_variable().value)
+                variables[inst.ret_dest_variable().value] = None
 
         # record all blocks which defines variable
         def_sites: Dict[Variable, List] = {v: [] for v in variables}
@@ -763,57 +778,77 @@ class ControlFlowGraph(ControlFlowGraphForDataFlowAnalysis):
                     variable: Variable = inst.ret_dest_variable().value
                     def_sites[variable].append(block.id)
 
-        # insert phi function for each variable
-        for var in variables:
-            # initialize worklist and even_on_worklist
-
-            # the sequence stores blocks that need be handled
-            worklist = deque(def_sites[var])
-            even_on_worklist = set(def_sites[var])
+        # variables that may need a phi function
+        candidates: Iterable[Variable] = variables
+        if flavor == 'semi-pruned':
+            use_dict, _ = self.collect_use_def()
+            non_local: set[Variable] = set()
+            for used in use_dict.values():
+                non_local |= used
+            candidates = [var for var in variables if var in non_local]
+        elif flavor == 'pruned' and live_in is None:
+            # cof.analysis.dataflow imports this module
+            from cof.analysis.dataflow import DataFlowAnalyzer
+            live_in = DataFlowAnalyzer(self).live_vars(verbose=False)
+
+        # phi functions of every block by variable, in the order of insertion
+        block_phis: Dict[BasicBlockId, Dict[Variable, MIRInst]] = defaultdict(dict)
 
+        # insert phi function for each variable
+        num_phis = 0
+        for var in candidates:
             # if the variable only be defined once, then we're done.
-            if len(even_on_worklist) == 1:
+            if len(set(def_sites[var])) == 1:
                 continue
 
-            # handle worklist iteratively
-            while worklist:
-                # extract current define block id
-                def_block_id = worklist.popleft()
-
-                # iterate the dominance frontier of def_block_id
-                for y in self.df[def_block_id]:
-                    y_block = self.block_by_id[y]
-                    # check if y has phi function of v
-                    if not has_phi_for_var(y_block, var):
-
-                        # insert phi function as the first inst in y
-                        new_phi = create_phi_function(var, num_pred_s=len(self.pred[y]))
-                        insert_index = self.insts.index_for_inst(y_block.first_ordinary_inst)
-                        # add phi inst into cfg insts
-                        self.add_new_inst(insert_index, new_phi)
-                        # add phi inst into block insts
-                        y_block.insts.add_phi_inst(new_phi)
+            for y in self.iterated_dominance_frontier(def_sites[var]):
+                if flavor == 'pruned' and var not in live_in.get(self.block_by_id[y], ()):
+                    continue
+                block_phis[y][var] = create_phi_function(var, num_pred_s=len(self.pred[y]))
+                num_phis += 1
 
-                        # check if y is inserted for the first time, join into worklist.
-                        if y not in even_on_worklist:
-                            even_on_worklist.add(y)
-                            worklist.append(y)
+        # every phi function was put in front of the first instruction of its
+        # block, the one inserted last comes first, in the block and in insts.
+        insert_before: Dict[MIRInstId, List[MIRInst]] = { }
+        for y, phis in block_phis.items():
+            y_block = self.block_by_id[y]
+            insert_before[y_block.first_ordinary_inst.unique_id] = list(reversed(phis.values()))
+            y_block.insts.add_phi_insts(list(phis.values()))
+        self.insts.splice_insts(insert_before)
 
-        self._rename_variables(def_sites, variables)
+        with time_pass('ssa-rename'):
+            self._rename_variables(def_sites, variables)
 
         # After we have inserted phi function, we need to reassign inst id.
         self.reassign_inst_id()
 
-    def ssa_edges_comp(self, loop_info) -> 'SSAEdgeBuilder':
+        count('phi functions', num_phis)
+        if _ssa_log.debug_on:
+            _ssa_log.emit(
+                DEBUG, f"SSA ({flavor}): {num_phis} phi functions for {len(variables)} variables, "
+                       f"{len(self.ssa_values)} values",
+                event='construct_ssa', flavor=flavor, phis=num_phis, variables=len(variables),
+                values=len(self.ssa_values),
+            )
+        return num_phis
+
+    def ssa_edges_comp(self, loop_info, def_use: Optional[DefUseIndex] = None) -> 'SSAEdgeBuilder':
         """
         Note:
             Must be guaranteed that all variables have been converted to SSAVariable form before
             calling this routine.
+        :param loop_info: Loop Info
+        :param def_use: the def-use index of the SSA form, built here if not given.
         :return:
         """
-        edges: List[SSAEdge] = []
-        def_sites: Dict[str, int] = {}  # var_name -> MIRInst.id
-        phi_sources = defaultdict(list)  # phi_inst_id -> original definition list
+        if def_use is None:
+            def_use = DefUseIndex(self)
+
+        def_sites: List[MIRInstId] = [-1] * len(self.ssa_values)  # value number -> MIRInst.id
+        use_sites: List[List[MIRInstId]] = [[] for _ in self.ssa_values]  # value number -> [MIRInst.id]
+        loop_carried: set[Tuple[MIRInstId, MIRInstId]] = set()
+        # block -> its innermost loop, the blocks with phi functions are asked repeatedly
+        block_loops: Dict[BasicBlock, object] = { }
 
         def is_loop_carried(phi_block: BasicBlock, def_block: BasicBlock, lo) -> bool:
             """
@@ -824,7 +859,9 @@ class ControlFlowGraph(ControlFlowGraphForDataFlowAnalysis):
             :return:
             """
 
-            phi_loop = lo.get_loop_for_block(phi_block)
+            if phi_block not in block_loops:
+                block_loops[phi_block] = lo.get_loop_for_block(phi_block)
+            phi_loop = block_loops[phi_block]
 
             if not phi_loop:
                 return False
@@ -837,64 +874,33 @@ class ControlFlowGraph(ControlFlowGraphForDataFlowAnalysis):
 
             return False
 
-        # stage 1.
-        # collect all definition.
-        for block in self.block_by_id.values():
-            for inst in block.insts.ret_ordinary_insts():
-                if inst.is_assignment():
-                    var: SSAVariable = inst.result.value
-                    def_sites[str(var)] = inst.unique_id
-
-            for phi_inst in block.insts.ret_phi_insts():
-                var: SSAVariable = phi_inst.result.value
-                def_sites[str(var)] = phi_inst.unique_id
-                phi_sources[phi_inst.unique_id] = []
-
-        # stage 2.
-        # connect common use.
-        for block in self.block_by_id.values():
-            for inst in block.insts.ret_ordinary_insts():
-                operand_list = inst.ret_operand_list()
-                for operand in operand_list:
-                    if isinstance(operand.value, SSAVariable) and str(operand.value) in def_sites:
-                        src_inst_id = def_sites[str(operand.value)]
-                        edges.append(SSAEdge(
-                            self.insts.inst_by_id(src_inst_id)
-                            , inst
-                            , self.find_defining_block(src_inst_id)
-                            , block
-                            , str(operand.value)))
-
-        # stage 3.
-        # handle phi instructions.
-        for block in self.block_by_id.values():
-            for phi in block.insts.ret_phi_insts():
-
-                # get predecessor id list
-                predecessor_id_list = self.pred[block.id]
-
-                for i, operand in enumerate(phi.ret_operand_list()):
-                    assert isinstance(operand.value, SSAVariable)
-                    ssa_name = str(operand.value)
-                    if ssa_name in def_sites:
-                        src_inst_id = def_sites[ssa_name]
-                        # find block which has defined the var.
-                        src_block = self.find_defining_block(src_inst_id)
-
-                        if src_block and src_block.id in predecessor_id_list:
-
-                            ssa_edge = SSAEdge(
-                                self.insts.inst_by_id(src_inst_id)
-                                , phi
-                                , self.find_defining_block(src_inst_id)
-                                , block
-                                , ssa_name)
+        for value_number, value in enumerate(self.ssa_values):
+            # undefined values have no definition, the unrenamed phi
+            # functions of unreachable blocks have the same version.
+            if value.version == -1:
+                continue
+            src_inst_id = def_use.definition(value)
+            if src_inst_id is None:
+                continue
+            def_sites[value_number] = src_inst_id
+            src_block = def_use.block_of(src_inst_id)
+
+            # ordinary uses first, then the phi functions. An SSA edge for
+            # every operand using the value, a phi function is revisited
+            # whenever the value changes, wherever it was defined.
+            phi_uses: List[MIRInstId] = []
+            for inst_id, num_operands in def_use.use_counts(value):
+                if not def_use.inst(inst_id).is_phi():
+                    use_sites[value_number].extend([inst_id] * num_operands)
+                    continue
 
-                            if is_loop_carried(block, src_block, loop_info):
-                                ssa_edge.mark_loop_carried()
-                            edges.append(ssa_edge)
+                block = def_use.block_of(inst_id)
+                phi_uses.extend([inst_id] * num_operands)
+                if is_loop_carried(block, src_block, loop_info):
+                    loop_carried.add((src_inst_id, inst_id))
+            use_sites[value_number].extend(phi_uses)
 
-        return SSAEdgeBuilder(self, edges, def_sites)
+        return SSAEdgeBuilder(self, def_use, def_sites, use_sites, loop_carried)
 
 
     # ++++++++ Management ++++++++
@@ -905,8 +911,7 @@ class ControlFlowGraph(ControlFlowGraphForDataFlowAnalysis):
         # self.insts_dict_by_id = {inst.unique_id: inst for inst in self.insts.ret_insts()}
 
         for block in self.block_by_id.values():
-            for inst in block.insts.ret_insts():
-                self.block_by_inst_id[inst.unique_id] = block
+            self._index_block_insts(block)
 
     def new_a_block(self, bb_id: BasicBlockId, block_insts: List[MIRInst]) -> BasicBlock:
         src_vertex = BasicBlock(bb_id, block_insts)
@@ -943,14 +948,12 @@ class ControlFlowGraph(ControlFlowGraphForDataFlowAnalysis):
         for child_id in block.dominator_tree_children_id:
             self.print_dom_tree(self.block_by_id[child_id])
 
-    def initialize(self):
-        self.dom_comp()
-        self.idom_comp()
+    def initialize(self, dom_strategy: str = 'cooper-harvey-kennedy'):
+        self.idom_comp(dom_strategy)
         self.construct_dominator_tree()
         self.post_order_comp()
 
         self._dom_front()
-        self._df_plus(self.block_id_set)
 
 
 
@@ -1017,7 +1020,7 @@ class FlattenBasicBlocks:
                 succ_block = self.cfg.block_by_id[b_id]
 
                 # the false branch address is the address of the current instruction plus one.
-                next_inst_of_false_branch = succ_block.insts.find_inst_by_key(key="addr", value=last_inst.offset + 1)
+                next_inst_of_false_branch = succ_block.insts.find_inst_by_key(key="offset", value=last_inst.offset + 1)
                 if next_inst_of_false_branch:
                     find_false_branch = True
 
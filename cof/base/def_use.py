@@ -0,0 +1,150 @@
+"""
+    Def-use and use-def chains.
+
+    DefUseIndex maps every variable to the instructions defining it and to
+    the instructions using it, so "definition of v" and "users of v" are
+    dictionary lookups instead of scans over all instructions. It is built
+    once from the blocks of a control flow graph and kept up to date by the
+    transforms: after an instruction has changed, update_inst() re-indexes
+    it, add_inst() and remove_inst() index new and removed instructions.
+
+    The uses of an instruction are the variables of ret_operand_list(), the
+    definition is ret_def_var(). In SSA form every SSA value has a single
+    definition; the variables of unreachable blocks, which are not renamed,
+    may have several.
+"""
+from typing import Dict, Iterable, ItemsView, KeysView, List, Optional, Tuple
+
+from cof.base.bb import BasicBlock
+from cof.base.mir.inst import MIRInst, MIRInstId
+from cof.base.mir.variable import Variable
+from cof.timing import count
+
+
+def _def_var(inst: MIRInst) -> Optional[Variable]:
+    var = inst.ret_def_var()
+    return var if isinstance(var, Variable) else None
+
+
+def _used_vars(inst: MIRInst) -> Tuple[Variable, ...]:
+    return tuple(operand.value for operand in inst.ret_operand_list() if isinstance(operand.value, Variable))
+
+
+class DefUseIndex:
+
+    def __init__(self, cfg):
+        self.cfg = cfg
+        # variable -> ids of the insts defining it, and of the insts using
+        # it with the number of operands using it. In the order of the
+        # blocks and of their insts, the dicts of defs are ordered sets.
+        self.defs: Dict[Variable, Dict[MIRInstId, None]] = { }
+        self.uses: Dict[Variable, Dict[MIRInstId, int]] = { }
+
+        # inst id -> the inst, its block, and what it was indexed with
+        self.insts: Dict[MIRInstId, MIRInst] = { }
+        self.blocks: Dict[MIRInstId, BasicBlock] = { }
+        self._indexed: Dict[MIRInstId, Tuple[Optional[Variable], Tuple[Variable, ...]]] = { }
+
+        for block in cfg.all_blocks():
+            for inst in block.insts.ret_insts():
+                self.add_inst(inst, block)
+        count('def-use insts', len(self.insts))
+
+    # ++++++++ Queries ++++++++
+    def definitions(self, var: Variable) -> KeysView[MIRInstId]:
+        """
+        :return: the ids of the insts defining var.
+        """
+        return self.defs.get(var, { }).keys()
+
+    def definition(self, var: Variable) -> Optional[MIRInstId]:
+        """
+        :return: the id of the inst defining var, the first one if there are several.
+        """
+        defs = self.defs.get(var)
+        return next(iter(defs)) if defs else None
+
+    def users(self, var: Variable) -> KeysView[MIRInstId]:
+        """
+        :return: the ids of the insts using var, an inst using var twice is listed once.
+        """
+        return self.uses.get(var, { }).keys()
+
+    def use_counts(self, var: Variable) -> ItemsView[MIRInstId, int]:
+        """
+        :return: (id, number of operands using var) of the insts using var.
+        """
+        return self.uses.get(var, { }).items()
+
+    def variables(self) -> Iterable[Variable]:
+        """
+        :return: every variable defined or used.
+        """
+        return self.defs.keys() | self.uses.keys()
+
+    def inst(self, inst_id: MIRInstId) -> MIRInst:
+        return self.insts[inst_id]
+
+    def block_of(self, inst_id: MIRInstId) -> BasicBlock:
+        return self.blocks[inst_id]
+
+    def defining_blocks(self, var: Variable) -> List[BasicBlock]:
+        return [self.blocks[inst_id] for inst_id in self.definitions(var)]
+
+    # ++++++++ Updates ++++++++
+    def add_inst(self, inst: MIRInst, block: BasicBlock):
+        """
+        Index a new inst of block.
+        """
+        inst_id = inst.unique_id
+        def_var = _def_var(inst)
+        used_vars = _used_vars(inst)
+
+        self.insts[inst_id] = inst
+        self.blocks[inst_id] = block
+        self._indexed[inst_id] = (def_var, used_vars)
+
+        if def_var is not None:
+            defs = self.defs.get(def_var)
+            if defs is None:
+                defs = self.defs[def_var] = { }
+            defs[inst_id] = None
+        for var in used_vars:
+            users = self.uses.get(var)
+            if users is None:
+                users = self.uses[var] = { }
+            users[inst_id] = users.get(inst_id, 0) + 1
+
+    def remove_inst(self, inst: MIRInst):
+        """
+        Forget a removed inst.
+        """
+        inst_id = inst.unique_id
+        indexed = self._indexed.pop(inst_id, None)
+        if indexed is None:
+            return
+        def_var, used_vars = indexed
+        del self.insts[inst_id]
+        del self.blocks[inst_id]
+
+        if def_var is not None:
+            self._discard(self.defs, def_var, inst_id)
+        for var in used_vars:
+            self._discard(self.uses, var, inst_id)
+
+    def update_inst(self, inst: MIRInst):
+        """
+        Re-index an inst whose operands or result have changed.
+        """
+        block = self.blocks[inst.unique_id]
+        self.remove_inst(inst)
+        self.add_inst(inst, block)
+
+    @staticmethod
+    def _discard(chains: Dict[Variable, dict], var: Variable, inst_id: MIRInstId):
+        insts = chains.get(var)
+        if insts is None:
+            return
+        insts.pop(inst_id, None)
+        if not insts:
+            del chains[var]
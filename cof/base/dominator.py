@@ -0,0 +1,197 @@
+from abc import ABC, abstractmethod
+from typing import Dict, List
+
+from cof.base.bb import BasicBlockId
+
+
+def reverse_post_order(cfg: 'ControlFlowGraph') -> List[BasicBlockId]:
+    """
+    Iterative depth first search from the root, successors are visited in
+    the order of cfg.succ. Unreachable blocks are not included.
+    :param cfg:
+    :return: block ids in reverse postorder
+    """
+    post_order: List[BasicBlockId] = []
+    visited: set[BasicBlockId] = {cfg.root.id}
+    stack = [(cfg.root.id, iter(cfg.succ[cfg.root.id]))]
+
+    while stack:
+        node, succ_iter = stack[-1]
+        for succ in succ_iter:
+            if succ not in visited:
+                visited.add(succ)
+                stack.append((succ, iter(cfg.succ[succ])))
+                break
+        else:
+            stack.pop()
+            post_order.append(node)
+
+    post_order.reverse()
+    return post_order
+
+
+class DominatorEngine(ABC):
+    """
+    Compute the immediate dominator of every block.
+
+    The result maps each block id (in ascending order) to the id of its
+    immediate dominator, the root and unreachable blocks are mapped to -1.
+    """
+    def __init__(self, cfg: 'ControlFlowGraph'):
+        self.cfg: 'ControlFlowGraph' = cfg
+
+    @abstractmethod
+    def idom_comp(self) -> Dict[BasicBlockId, BasicBlockId]:
+        pass
+
+    def _ret_idom(self, vertex: List[BasicBlockId], idom_num: List[int]) -> Dict[BasicBlockId, BasicBlockId]:
+        """
+        Convert an idom array over the engine numbering back to block ids.
+        :param vertex: number -> block id
+        :param idom_num: number -> number of the immediate dominator
+        :return:
+        """
+        idom: Dict[BasicBlockId, BasicBlockId] = {i: -1 for i in sorted(self.cfg.block_id_set)}
+        for num in range(1, len(vertex)):
+            idom[vertex[num]] = vertex[idom_num[num]]
+        return idom
+
+
+class CooperHarveyKennedyDominator(DominatorEngine):
+    """
+    "A Simple, Fast Dominance Algorithm", Cooper, Harvey and Kennedy.
+
+    Blocks are numbered in reverse postorder and the idom array is iterated
+    to a fixpoint, two dominator tree paths are intersected by walking the
+    deeper (larger numbered) finger upwards.
+    """
+    def idom_comp(self) -> Dict[BasicBlockId, BasicBlockId]:
+        rpo: List[BasicBlockId] = reverse_post_order(self.cfg)
+        number: Dict[BasicBlockId, int] = {b: i for i, b in enumerate(rpo)}
+
+        # predecessors in rpo numbering, unreachable ones are dropped.
+        preds: List[List[int]] = [
+            [number[p] for p in self.cfg.pred[b] if p in number] for b in rpo
+        ]
+
+        undefined = -1
+        doms: List[int] = [undefined] * len(rpo)
+        doms[0] = 0
+
+        def intersect(finger1: int, finger2: int) -> int:
+            while finger1 != finger2:
+                while finger1 > finger2:
+                    finger1 = doms[finger1]
+                while finger2 > finger1:
+                    finger2 = doms[finger2]
+            return finger1
+
+        change = True
+        while change:
+            change = False
+            for b in range(1, len(rpo)):
+                new_idom = undefined
+                for p in preds[b]:
+                    if doms[p] == undefined:
+                        continue
+                    new_idom = p if new_idom == undefined else intersect(p, new_idom)
+
+                if doms[b] != new_idom:
+                    doms[b] = new_idom
+                    change = True
+
+        return self._ret_idom(rpo, doms)
+
+
+class LengauerTarjanDominator(DominatorEngine):
+    """
+    Lengauer-Tarjan with path compression (the "simple" variant, O(E log N)).
+
+    Blocks are numbered in depth first preorder. Semi-dominators are
+    computed in reverse preorder, then the immediate dominators are fixed
+    up in a final forward pass.
+    """
+    def idom_comp(self) -> Dict[BasicBlockId, BasicBlockId]:
+        succ = self.cfg.succ
+
+        # depth first preorder numbering
+        vertex: List[BasicBlockId] = []
+        number: Dict[BasicBlockId, int] = {}
+        parent: List[int] = []
+
+        stack = [(self.cfg.root.id, -1)]
+        while stack:
+            node, p = stack.pop()
+            if node in number:
+                continue
+            number[node] = len(vertex)
+            vertex.append(node)
+            parent.append(p)
+            for s in reversed(succ[node]):
+                if s not in number:
+                    stack.append((s, number[node]))
+
+        n = len(vertex)
+        preds: List[List[int]] = [
+            [number[p] for p in self.cfg.pred[b] if p in number] for b in vertex
+        ]
+
+        semi: List[int] = list(range(n))
+        idom: List[int] = [0] * n
+        same_dom: List[int] = [-1] * n
+        ancestor: List[int] = [-1] * n
+        best: List[int] = list(range(n))
+        bucket: List[List[int]] = [[] for _ in range(n)]
+
+        def ancestor_with_lowest_semi(v: int) -> int:
+            # iterative form of the recursive path compression
+            path: List[int] = []
+            u = v
+            while ancestor[ancestor[u]] != -1:
+                path.append(u)
+                u = ancestor[u]
+            b = best[u]
+            while path:
+                w = path.pop()
+                ancestor[w] = ancestor[u]
+                if semi[b] < semi[best[w]]:
+                    best[w] = b
+                b = best[w]
+                u = w
+            return b
+
+        for w in range(n - 1, 0, -1):
+            p = parent[w]
+            s = p
+            for v in preds[w]:
+                if v <= w:
+                    s_prime = v
+                else:
+                    s_prime = semi[ancestor_with_lowest_semi(v)]
+                if s_prime < s:
+                    s = s_prime
+            semi[w] = s
+            bucket[s].append(w)
+
+            # link
+            ancestor[w] = p
+
+            for v in bucket[p]:
+                y = ancestor_with_lowest_semi(v)
+                if semi[y] == semi[v]:
+                    idom[v] = p
+                else:
+                    same_dom[v] = y
+            bucket[p] = []
+
+        for w in range(1, n):
+            if same_dom[w] != -1:
+                idom[w] = idom[same_dom[w]]
+
+        return self._ret_idom(vertex, idom)
+
+
+dominator_engines: Dict[str, type[DominatorEngine]] = {
+    'cooper-harvey-kennedy': CooperHarveyKennedyDominator,
+    'lengauer-tarjan': LengauerTarjanDominator,
+}
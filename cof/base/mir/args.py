@@ -2,6 +2,9 @@ from typing import List
 
 
 class Args:
+
+    __slots__ = ('args',)
+
     def __init__(self, args: List):
         self.args = args
     def __repr__(self):
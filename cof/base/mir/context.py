@@ -0,0 +1,136 @@
+from array import array
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, Iterator, Optional
+
+from cof.base.mir.storage import MIRInstTable, NO_ROW
+from cof.base.mir.variable import Variable, VariableScope
+
+type MIRInstId = int
+
+
+class MIRContext:
+    """
+    Instruction ids, instruction storage and the id -> row index of one IR
+    module.
+
+    New instructions are numbered and registered in the current context,
+    see use_context(). Dropping the module (parser, instructions and
+    context) releases every instruction it has ever registered, release()
+    frees the instructions of a single function that is done, and modules
+    processed in different threads or tasks never share ids.
+    """
+    def __init__(self, last_id: MIRInstId = 0):
+        self.last_id: MIRInstId = last_id
+        # id - first_id -> row of the registered instruction, ids are dense
+        # so an array is a fraction of the size of a dict.
+        self.rows_by_id: array = array('i')
+        self.first_id: MIRInstId = 0
+        # rows of every instruction and operand created in this context
+        self.inst_table: MIRInstTable = MIRInstTable()
+        # varname -> interned local variable
+        self.variables: Dict[str, Variable] = { }
+
+    def new_id(self) -> MIRInstId:
+        self.last_id += 1
+        return self.last_id
+
+    def register(self, inst: 'MIRInst') -> None:
+        inst_id = inst.unique_id
+        rows = self.rows_by_id
+        if not rows:
+            self.first_id = inst_id
+        index = inst_id - self.first_id
+        if index < 0:
+            self.rows_by_id = rows = array('i', [NO_ROW]) * -index + rows
+            self.first_id = inst_id
+            index = 0
+        elif index >= len(rows):
+            rows.extend(array('i', [NO_ROW]) * (index + 1 - len(rows)))
+        rows[index] = inst._row
+
+    def register_rows(self, first_id: MIRInstId, rows: Iterable[int]) -> None:
+        """
+        Register the instructions with the ids first_id, first_id + 1, ...
+        at rows, in place of all registered instructions.
+        """
+        self.rows_by_id = array('i', rows)
+        self.first_id = first_id
+
+    def unregister(self, inst: 'MIRInst') -> None:
+        index = inst.unique_id - self.first_id
+        if 0 <= index < len(self.rows_by_id):
+            self.rows_by_id[index] = NO_ROW
+
+    def release(self, insts: Iterable['MIRInst']) -> None:
+        """
+        Unregister insts and recycle their rows in the instruction table,
+        the instructions must not be used afterwards. The ids released
+        first are dropped from the front of rows_by_id.
+        """
+        rows = [ ]
+        for inst in insts:
+            self.unregister(inst)
+            rows.append(inst._row)
+        if self.inst_table.release(rows):
+            table = self.inst_table
+            self.variables = {name: var for name, var in self.variables.items() if table.is_interned(var)}
+
+        rows_by_id = self.rows_by_id
+        start = 0
+        while start < len(rows_by_id) and rows_by_id[start] == NO_ROW:
+            start += 1
+        if start:
+            del rows_by_id[:start]
+            self.first_id += start
+
+    def row_by_id(self, inst_id: MIRInstId) -> int:
+        """
+        :return: the row of the registered instruction, NO_ROW if there is none.
+        """
+        index = inst_id - self.first_id
+        if 0 <= index < len(self.rows_by_id):
+            return self.rows_by_id[index]
+        return NO_ROW
+
+    def inst_by_id(self, inst_id: MIRInstId) -> Optional['MIRInst']:
+        row = self.row_by_id(inst_id)
+        if row == NO_ROW:
+            return None
+        # cof.base.mir.inst imports this module
+        from cof.base.mir.inst import MIRInst
+        return MIRInst.view(self.inst_table, row)
+
+    def variable(self, varname: str) -> Variable:
+        """
+        Return the local variable named varname, every call with the same
+        name returns the same object.
+        """
+        var = self.variables.get(varname)
+        if var is None:
+            var = self.inst_table.canonical(Variable(varname, VariableScope.Local))
+            self.variables[varname] = var
+        return var
+
+
+# used when no module context is active, e.g. by scripts that build
+# instructions by hand.
+_default_context = MIRContext()
+_current_context: ContextVar[MIRContext] = ContextVar('mir_context', default=_default_context)
+
+
+def current_context() -> MIRContext:
+    return _current_context.get()
+
+
+@contextmanager
+def use_context(context: MIRContext) -> Iterator[MIRContext]:
+    """
+    Make context the current context of this thread (or task) until the
+    with block exits.
+    """
+    token = _current_context.set(context)
+    try:
+        yield context
+    finally:
+        _current_context.reset(token)
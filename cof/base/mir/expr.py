@@ -6,7 +6,7 @@ from cof.base.mir.operand import Operand
 from cof.base.mir.operator import op_str, Op
 
 
-@dataclass
+@dataclass(slots=True)
 class Expression:
     """
     Representation of an expression in the program.
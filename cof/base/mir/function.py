@@ -1,6 +1,6 @@
+from cof.base.mir.context import current_context
 from cof.base.mir.inst import MIRInsts
 from cof.base.mir.operand import OperandType
-from cof.base.mir.variable import Variable, VariableScope
 
 
 class MIRFunction:
@@ -12,9 +12,9 @@ class MIRFunction:
         self._read_args(args)
 
     def _read_args(self, args: list):
+        context = current_context()
         for a in args:
-            new_var = Variable(a, VariableScope.Local)
-            self.args.append(new_var)
+            self.args.append(context.variable(a))
 
     def __eq__(self, other):
         return self.func_name == other.func_name and self.args == self.args
@@ -1,26 +1,33 @@
+from array import array
+from collections import deque
+from itertools import repeat
 from typing import Optional, List, Callable, Any, Union, Dict
 
+from cof.base.mir.context import current_context, MIRInstId
 from cof.base.mir.operand import Operand, OperandType, Const_Operand_Type
+from cof.base.mir.storage import MIRInstTable, NO_OPERAND, NO_ROW
 from cof.base.mir.operator import Op, op_str, Evaluatable_Op, Arithmetic_Op, Assignment_Op, Expression_Op
 from cof.base.mir.variable import Variable
-from cof.base.ssa import SSAVariable
 
 # ++++++++++++++++++++++++ MIR ++++++++++++++++++++
 
-type MIRInstId = int
 type MIRInstAddr = int
 
-mir_inst_id = 0
+# opcode in an MIRInstTable -> Op
+_op_by_code = {op.value: op for op in Op}
+# operand views are created on every operand access, skip __init__
+_new_operand = Operand.__new__
+
 def new_id() -> MIRInstId:
-    global mir_inst_id
-    mir_inst_id += 1
-    return mir_inst_id
+    return current_context().new_id()
 
 def _val(value) -> str:
     return str(value) if value else ""
 
 class MIRInst:
     """
+    A view of a row of the MIRInstTable of the context it was created in,
+    its fields and operands are read from and written to the table columns.
 
     if cond goto dest_addr
         inst.op = Op.IF
@@ -39,21 +46,108 @@ class MIRInst:
         inst.operand2 = Operand(Arg( arg1, arg 2))
 
     """
+    __slots__ = ('_table', '_row')
+
     def __init__(self, offset, op, operand1, operand2, result):
-        self.unique_id: MIRInstId = new_id()
-        # self.id: MIRInstId = 0
-        self.addr: MIRInstAddr = 0
-        self.offset: MIRInstAddr = offset
-        self.op = op
-        self.operand1: Optional[Operand] = operand1
-        self.operand2: Optional[Operand] = operand2
-        self.result: Optional[Operand] = result
+        context = current_context()
+        self._table: MIRInstTable = context.inst_table
+        self._row: int = self._table.new_inst(context.new_id(), offset, op.value)
+        self.operand1 = operand1
+        self.operand2 = operand2
+        self.result = result
+
+    @staticmethod
+    def view(table: MIRInstTable, row: int) -> 'MIRInst':
+        """
+        :return: a new view of an existing row of table.
+        """
+        inst = MIRInst.__new__(MIRInst)
+        inst._table = table
+        inst._row = row
+        return inst
+
+    def __reduce__(self):
+        # unpickled and copied instructions are rows of the current context
+        return _restore_inst, (
+            self.unique_id, self.addr, self.offset, self.op,
+            self.operand1, self.operand2, self.result
+        )
+
+    # ++++++++ columns ++++++++
+    @property
+    def unique_id(self) -> MIRInstId:
+        return self._table.unique_id[self._row]
+
+    @unique_id.setter
+    def unique_id(self, unique_id: MIRInstId):
+        self._table.unique_id[self._row] = unique_id
+
+    @property
+    def addr(self) -> MIRInstAddr:
+        return self._table.addr[self._row]
+
+    @addr.setter
+    def addr(self, addr: MIRInstAddr):
+        self._table.addr[self._row] = addr
+
+    @property
+    def offset(self) -> MIRInstAddr:
+        return self._table.offset[self._row]
+
+    @offset.setter
+    def offset(self, offset: MIRInstAddr):
+        self._table.offset[self._row] = offset
+
+    @property
+    def op(self) -> Op:
+        return _op_by_code[self._table.op[self._row]]
+
+    @op.setter
+    def op(self, op: Op):
+        self._table.op[self._row] = op.value
+
+    def _operand(self, column) -> Optional[Operand]:
+        ref = column[self._row]
+        if ref == NO_OPERAND:
+            return None
+        operand = _new_operand(Operand)
+        operand._table = self._table
+        operand._ref = ref
+        return operand
+
+    def _set_operand(self, column, operand: Optional[Operand]):
+        column[self._row] = NO_OPERAND if operand is None else operand._bind(self._table)
+
+    @property
+    def operand1(self) -> Optional[Operand]:
+        return self._operand(self._table.operand1)
+
+    @operand1.setter
+    def operand1(self, operand: Optional[Operand]):
+        self._set_operand(self._table.operand1, operand)
+
+    @property
+    def operand2(self) -> Optional[Operand]:
+        return self._operand(self._table.operand2)
+
+    @operand2.setter
+    def operand2(self, operand: Optional[Operand]):
+        self._set_operand(self._table.operand2, operand)
+
+    @property
+    def result(self) -> Optional[Operand]:
+        return self._operand(self._table.result)
+
+    @result.setter
+    def result(self, operand: Optional[Operand]):
+        self._set_operand(self._table.result, operand)
+
     def __hash__(self):
-        return hash(self.unique_id)
+        return hash(self._table.unique_id[self._row])
     def __eq__(self, other):
         # if not isinstance(other, MIRInst):
         #     return False
-        return self.unique_id == other.unique_id
+        return self._table.unique_id[self._row] == other._table.unique_id[other._row]
 
     def __str__(self):
         formatter = {
@@ -226,6 +320,7 @@ class MIRInst:
         return True
 
     def ret_var_by_pred_id_for_phi(self, pred_id) -> Optional[Variable]:
+        from cof.base.ssa import SSAVariable
         operand_list: List[Operand] = self.ret_operand_list()
         for operand in operand_list:
             assert operand.type == OperandType.SSA_VAR
@@ -241,36 +336,96 @@ class MIRInst:
         self.operand2 = None
 
 
+def _restore_inst(unique_id, addr, offset, op, operand1, operand2, result) -> MIRInst:
+    inst = MIRInst.__new__(MIRInst)
+    inst._table = current_context().inst_table
+    inst._row = inst._table.new_inst(unique_id, offset, op.value)
+    inst.addr = addr
+    inst.operand1 = operand1
+    inst.operand2 = operand2
+    inst.result = result
+    return inst
+
+
+def _restore_insts(insts: List[MIRInst], num: int, phi_insts_idx_end: int) -> 'MIRInsts':
+    # the instructions are unpickled already, they are not registered
+    mir_insts = MIRInsts()
+    mir_insts._table = insts[0]._table if insts else None
+    mir_insts._rows = array('i', [inst._row for inst in insts])
+    mir_insts.num = num
+    mir_insts.phi_insts_idx_end = phi_insts_idx_end
+    return mir_insts
 
-class MIRInsts:
 
-    global_insts_dict_by_id: Dict[MIRInstId, MIRInst] = { }
-    # insts_dict_by_id: Dict[MIRInstId, MIRInst] = { }
+_view = MIRInst.view
+_new_inst = MIRInst.__new__
+
+
+class MIRInsts:
+    """
+    A sequence of instructions, stored as the array of their rows in the
+    MIRInstTable of their context. The instructions returned are views
+    created on access, every call returns new lists and new view objects.
+    """
 
     def __init__(self, insts:Optional[List[MIRInst]]=None):
 
-        self.ir_insts: List[MIRInst] = []
+        self._table: Optional[MIRInstTable] = None
+        self._rows: array = array('i')
         self.num: int = 0
-        self.insts_dict_by_id: Dict[MIRInstId, MIRInst] = { }
+        # id -> inst, built on the first lookup and dropped when insts change
+        self._insts_by_id: Optional[Dict[MIRInstId, MIRInst]] = None
         self.phi_insts_idx_end: int = 0
 
         self._initialize(insts)
 
+    @classmethod
+    def from_rows(cls, table: MIRInstTable, rows: array, phi_insts_idx_end: int = 0) -> 'MIRInsts':
+        """
+        :return: the instructions of rows of table, which are not registered.
+        """
+        mir_insts = cls()
+        mir_insts._table = table
+        mir_insts._rows = rows
+        mir_insts.num = len(rows)
+        mir_insts.phi_insts_idx_end = phi_insts_idx_end
+        return mir_insts
+
     def _initialize(self, insts):
         if insts:
-            self.ir_insts = insts
-            self.insts_dict_by_id = {inst.unique_id: inst for inst in insts}
+            self._rows = self._rows_of(insts)
             self.num = len(insts)
 
-        for inst in self.ir_insts:
-            if inst.unique_id not in MIRInsts.global_insts_dict_by_id:
-                MIRInsts.global_insts_dict_by_id[inst.unique_id] = inst
+        context = current_context()
+        for inst in insts or ():
+            if context.row_by_id(inst.unique_id) == NO_ROW:
+                context.register(inst)
+
+    def _rows_of(self, insts: List[MIRInst]) -> array:
+        if insts and self._table is None:
+            self._table = insts[0]._table
+        return array('i', [inst._row for inst in insts])
+
+    def _row_of(self, inst: MIRInst) -> int:
+        if self._table is None:
+            self._table = inst._table
+        return inst._row
+
+    def _views(self, rows) -> List[MIRInst]:
+        # built by map() without a loop in Python
+        views = list(map(_new_inst, repeat(MIRInst, len(rows))))
+        deque(map(setattr, views, repeat('_table'), repeat(self._table)), maxlen=0)
+        deque(map(setattr, views, repeat('_row'), rows), maxlen=0)
+        return views
+
+    def __reduce__(self):
+        return _restore_insts, (self.ret_insts(), self.num, self.phi_insts_idx_end)
 
     def __str__(self):
-        return "\n".join(map(str, self.ir_insts))
+        return "\n".join(map(str, self.ret_insts()))
 
     def assign_addr(self, base: int = 0) -> int:
-        for i in self.ir_insts:
+        for i in self.ret_insts():
             i.addr = base
             if i.op == Op.FUNCTION_DEF:
                 func_code: 'MIRInsts' = i.operand1.value.insts
@@ -292,23 +447,19 @@ class MIRInsts:
     #             return True
     #     return False
     def inst_exist(self, predicate: Callable[[MIRInst], bool]) -> bool:
-        for inst in self.ir_insts:
+        for inst in self.ret_insts():
             if predicate(inst):
                 return True
         return False
 
     def inst_exist_by_key(self, *, key: str, value: Any) -> bool:
-        for inst in self.ir_insts:
+        for inst in self.ret_insts():
             if getattr(inst, key) == value:
                 return True
         return False
 
     def inst_exist_by_id(self, inst_id: int) -> bool:
-        result =  self.insts_dict_by_id.get(inst_id, False)
-        if result is not False:
-            return True
-        else:
-            return False
+        return inst_id in self.insts_dict_by_id
 
     def inst_exist_by_addr(self, addr: int) -> bool:
         for inst in self.ret_insts():
@@ -316,11 +467,56 @@ class MIRInsts:
                 return True
         return False
 
+    @property
+    def insts_dict_by_id(self) -> Dict[MIRInstId, MIRInst]:
+        if self._insts_by_id is None:
+            self._insts_by_id = {inst.unique_id: inst for inst in self.ret_insts()}
+        return self._insts_by_id
+
+    def reindex(self) -> None:
+        """
+        Drop the id index, call it after the ids of instructions have changed.
+        """
+        self._insts_by_id = None
+
     def add_phi_inst(self, phi_inst: MIRInst) -> None:
-        self.ir_insts.insert(0, phi_inst)
+        self._rows.insert(0, self._row_of(phi_inst))
         self.phi_insts_idx_end += 1
-        self.insts_dict_by_id[phi_inst.unique_id] = phi_inst
-        MIRInsts.global_insts_dict_by_id[phi_inst.unique_id] = phi_inst
+        self._insts_by_id = None
+        current_context().register(phi_inst)
+
+    def add_phi_insts(self, phi_insts: List[MIRInst]) -> None:
+        """
+        Same as add_phi_inst() for each of phi_insts in turn, the last one
+        ends up first.
+        """
+        self._rows[0:0] = self._rows_of(phi_insts[::-1])
+        self.phi_insts_idx_end += len(phi_insts)
+        self._insts_by_id = None
+        context = current_context()
+        for phi_inst in phi_insts:
+            context.register(phi_inst)
+
+    def splice_insts(self, before: Dict[MIRInstId, List[MIRInst]]) -> None:
+        """
+        Insert instructions in a single pass over the list.
+        :param before: the instructions to insert in front of the instruction with this id.
+        """
+        if not before:
+            return
+        context = current_context()
+        unique_ids = self._table.unique_id
+        rows = array('i')
+        for row in self._rows:
+            new_insts = before.get(unique_ids[row])
+            if new_insts:
+                for i in new_insts:
+                    context.register(i)
+                rows.extend(self._rows_of(new_insts))
+                self.num += len(new_insts)
+            rows.append(row)
+        self._rows = rows
+        self._insts_by_id = None
 
     def insert_insts(self, insts: Union[MIRInst, List[MIRInst]], index: Optional[int] = None) -> None:
 
@@ -328,33 +524,51 @@ class MIRInsts:
             index = self.num
 
         if isinstance(insts, MIRInst):
-            self.ir_insts.insert(index, insts)
-            self.insts_dict_by_id[insts.unique_id] = insts
+            self._rows.insert(index, self._row_of(insts))
+            self._insts_by_id = None
 
-            MIRInsts.global_insts_dict_by_id[insts.unique_id] = insts
+            current_context().register(insts)
 
             self.num += 1
 
         elif isinstance(insts, List) and all(isinstance(item, MIRInst) for item in insts):
-            self.ir_insts[index:index] = insts
+            self._rows[index:index] = self._rows_of(insts)
             self.num += len(insts)
+            self._insts_by_id = None
+            context = current_context()
             for i in insts:
-                self.insts_dict_by_id[i.unique_id] = i
-
-                MIRInsts.global_insts_dict_by_id[i.unique_id] = i
+                context.register(i)
 
     def remove_insts(self, insts: Union[MIRInst, List[MIRInst]]) -> None:
         if isinstance(insts, MIRInst):
-            self.ir_insts.remove(insts)
-            self.insts_dict_by_id.pop(insts.unique_id)
-            MIRInsts.global_insts_dict_by_id.pop(insts.unique_id)
+            self._rows.remove(insts._row)
+            self._insts_by_id = None
+            current_context().unregister(insts)
 
         if isinstance(insts, List):
             for inst in insts:
-                self.ir_insts.remove(inst)
-                self.insts_dict_by_id.pop(inst.unique_id)
+                self._rows.remove(inst._row)
+                self._insts_by_id = None
+
+                current_context().unregister(inst)
 
-                MIRInsts.global_insts_dict_by_id.pop(inst.unique_id)
+    def remove_insts_by_pos(self, start_pos: int, end_pos: int) -> None:
+        """
+        Remove the instructions ret_insts_by_pos() returns, num counts the
+        remaining ones.
+        """
+        removed = self.ret_insts_by_pos(start_pos, end_pos)
+        if not removed:
+            return
+        context = current_context()
+        for inst in removed:
+            context.unregister(inst)
+        phi_insts = self._rows[: self.phi_insts_idx_end]
+        del self._rows[start_pos:end_pos]
+        del phi_insts[start_pos:end_pos]
+        self.num -= len(removed)
+        self.phi_insts_idx_end = len(phi_insts)
+        self._insts_by_id = None
 
     def inst_by_id(self, inst_id: MIRInstId) -> Optional[MIRInst]:
         dest_inst = self.insts_dict_by_id.get(inst_id, None)
@@ -366,36 +580,40 @@ class MIRInsts:
         return dest_inst
 
     def find_inst_by_key(self, *, key: str, value: Any) -> Optional[MIRInst]:
-        for inst in self.ir_insts:
+        for inst in self.ret_insts():
             if getattr(inst, key) == value:
                 return inst
         return None
 
     # find_inst(lambda i: i.addr == 0x1000)
     def find_inst(self, predicate: Callable[[MIRInst], bool]) -> Optional[MIRInst]:
-        for inst in self.ir_insts:
+        for inst in self.ret_insts():
             if predicate(inst):
                 return inst
         return None
 
     def index_for_inst(self, inst: MIRInst) -> int:
-        return self.ir_insts.index(inst)
+        return self._rows.index(inst._row)
 
 
     def ret_inst_by_idx(self, index: int) -> MIRInst:
-        return self.ir_insts[index]
+        return _view(self._table, self._rows[index])
     def ret_insts_by_pos(self, start_pos: int, end_pos: int) -> List[MIRInst]:
-        return self.ir_insts[start_pos:end_pos]
+        return self._views(self._rows[start_pos:end_pos])
     def ret_insts(self) -> List[MIRInst]:
-        return self.ir_insts
+        return self._views(self._rows)
+    def ret_inst_ids(self) -> List[MIRInstId]:
+        if not self._rows:
+            return []
+        return list(map(self._table.unique_id.__getitem__, self._rows))
     def ret_phi_insts(self) -> List[MIRInst]:
-        return self.ir_insts[: self.phi_insts_idx_end]
+        return self._views(self._rows[: self.phi_insts_idx_end])
     def ret_ordinary_insts(self) -> List[MIRInst]:
-        return self.ir_insts[self.phi_insts_idx_end:]
+        return self._views(self._rows[self.phi_insts_idx_end:])
 
     def highset_addr(self) -> int:
-        return self.ir_insts[-1].offset
+        return self._table.offset[self._rows[-1]]
 
     def print(self):
-        for inst in self.ir_insts:
+        for inst in self.ret_insts():
             print(inst)
@@ -0,0 +1,458 @@
+"""
+    Binary MIR modules (.mirb).
+
+    A .mirb file holds the top level instructions and the functions of one
+    module in the layout of MIRInstTable, so loading it fills the columns of
+    a fresh context directly, without tokenizing or resolving labels.
+
+    layout
+
+        magic               b'MIRB'
+        version             varint
+        payload             zlib compressed:
+
+        string table        length column, utf-8 text of all strings
+        value table         one group of columns per kind of value:
+                            None/bool, int, big int, float, str, variable,
+                            SSA variable, argument list, function
+        function table      name, first argument, number of arguments,
+                            first row and number of rows of the body, number
+                            of φ instructions at the start of the body
+        instructions        op, offset, operand1, operand2, result columns
+        operand records     kind, value id columns
+        top level rows
+
+    A column is a varint item count followed by the items in little endian,
+    values and operand records are referred to by their position.
+    Instructions are stored in address order, the body of every function
+    follows its definition, and get the ids 1..n of the loading context in
+    that order. A branch target is stored as the id of its target in the
+    loaded module, i.e. the row of the target plus one.
+
+    Values are stored once. Constants and variables are interned like in
+    MIRInstTable, other values (SSA variables, argument lists, functions)
+    are deduplicated by identity, so operands that shared an object still
+    share one after loading. Operand records shared by several instructions
+    stay shared as well.
+"""
+import sys
+import zlib
+from array import array
+from itertools import accumulate, repeat
+from typing import Any, Dict, List, Tuple
+
+from cof.base.mir.args import Args
+from cof.base.mir.context import MIRContext, use_context
+from cof.base.mir.function import MIRFunction
+from cof.base.mir.inst import MIRInst, MIRInsts
+from cof.base.mir.operand import Operand, OperandType
+from cof.base.mir.operator import Op
+from cof.base.mir.storage import NO_OPERAND
+from cof.base.mir.variable import Variable, VariableScope
+
+MIRB_MAGIC = b'MIRB'
+MIRB_VERSION = 1
+MIRB_SUFFIX = '.mirb'
+
+# value groups, in the order they are stored
+_SPECIAL = 0
+_INT = 1
+_BIG_INT = 2
+_FLOAT = 3
+_STR = 4
+_VAR = 5
+_SSA_VAR = 6
+_ARGS = 7
+_FUNCTION = 8
+_NUM_GROUPS = 9
+
+_specials = [None, False, True]
+_special_codes = {None: 0, False: 1, True: 2}
+_INT64_MIN = -(1 << 63)
+_INT64_MAX = (1 << 63) - 1
+
+_scope_by_code = {scope.value: scope for scope in VariableScope}
+_type_by_code = {t.value: t for t in OperandType}
+_inst_columns = ('op', 'offset', 'operand1', 'operand2', 'result')
+_record_columns = ('kind', 'value_id')
+
+type ValueRef = Tuple[int, int]
+
+
+# ++++++++ encoding ++++++++
+
+def _put_varint(out: bytearray, value: int):
+    while value > 0x7f:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _get_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    """
+    :return: the value and the position after it.
+    """
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+def _put_column(out: bytearray, typecode: str, items):
+    column = items if isinstance(items, array) else array(typecode, items)
+    _put_varint(out, len(column))
+    if sys.byteorder != 'little':
+        column = array(typecode, column)
+        column.byteswap()
+    out += column.tobytes()
+
+def _get_column(data: bytes, pos: int, typecode: str) -> Tuple[array, int]:
+    count, pos = _get_varint(data, pos)
+    column = array(typecode)
+    end = pos + count * column.itemsize
+    column.frombytes(data[pos:end])
+    if sys.byteorder != 'little':
+        column.byteswap()
+    return column, end
+
+
+# ++++++++ save ++++++++
+
+class _ValueWriter:
+    """
+    Collect the values of a module by group, a value is referred to by its
+    group and its position in the group until the value ids are known.
+    """
+
+    def __init__(self, funcs: List[MIRFunction]):
+        self.strings: List[str] = [ ]
+        self.string_ids: Dict[str, int] = { }
+        self.groups: List[list] = [[] for _ in range(_NUM_GROUPS)]
+        # interning key or id() of the object -> reference
+        self.refs: Dict[Any, ValueRef] = { }
+        # keep the objects of id() keys alive
+        self.objects: List[Any] = [ ]
+        self.func_ids: Dict[int, int] = {id(func): i for i, func in enumerate(funcs)}
+
+    def string(self, s: str) -> int:
+        string_id = self.string_ids.get(s)
+        if string_id is None:
+            string_id = self.string_ids[s] = len(self.strings)
+            self.strings.append(s)
+        return string_id
+
+    def value(self, value: Any) -> ValueRef:
+        from cof.base.ssa import SSAVariable
+
+        value_type = type(value)
+        if value_type is SSAVariable or value_type is Args or value_type is MIRFunction:
+            key = id(value)
+        else:
+            key = (value_type, value.hex() if value_type is float else value)
+        ref = self.refs.get(key)
+        if ref is not None:
+            return ref
+
+        if value is None or value_type is bool:
+            group, item = _SPECIAL, _special_codes[value]
+        elif value_type is int:
+            if _INT64_MIN <= value <= _INT64_MAX:
+                group, item = _INT, value
+            else:
+                group, item = _BIG_INT, self.string(str(value))
+        elif value_type is float:
+            group, item = _FLOAT, value
+        elif value_type is str:
+            group, item = _STR, self.string(value)
+        elif value_type is Variable:
+            group, item = _VAR, (self.string(value.varname), value.scope.value << 1 | value.compiler_generated)
+        elif value_type is SSAVariable:
+            group, item = _SSA_VAR, (
+                self.value(value.original_variable), value.version, value.block_id, value.value_number
+            )
+            self.objects.append(value)
+        elif value_type is Args:
+            group, item = _ARGS, [(arg.type.value, self.value(arg.value)) for arg in value.args]
+            self.objects.append(value)
+        elif value_type is MIRFunction:
+            if id(value) not in self.func_ids:
+                raise ValueError(f"function {value.func_name} is not in the function list")
+            group, item = _FUNCTION, self.func_ids[id(value)]
+        else:
+            raise ValueError(f"cannot save a value of type {value_type.__name__}")
+
+        items = self.groups[group]
+        ref = self.refs[key] = (group, len(items))
+        items.append(item)
+        return ref
+
+    def write(self, out: bytearray) -> List[int]:
+        """
+        Write the string and value tables.
+        :return: the first value id of every group.
+        """
+        bases = [0, *accumulate(map(len, self.groups))]
+
+        def ids(refs):
+            return [bases[group] + i for group, i in refs]
+
+        text = ''.join(self.strings)
+        encoded = text.encode('utf-8')
+        _put_column(out, 'i', map(len, self.strings))
+        _put_varint(out, len(encoded))
+        out += encoded
+
+        groups = self.groups
+        _put_column(out, 'B', groups[_SPECIAL])
+        _put_column(out, 'q', groups[_INT])
+        _put_column(out, 'i', groups[_BIG_INT])
+        _put_column(out, 'd', groups[_FLOAT])
+        _put_column(out, 'i', groups[_STR])
+        _put_column(out, 'i', (name for name, _ in groups[_VAR]))
+        _put_column(out, 'B', (flags for _, flags in groups[_VAR]))
+        _put_column(out, 'i', ids(var for var, _, _, _ in groups[_SSA_VAR]))
+        for field in (1, 2, 3):
+            _put_column(out, 'i', (item[field] for item in groups[_SSA_VAR]))
+        _put_column(out, 'i', map(len, groups[_ARGS]))
+        _put_column(out, 'B', (kind for args in groups[_ARGS] for kind, _ in args))
+        _put_column(out, 'i', ids(ref for args in groups[_ARGS] for _, ref in args))
+        _put_column(out, 'i', groups[_FUNCTION])
+        return bases
+
+
+def _module_rows(insts: MIRInsts, func_list: List[MIRFunction]) -> Tuple[List[MIRInst], List[int], Dict[int, Tuple[int, int]]]:
+    """
+    :return: all instructions in address order, the rows of the top level
+    instructions and id(function) -> (first row, number of rows) of its body.
+    """
+    rows: List[MIRInst] = [ ]
+    top_rows: List[int] = [ ]
+    bodies: Dict[int, Tuple[int, int]] = { }
+
+    def add_body(func: MIRFunction):
+        body = func.insts.ret_insts()
+        bodies[id(func)] = (len(rows), len(body))
+        rows.extend(body)
+
+    for inst in insts.ret_insts():
+        top_rows.append(len(rows))
+        rows.append(inst)
+        if inst.is_func() and id(inst.operand1.value) not in bodies:
+            add_body(inst.operand1.value)
+
+    # functions without a definition in the top level code
+    for func in func_list:
+        if id(func) not in bodies:
+            add_body(func)
+
+    return rows, top_rows, bodies
+
+
+def save_mirb(insts: MIRInsts, func_list: List[MIRFunction], filename: str):
+    """
+    Save a module, the top level instructions and its functions, in the
+    .mirb format. Addresses are not saved, load_mirb() assigns them.
+    """
+    rows, top_rows, bodies = _module_rows(insts, func_list)
+    writer = _ValueWriter(func_list)
+    target_ids: Dict[int, int] = {inst.unique_id: row + 1 for row, inst in enumerate(rows)}
+
+    columns: Dict[str, list] = {name: [] for name in _inst_columns + _record_columns}
+    kind, value_refs = columns['kind'], columns['value_id']
+    # (table, operand record) -> operand record in the file
+    records: Dict[Tuple[int, int], int] = { }
+
+    def save_operand(table, ref: int) -> int:
+        if ref == NO_OPERAND:
+            return NO_OPERAND
+        record = records.get((id(table), ref))
+        if record is not None:
+            return record
+
+        code = table.kind[ref]
+        value = table.values[table.value_id[ref]]
+        if code == OperandType.PTR.value and type(value) is int:
+            if value not in target_ids:
+                raise ValueError(f"branch target {value} is not in the module")
+            value = target_ids[value]
+        record = records[(id(table), ref)] = len(kind)
+        kind.append(code)
+        value_refs.append(writer.value(value))
+        return record
+
+    for inst in rows:
+        table, row = inst._table, inst._row
+        columns['op'].append(table.op[row])
+        columns['offset'].append(table.offset[row])
+        columns['operand1'].append(save_operand(table, table.operand1[row]))
+        columns['operand2'].append(save_operand(table, table.operand2[row]))
+        columns['result'].append(save_operand(table, table.result[row]))
+
+    func_columns: List[list] = [[] for _ in range(6)]
+    arg_refs: List[ValueRef] = [ ]
+    for func in func_list:
+        first, count = bodies[id(func)]
+        for column, item in zip(func_columns, (
+                writer.string(func.func_name), len(arg_refs), len(func.args),
+                first, count, func.insts.phi_insts_idx_end)):
+            column.append(item)
+        arg_refs.extend(writer.value(arg) for arg in func.args)
+
+    payload = bytearray()
+    bases = writer.write(payload)
+    for column in func_columns:
+        _put_column(payload, 'i', column)
+    _put_column(payload, 'i', [bases[group] + i for group, i in arg_refs])
+    for name in _inst_columns:
+        _put_column(payload, 'B' if name == 'op' else 'i', columns[name])
+    columns['value_id'] = [bases[group] + i for group, i in value_refs]
+    for name in _record_columns:
+        _put_column(payload, 'B' if name == 'kind' else 'i', columns[name])
+    _put_column(payload, 'i', top_rows)
+
+    out = bytearray(MIRB_MAGIC)
+    _put_varint(out, MIRB_VERSION)
+    out += zlib.compress(payload, 1)
+
+    with open(filename, 'wb') as file:
+        file.write(out)
+
+
+# ++++++++ load ++++++++
+
+def _load_values(data: bytes, pos: int, context: MIRContext) -> Tuple[List[Any], List[str], int, int]:
+    """
+    Read the string and value tables and intern the values in the table of
+    context.
+    :return: the values, where functions are still function numbers, the
+    strings, the value id of the first function and the position after the
+    tables.
+    """
+    from cof.base.ssa import SSAVariable
+
+    lengths, pos = _get_column(data, pos, 'i')
+    size, pos = _get_varint(data, pos)
+    text = data[pos:pos + size].decode('utf-8')
+    pos += size
+    offsets = [0, *accumulate(lengths)]
+    strings = [text[start:end] for start, end in zip(offsets, offsets[1:])]
+
+    def column(typecode: str) -> list:
+        nonlocal pos
+        items, pos = _get_column(data, pos, typecode)
+        return items.tolist()
+
+    values: List[Any] = [ ]
+    # interning keys of MIRInstTable.intern()
+    keys: List[tuple] = [ ]
+
+    specials = [_specials[code] for code in column('B')]
+    values += specials
+    keys += [(type(value), value) for value in specials]
+    for ints in (column('q'), [int(strings[i]) for i in column('i')]):
+        values += ints
+        keys += zip(repeat(int), ints)
+    floats = column('d')
+    values += floats
+    keys += [(float, value.hex()) for value in floats]
+    strs = [strings[i] for i in column('i')]
+    values += strs
+    keys += zip(repeat(str), strs)
+
+    variables = [
+        Variable(strings[name], _scope_by_code[flags >> 1], bool(flags & 1))
+        for name, flags in zip(column('i'), column('B'))
+    ]
+    values += variables
+    keys += zip(repeat(Variable), variables)
+    context.variables.update(
+        (var.varname, var) for var in variables
+        if var.scope == VariableScope.Local and not var.compiler_generated
+    )
+    context.inst_table._value_ids.update(zip(keys, range(len(keys))))
+
+    originals, versions, block_ids, value_numbers = column('i'), column('i'), column('i'), column('i')
+    for original, version, block_id, value_number in zip(originals, versions, block_ids, value_numbers):
+        ssa_var = SSAVariable(values[original], version, value_number=value_number)
+        ssa_var.block_id = block_id
+        values.append(ssa_var)
+
+    lengths, kinds, arg_ids = column('i'), column('B'), column('i')
+    args = [Operand(_type_by_code[code], values[i]) for code, i in zip(kinds, arg_ids)]
+    for start, end in zip(accumulate(lengths, initial=0), accumulate(lengths)):
+        values.append(Args(args[start:end]))
+
+    first_func = len(values)
+    values += column('i')
+    return values, strings, first_func, pos
+
+
+def load_mirb(filename: str) -> Tuple[MIRInsts, List[MIRFunction], MIRContext]:
+    """
+    Load a module saved by save_mirb() into a new context, with addresses
+    assigned like MIRInsts.assign_addr() does.
+    :return: the top level instructions, the functions and the context of
+    the module.
+    """
+    with open(filename, 'rb') as file:
+        data = file.read()
+
+    if data[:len(MIRB_MAGIC)] != MIRB_MAGIC:
+        raise ValueError(f"{filename} is not a .mirb file")
+    version, pos = _get_varint(data, len(MIRB_MAGIC))
+    if version != MIRB_VERSION:
+        raise ValueError(f"unsupported .mirb version {version} of {filename}")
+    data = zlib.decompress(data[pos:])
+
+    context = MIRContext()
+    table = context.inst_table
+    values, strings, first_func, pos = _load_values(data, 0, context)
+
+    def column(typecode: str) -> array:
+        nonlocal pos
+        items, pos = _get_column(data, pos, typecode)
+        return items
+
+    with use_context(context):
+        names, first_args, num_args, firsts, counts, phi_ends = (column('i') for _ in range(6))
+        arg_ids = column('i')
+        func_list: List[MIRFunction] = [ ]
+        for name, first_arg, num in zip(names, first_args, num_args):
+            func = MIRFunction(strings[name], [ ])
+            func.args = [values[i] for i in arg_ids[first_arg:first_arg + num]]
+            func_list.append(func)
+        values[first_func:] = [func_list[i] for i in values[first_func:]]
+
+        for name in _inst_columns + _record_columns:
+            setattr(table, name, column('B' if name in ('op', 'kind') else 'i'))
+        top_rows = column('i')
+
+        num_insts = len(table.op)
+        table.values = values
+        table.own_values({OperandType.PTR.value})
+        table.unique_id = array('i', range(1, num_insts + 1))
+        table.addr = array('i', bytes(table.addr.itemsize * num_insts))
+        context.register_rows(1, range(num_insts))
+        context.last_id = num_insts
+
+        # rows are registered already, MIRInsts._initialize() is skipped
+        for func, first, count, phi_end in zip(func_list, firsts, counts, phi_ends):
+            func.insts = MIRInsts.from_rows(table, array('i', range(first, first + count)), phi_end)
+        insts = MIRInsts.from_rows(table, top_rows)
+
+        # MIRInsts.assign_addr(), bodies are contiguous rows
+        addr = 0
+        for row in top_rows:
+            table.addr[row] = addr
+            if table.op[row] == Op.FUNCTION_DEF.value:
+                body = values[table.value_id[table.operand1[row]]].insts
+                if body.num:
+                    first = body.ret_inst_by_idx(0)._row
+                    table.addr[first:first + body.num] = array('i', range(addr, addr + body.num))
+                addr += body.num
+            addr += 1
+
+    return insts, func_list, context
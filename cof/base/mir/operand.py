@@ -1,4 +1,8 @@
 from enum import Enum, auto
+from typing import Optional
+
+from cof.base.mir.context import current_context
+from cof.base.mir.storage import MIRInstTable
 
 
 
@@ -74,19 +78,88 @@ VAR = Type(OperandType.VAR)
 PTR = Type(OperandType.PTR)
 
 
+# operand kind code in an MIRInstTable -> OperandType
+_type_by_code = {t.value: t for t in OperandType}
+# branch targets own their pool entry, see MIRInstTable
+_PTR_CODE = OperandType.PTR.value
+
+
 class Operand:
+    """
+    An operand is either free, holding its type and value itself, or a view
+    of an operand record in an MIRInstTable (only _table and _ref are set).
+    A free operand that is put into an instruction becomes a view of the
+    record it is stored in, so it stays shared with the instruction.
+    """
+    __slots__ = ('_table', '_ref', '_type', '_value')
 
     # ++++++++ init ++++++++
     def __init__(self, op_type: OperandType, value):
-        self.type = op_type
-        self.value = value
+        self._table: Optional[MIRInstTable] = None
+        self._ref: int = -1
+        self._type: Optional[OperandType] = op_type
+        self._value = value
+
+    def _bind(self, table: MIRInstTable) -> int:
+        """
+        Return the operand record of self in table, a free operand is moved
+        into a new record and becomes a view of it.
+        """
+        if self._table is table:
+            return self._ref
+        op_type = self.type
+        ref = table.new_operand(op_type.value, self.value, own=op_type == OperandType.PTR)
+        if self._table is None:
+            self._table, self._ref = table, ref
+            self._type = self._value = None
+        return ref
+
+    @property
+    def type(self) -> OperandType:
+        table = self._table
+        if table is None:
+            return self._type
+        return _type_by_code[table.kind[self._ref]]
+
+    @type.setter
+    def type(self, op_type: OperandType):
+        table = self._table
+        if table is None:
+            self._type = op_type
+        else:
+            table.kind[self._ref] = op_type.value
+
+    @property
+    def value(self):
+        table = self._table
+        if table is None:
+            return self._value
+        return table.values[table.value_id[self._ref]]
+
+    @value.setter
+    def value(self, value):
+        table = self._table
+        if table is None:
+            self._value = value
+        else:
+            table.set_value(self._ref, value, own=table.kind[self._ref] == _PTR_CODE)
+
+    def __reduce__(self):
+        # copies, deep copies and pickles are free operands
+        return Operand, (self.type, self.value)
+
+    def _type_value(self) -> tuple:
+        table = self._table
+        if table is None:
+            return self._type, self._value
+        ref = self._ref
+        return _type_by_code[table.kind[ref]], table.values[table.value_id[ref]]
 
     def __eq__(self, other):
-        return True if self.type == other.type \
-                       and self.value == other.value else False
+        return self._type_value() == other._type_value()
 
     def __hash__(self):
-        return hash((self.type, self.value))
+        return hash(self._type_value())
 
     # ++++++++ str ++++++++
 
@@ -99,8 +172,7 @@ class Operand:
         }.get(self.type, self._format_const)
         return formatter()
     def _format_addr(self):
-        from cof.base.mir.inst import MIRInsts
-        return f"addr-{MIRInsts.global_insts_dict_by_id[self.value].addr}"
+        return f"addr-{current_context().inst_by_id(self.value).addr}"
     def _format_const(self):
         return str(self.value)
     def _val(self, operand: 'Operand'):
@@ -0,0 +1,245 @@
+"""
+    Struct-of-arrays storage of the instructions of one module.
+
+    Every instruction is a row of parallel array columns: opcode, offset,
+    addr, unique id and, for each of its three operand slots, the number of
+    an operand record (NO_OPERAND for an empty slot). Every operand record is
+    a row of three more columns, its kind, the id of its value in the value
+    pool and whether it owns that pool entry. Constants and plain variables
+    are interned, so all the operands that refer to `i` or to `0` share a
+    single pool entry. SSA variables, argument lists and functions are
+    mutable and are stored as they are, and branch targets are unique, so a
+    record holding one of them owns a pool entry. The entry is reused when
+    the value of the record is overwritten and recycled when an interned
+    value replaces it, so renaming, folding and label resolution do not grow
+    the pool.
+
+    Released instructions, see release(), leave their rows, operand records
+    and pool entries to new ones, and interned values no operand record
+    refers to any more are dropped from time to time. The table of a module
+    that is streamed function by function is as large as the functions in
+    flight, not as the module.
+
+    MIRInst and Operand are flyweights over these rows, the table itself only
+    deals with the integer codes of opcodes and operand kinds.
+"""
+from array import array
+from typing import Any, Dict, Hashable, Iterable, List, Set
+
+from cof.base.mir.variable import Variable
+
+NO_OPERAND = -1
+# row of an instruction id that is not registered, see MIRContext
+NO_ROW = -1
+# value id of a released operand record
+_NO_VALUE = -1
+# interned values are collected once there are twice as many as after the
+# last collection, and at least this many.
+_MIN_COLLECT = 1024
+
+# values of these types are immutable and compared by value.
+_interned_types = {bool, int, float, str, Variable, type(None)}
+
+
+class MIRInstTable:
+
+    def __init__(self):
+        # instruction columns
+        self.op: array = array('B')
+        self.offset: array = array('i')
+        self.addr: array = array('i')
+        self.unique_id: array = array('i')
+        self.operand1: array = array('i')
+        self.operand2: array = array('i')
+        self.result: array = array('i')
+
+        # operand columns
+        self.kind: array = array('B')
+        self.value_id: array = array('i')
+        self.owns_value: array = array('B')
+
+        # value pool
+        self.values: List[Any] = []
+        self._value_ids: Dict[Hashable, int] = { }
+        # pool entries of values that are not interned and no longer stored
+        self._free_values: List[int] = [ ]
+        # number of interned values after the last collection
+        self._interned_live: int = 0
+
+        # rows and operand records of released instructions
+        self._free_insts: List[int] = [ ]
+        self._free_operands: List[int] = [ ]
+
+    def __len__(self):
+        return len(self.op)
+
+    def new_inst(self, unique_id: int, offset: int, op_code: int) -> int:
+        """
+        Add an instruction row without operands, the row of a released
+        instruction if there is one.
+        :return: the row
+        """
+        if self._free_insts:
+            row = self._free_insts.pop()
+            self.op[row] = op_code
+            self.offset[row] = offset
+            self.addr[row] = 0
+            self.unique_id[row] = unique_id
+            self.operand1[row] = self.operand2[row] = self.result[row] = NO_OPERAND
+            return row
+
+        self.op.append(op_code)
+        self.offset.append(offset)
+        self.addr.append(0)
+        self.unique_id.append(unique_id)
+        self.operand1.append(NO_OPERAND)
+        self.operand2.append(NO_OPERAND)
+        self.result.append(NO_OPERAND)
+        return len(self.op) - 1
+
+    def new_operand(self, kind_code: int, value: Any, own: bool = False) -> int:
+        """
+        Add an operand record, the record of a released operand if there is
+        one.
+        :param own: store value in a pool entry of the record even if it
+            could be interned.
+        :return: the number of the record
+        """
+        own = own or type(value) not in _interned_types
+        if self._free_operands:
+            ref = self._free_operands.pop()
+            self.kind[ref] = kind_code
+            self.value_id[ref] = self._new_value(value) if own else self.intern(value)
+            self.owns_value[ref] = own
+            return ref
+
+        self.kind.append(kind_code)
+        self.value_id.append(self._new_value(value) if own else self.intern(value))
+        self.owns_value.append(own)
+        return len(self.kind) - 1
+
+    def set_value(self, ref: int, value: Any, own: bool = False):
+        """
+        Store value in the operand record ref, see new_operand().
+        """
+        own = own or type(value) not in _interned_types
+        value_id = self.value_id[ref]
+        if self.owns_value[ref]:
+            if own:
+                self.values[value_id] = value
+                return
+            self.values[value_id] = None
+            self._free_values.append(value_id)
+        elif own:
+            self.value_id[ref] = self._new_value(value)
+            self.owns_value[ref] = True
+            return
+        self.value_id[ref] = self.intern(value)
+        self.owns_value[ref] = False
+
+    def own_values(self, kind_codes: Set[int]):
+        """
+        Give every operand record of one of kind_codes or holding a value
+        that is not interned a pool entry of its own, after the operand
+        columns have been filled with shared entries.
+        """
+        values = self.values
+        value_ids = self.value_id
+        owns_value = self.owns_value = array('B', bytes(len(value_ids)))
+        not_interned = {value_id for value_id, value in enumerate(values) if type(value) not in _interned_types}
+        claimed = set()
+        for ref, (kind_code, value_id) in enumerate(zip(self.kind, value_ids)):
+            if value_id in not_interned:
+                if value_id in claimed:
+                    value_ids[ref] = self._new_value(values[value_id])
+                claimed.add(value_id)
+            elif kind_code in kind_codes:
+                value_ids[ref] = self._new_value(values[value_id])
+            else:
+                continue
+            owns_value[ref] = True
+
+    def intern(self, value: Any) -> int:
+        """
+        Return the id of value in the value pool, equal constants and
+        variables get the same id. Other values get a new entry.
+        """
+        value_type = type(value)
+        if value_type not in _interned_types:
+            return self._new_value(value)
+
+        # 0.0 == -0.0, keep them apart
+        key = (value_type, value.hex() if value_type is float else value)
+        value_id = self._value_ids.get(key)
+        if value_id is None:
+            value_id = self._value_ids[key] = self._new_value(value)
+        return value_id
+
+    def is_interned(self, value: Any) -> bool:
+        """
+        :return: whether value is in the pool as an interned value.
+        """
+        value_type = type(value)
+        if value_type not in _interned_types:
+            return False
+        return (value_type, value.hex() if value_type is float else value) in self._value_ids
+
+    def release(self, rows: Iterable[int]) -> bool:
+        """
+        Recycle instruction rows, their operand records and the pool entries
+        the records own. Records shared by several of the rows are recycled
+        once, the rows and records must not be used afterwards.
+        :return: whether interned values were collected, see collect_values().
+        """
+        refs = set()
+        for row in rows:
+            refs.update((self.operand1[row], self.operand2[row], self.result[row]))
+            self._free_insts.append(row)
+        refs.discard(NO_OPERAND)
+
+        for ref in refs:
+            if self.owns_value[ref]:
+                value_id = self.value_id[ref]
+                self.values[value_id] = None
+                self._free_values.append(value_id)
+                self.owns_value[ref] = False
+            self.value_id[ref] = _NO_VALUE
+        self._free_operands.extend(refs)
+
+        if len(self._value_ids) < 2 * max(self._interned_live, _MIN_COLLECT):
+            return False
+        self.collect_values()
+        return True
+
+    def collect_values(self):
+        """
+        Drop the interned values no operand record refers to, canonical()
+        may return a new object equal to a dropped one.
+        """
+        referenced = set(self.value_id)
+        dropped = [key for key, value_id in self._value_ids.items() if value_id not in referenced]
+        for key in dropped:
+            value_id = self._value_ids.pop(key)
+            self.values[value_id] = None
+            self._free_values.append(value_id)
+        self._interned_live = len(self._value_ids)
+
+    def _new_value(self, value: Any) -> int:
+        """
+        Store value in a free pool entry.
+        """
+        if self._free_values:
+            value_id = self._free_values.pop()
+            self.values[value_id] = value
+            return value_id
+        self.values.append(value)
+        return len(self.values) - 1
+
+    def canonical(self, value: Any) -> Any:
+        """
+        Return the interned object equal to value, values that are not
+        interned are returned as they are.
+        """
+        if type(value) not in _interned_types:
+            return value
+        return self.values[self.intern(value)]
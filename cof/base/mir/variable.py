@@ -8,8 +8,13 @@ class VariableScope(Enum):
     Local = auto()
 
 class Variable:
+    """
+    Variables are immutable, equal variables of a module are interned to a
+    single object by MIRContext.variable(), so comparing them is mostly an
+    identity check. The hash is computed once.
+    """
 
-    __slots__ = ('varname', 'scope', 'compiler_generated')
+    __slots__ = ('varname', 'scope', 'compiler_generated', '_hash')
 
     def __init__(
             self,
@@ -20,6 +25,26 @@ class Variable:
         self.varname: str = varname
         self.scope: VariableScope = scope
         self.compiler_generated: bool = compiler_generated
+        self._hash: int = hash((varname, scope, compiler_generated))
+
+    def __getstate__(self):
+        # hashes of str depend on the process, do not pickle the cached one
+        return None, {
+            name: getattr(self, name)
+            for cls in type(self).__mro__ for name in getattr(cls, '__slots__', ())
+            if name != '_hash'
+        }
+
+    def __setstate__(self, state):
+        for name, value in state[1].items():
+            setattr(self, name, value)
+        self._hash = hash((self.varname, self.scope, self.compiler_generated))
+
+    # immutable and interned, copies would only be equal objects that are not interned
+    def __copy__(self):
+        return self
+    def __deepcopy__(self, memo):
+        return self
 
     @property
     def base_name(self) -> str:
@@ -28,8 +53,8 @@ class Variable:
     def __repr__(self):
         return self.varname
     def __hash__(self):
-        return hash((self.varname, self.scope, self.compiler_generated))
+        return self._hash
     def __eq__(self, other : 'Variable'):
-        return self.varname == other.varname \
+        return self is other or self.varname == other.varname \
                 and self.scope == other.scope \
-                and self.compiler_generated == other.compiler_generated
\ No newline at end of file
+                and self.compiler_generated == other.compiler_generated
@@ -23,6 +23,13 @@ class Semilattice(ABC, Generic[T]):
     def partial_order(self, a: T, b: T) -> bool:
         return self.meet(a, b) == a
 
+    def height(self) -> Optional[int]:
+        """
+        The length of the longest descending chain, used to bound the
+        number of iterations of data-flow analyses. None if unknown.
+        """
+        return None
+
 class ConstLatState(Enum):
     # NAC, Not a Constant
     BOTTOM = 0,
@@ -102,6 +109,10 @@ class ConstLattice(Semilattice['ConstLattice']):
 
         return False
 
+    def height(self) -> int:
+        # TOP -> CONSTANT -> BOTTOM
+        return 2
+
     def meet(self, a: 'ConstLattice', b: 'ConstLattice') -> 'ConstLattice':
         if a.is_bottom or b.is_bottom:
             return ConstLattice.bottom()
@@ -1,5 +1,5 @@
 from collections import defaultdict
-from typing import Dict, Tuple, List
+from typing import Dict, Iterator, List, Set, Tuple
 
 from cof.base.bb import BasicBlockId
 from cof.base.mir.args import Args
@@ -10,15 +10,17 @@ from cof.base.mir.variable import Variable
 
 
 class SSAVariable(Variable):
-    __slots__ = ('version', 'original_variable', 'block_id')
+    __slots__ = ('version', 'original_variable', 'block_id', 'value_number')
 
-    def __init__(self, var: Variable, version: int = -1, block_id : int = -1):
+    def __init__(self, var: Variable, version: int = -1, block_id : int = -1, value_number: int = -1):
         # 调用父类初始化
         super().__init__(var.varname)
         # self.varname = var.varname if isinstance(var, Variable) else var
         self.version : int= version
         self.original_variable: Variable = var
         self.block_id : BasicBlockId = -1
+        # dense number of the SSA value, see ControlFlowGraph.ssa_values
+        self.value_number: int = value_number
 
     def __str__(self):
         return f"{self.varname}#{self.version}"
@@ -30,10 +32,14 @@ class SSAVariable(Variable):
     def __hash__(self):
         return hash((self.original_variable, self.version))
     def __eq__(self, other : 'SSAVariable'):
-        return self.original_variable == other.original_variable and self.version == other.version
+        return self is other \
+            or self.original_variable == other.original_variable and self.version == other.version
 
     def __copy__(self):
-        return SSAVariable(self.original_variable, self.version, self.block_id)
+        return SSAVariable(self.original_variable, self.version, self.block_id, self.value_number)
+    def __deepcopy__(self, memo):
+        # SSA variables are not interned, copies are new objects
+        return self.__copy__()
 
 class SSAEdge:
     """
@@ -80,26 +86,53 @@ class SSAEdge:
 
 
 class SSAEdgeBuilder:
-    def __init__(self, cfg, edges: List[SSAEdge], def_map):
+    def __init__(
+            self,
+            cfg,
+            def_use,
+            def_map: List[MIRInstId],
+            use_map: List[List[MIRInstId]],
+            loop_carried: Set[Tuple[MIRInstId, MIRInstId]],
+    ):
         self.cfg = cfg
-        self.ssa_edge_list: List[SSAEdge] = edges
-        self.edges: List[Tuple[MIRInstId, MIRInstId]] = self._collect_ssa_edge()
+        # the def-use index the edges were computed from
+        self.def_use = def_use
+        # def_map[n] is the id of the inst defining the SSA value numbered n (-1 if none),
+        # use_map[n] are the ids of the insts using it along an SSA edge.
+        self.def_map: List[MIRInstId] = def_map
+        self.use_map: List[List[MIRInstId]] = use_map
+        # (def, phi function) edges carried around a loop
+        self.loop_carried: Set[Tuple[MIRInstId, MIRInstId]] = loop_carried
         self.succ: Dict[MIRInstId, List[MIRInstId]] = self._construct_ssa_succ()
-        self.def_map = def_map
 
     def _construct_ssa_succ(self) -> Dict[MIRInstId, List[MIRInstId]]:
+        # an inst defines a single value, its successors are the uses of it.
         succ: Dict[MIRInstId, List[MIRInstId]] = defaultdict(list)
-        for s,d in self.edges:
-            succ[s].append(d)
+        for value_number, def_id in enumerate(self.def_map):
+            if def_id != -1 and self.use_map[value_number]:
+                succ[def_id] = self.use_map[value_number]
         return succ
 
-    def _collect_ssa_edge(self) -> List[Tuple[MIRInstId, MIRInstId]]:
-        edges: List[Tuple[MIRInstId, MIRInstId]] = []
-
-        for e in self.ssa_edge_list:
-            edges.append(e.id)
-
-        return edges
+    @property
+    def edges(self) -> List[Tuple[MIRInstId, MIRInstId]]:
+        return [(s, d) for s, targets in self.succ.items() for d in targets]
+
+    def ssa_edges(self) -> Iterator[SSAEdge]:
+        """
+        Build the SSAEdge objects of the edges, for inspection.
+        """
+        values = self.cfg.ssa_values
+        for value_number, def_id in enumerate(self.def_map):
+            if def_id == -1:
+                continue
+            source_inst = self.def_use.inst(def_id)
+            src_block = self.def_use.block_of(def_id)
+            for use_id in self.use_map[value_number]:
+                edge = SSAEdge(source_inst, self.def_use.inst(use_id), src_block,
+                               self.def_use.block_of(use_id), values[value_number])
+                if (def_id, use_id) in self.loop_carried:
+                    edge.mark_loop_carried()
+                yield edge
 
 
 def create_phi_function(var: Variable, num_pred_s: int) -> MIRInst:
@@ -0,0 +1,253 @@
+"""
+    Persistent cache of optimized functions.
+
+    An entry is the optimized body of a function, stored under a hash of the
+    input body, of the optimizer configuration and of the source of the
+    optimizer itself, so unchanged functions of a module are not optimized
+    again on the next run, wherever they moved in the module, and a changed
+    optimizer never gets the results of an old one.
+
+    Bodies are stored position independent: ids are renumbered to 1..n for
+    the input instructions in input order, the instructions created by the
+    optimizer follow in creation order, branch targets are renumbered alike
+    and offsets are relative to the first input instruction. A cached body
+    is mapped back onto the instructions of the function it is used for.
+
+    Entries are files in cache_dir, the least recently used ones are
+    removed when the cache grows beyond max_size bytes.
+"""
+import hashlib
+import os
+import pickle
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from cof.base.mir.args import Args
+from cof.base.mir.context import MIRContext, MIRInstId, use_context
+from cof.base.mir.function import MIRFunction
+from cof.base.mir.inst import MIRInsts
+from cof.base.mir.operand import Operand, OperandType
+from cof.base.mir.variable import Variable
+from cof.trace import DEBUG, channel
+
+_log = channel('cache')
+
+# part of every key, change it when the stored format changes. Changes of
+# the optimizer are covered by optimizer_digest().
+CACHE_FORMAT_VERSION = 2
+DEFAULT_CACHE_SIZE = 256 * 1024 * 1024
+
+# input instruction ids in order and the offset of the first one
+type FunctionLayout = Tuple[List[MIRInstId], int]
+
+
+def function_layout(func: MIRFunction) -> FunctionLayout:
+    insts = func.insts.ret_insts()
+    return [inst.unique_id for inst in insts], insts[0].offset if insts else 0
+
+
+# ++++++++ key ++++++++
+
+_optimizer_digest: Optional[str] = None
+
+
+def optimizer_digest() -> str:
+    """
+    Hash the source files of the cof package, computed once per process.
+    """
+    global _optimizer_digest
+    if _optimizer_digest is None:
+        package_dir = Path(__file__).resolve().parent
+        digest = hashlib.sha256()
+        for path in sorted(package_dir.rglob('*.py')):
+            digest.update(path.relative_to(package_dir).as_posix().encode('utf-8'))
+            digest.update(b'\0')
+            digest.update(path.read_bytes())
+            digest.update(b'\0')
+        _optimizer_digest = digest.hexdigest()
+    return _optimizer_digest
+
+
+def _canonical_operand(operand: Optional[Operand], targets: Dict[MIRInstId, int]):
+    if operand is None:
+        return None
+    value = operand.value
+    if operand.type == OperandType.PTR and type(value) is int:
+        # raises KeyError for a target outside the function
+        value = targets[value]
+    elif type(value) is Args:
+        value = tuple(_canonical_operand(arg, targets) for arg in value.args)
+    elif isinstance(value, Variable):
+        value = (type(value).__name__, str(value), value.scope.value, value.compiler_generated)
+    else:
+        value = (type(value).__name__, value.hex() if type(value) is float else value)
+    return operand.type.value, value
+
+
+def function_key(func: MIRFunction, config: tuple) -> Optional[str]:
+    """
+    Hash the body and the arguments of func together with the optimizer
+    configuration and optimizer_digest(), the name and the position of the
+    function do not matter.
+    :return: the key, None if the function cannot be cached (a branch leaves
+    the function).
+    """
+    insts = func.insts.ret_insts()
+    targets = {inst.unique_id: i for i, inst in enumerate(insts)}
+    base = insts[0].offset if insts else 0
+    try:
+        body = [
+            (
+                inst.op.value, inst.offset - base,
+                _canonical_operand(inst.operand1, targets),
+                _canonical_operand(inst.operand2, targets),
+                _canonical_operand(inst.result, targets),
+            )
+            for inst in insts
+        ]
+    except KeyError:
+        return None
+    content = (CACHE_FORMAT_VERSION, optimizer_digest(), config, [str(arg) for arg in func.args], func.insts.phi_insts_idx_end, body)
+    return hashlib.sha256(repr(content).encode('utf-8')).hexdigest()
+
+
+# ++++++++ cache ++++++++
+
+class FunctionCache:
+
+    def __init__(self, cache_dir: str, max_size: int = DEFAULT_CACHE_SIZE):
+        self.cache_dir: Path = Path(cache_dir)
+        self.max_size: int = max_size
+        # functions taken from the cache and functions optimized and stored
+        self.hits: int = 0
+        self.misses: int = 0
+        # key -> entry size, least recently used first. Read on first use.
+        self._entries: Optional[OrderedDict[str, int]] = None
+        self._size: int = 0
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / key[2:]
+
+    def _index(self) -> OrderedDict[str, int]:
+        if self._entries is None:
+            found: List[Tuple[float, str, int]] = [ ]
+            if self.cache_dir.is_dir():
+                for path in self.cache_dir.glob('??/*'):
+                    if path.name.startswith('.'):
+                        continue
+                    try:
+                        stat = path.stat()
+                    except FileNotFoundError:
+                        continue
+                    found.append((stat.st_mtime, path.parent.name + path.name, stat.st_size))
+            found.sort()
+            self._entries = OrderedDict((key, size) for _, key, size in found)
+            self._size = sum(self._entries.values())
+        return self._entries
+
+    def _evict(self):
+        entries = self._index()
+        while self._size > self.max_size and entries:
+            key, size = entries.popitem(last=False)
+            self._size -= size
+            self._path(key).unlink(missing_ok=True)
+
+    def _forget(self, key: str):
+        size = self._index().pop(key, None)
+        if size is not None:
+            self._size -= size
+        self._path(key).unlink(missing_ok=True)
+
+    def contains(self, key: str) -> bool:
+        return self._path(key).is_file()
+
+    def load(self, key: str, func: MIRFunction, last_id: MIRInstId) -> Optional[MIRInsts]:
+        """
+        Look up the optimized body of func. Its instructions are rows of
+        the current context, the input instructions keep the ids of func,
+        new instructions are numbered from last_id + 1 in creation order.
+        :return: the optimized body, None on a miss.
+        """
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            insts: MIRInsts = pickle.loads(data)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # unreadable entry
+            self._forget(key)
+            return None
+
+        input_ids, base = function_layout(func)
+        num_inputs = len(input_ids)
+
+        def real_id(canonical_id: int) -> MIRInstId:
+            if canonical_id <= num_inputs:
+                return input_ids[canonical_id - 1]
+            return last_id + canonical_id - num_inputs
+
+        for inst in insts.ret_insts():
+            inst.unique_id = real_id(inst.unique_id)
+            inst.offset += base
+            if inst.is_if() or inst.is_goto():
+                inst.result.value = real_id(inst.result.value)
+        insts.reindex()
+
+        # most recently used, also for the next run
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        entries = self._index()
+        if key in entries:
+            entries.move_to_end(key)
+        self.hits += 1
+        if _log.debug_on:
+            _log.emit(DEBUG, f"cache hit {key}", event='hit', key=key)
+        return insts
+
+    def store(self, key: str, insts: MIRInsts, layout: FunctionLayout):
+        """
+        Store the optimized body insts of a function whose input had the
+        given layout, see function_layout().
+        """
+        input_ids, base = layout
+        canonical_ids: Dict[MIRInstId, int] = {uid: i + 1 for i, uid in enumerate(input_ids)}
+        new_ids = sorted(inst.unique_id for inst in insts.ret_insts() if inst.unique_id not in canonical_ids)
+        canonical_ids.update((uid, len(input_ids) + i + 1) for i, uid in enumerate(new_ids))
+
+        # renumber a copy, the instructions of the module are not touched
+        insts_data = pickle.dumps(insts)
+        with use_context(MIRContext()):
+            body: MIRInsts = pickle.loads(insts_data)
+            for inst in body.ret_insts():
+                inst.unique_id = canonical_ids[inst.unique_id]
+                inst.offset -= base
+                if inst.is_if() or inst.is_goto():
+                    if inst.result.value not in canonical_ids:
+                        return
+                    inst.result.value = canonical_ids[inst.result.value]
+            data = pickle.dumps(body)
+
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # write atomically, other runs may use the same cache directory
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix='.')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(data)
+            os.replace(tmp_name, path)
+        except BaseException:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+
+        entries = self._index()
+        self._size += len(data) - entries.pop(key, 0)
+        entries[key] = len(data)
+        self.misses += 1
+        if _log.debug_on:
+            _log.emit(DEBUG, f"cache store {key} ({len(data)} bytes)", event='store', key=key, size=len(data))
+        self._evict()
@@ -1,15 +1,17 @@
+from typing import Optional
+
 from cof.base.cfg import ControlFlowGraph
-from cof.early.lazy_code_motion import lazy_code_motion_optimize
+from cof.early.lazy_code_motion import ExpressionUniverse, lazy_code_motion_optimize
 
 
 class EarlyOptimizer:
     def __init__(self, cfg: ControlFlowGraph):
         self.cfg = cfg
 
-    def optimize(self, method: str):
+    def optimize(self, method: str, exprs: Optional[ExpressionUniverse] = None):
 
         match method:
             case 'lazy-code motion':
-                lazy_code_motion_optimize(self.cfg)
+                lazy_code_motion_optimize(self.cfg, exprs)
             case _:
                 return
\ No newline at end of file
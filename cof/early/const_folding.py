@@ -1,28 +1,46 @@
+from typing import List, Optional
+
 from cof.analysis.sccp import SCCPAnalyzer
+from cof.base.def_use import DefUseIndex
 from cof.base.mir.eval import mir_eval
-from cof.base.mir.inst import MIRInsts
+from cof.base.mir.inst import MIRInst
 from cof.base.mir.operand import Operand
 from cof.base.semilattice import ConstLattice
 
 
-def constant_folding(sccp_analyzer: SCCPAnalyzer):
-    insts: MIRInsts = sccp_analyzer.get_insts()
-    for inst in insts.ret_insts():
-        operand_var_list = inst.ret_operand_list()
+def constant_folding(sccp_analyzer: SCCPAnalyzer, def_use: Optional[DefUseIndex] = None):
+    """
+    Replace the uses of the SSA values found constant by the constants, and
+    fold the arithmetic insts whose operands are all constant.
+    :param def_use: the def-use index of the SSA form, updated in place. The
+        index of the SSA edges of sccp_analyzer if not given.
+    """
+    if def_use is None:
+        def_use = sccp_analyzer.ssa_builder.def_use
 
-        for var in operand_var_list:
-            if var.is_ssa_var():
-                lattice: ConstLattice = sccp_analyzer.lat_cell[str(var)]
-                if lattice.is_constant:
+    # only the users of constant values change.
+    for value_number, lattice in enumerate(sccp_analyzer.lat_cell):
+        if not lattice.is_constant:
+            continue
+        value = sccp_analyzer.cfg.ssa_values[value_number]
+        for inst_id in list(def_use.users(value)):
+            inst: MIRInst = def_use.inst(inst_id)
+            for var in inst.ret_operand_list():
+                # phi functions of unreachable blocks are not renamed
+                if var.is_ssa_var() and var.value.value_number == value_number:
                     var.type = lattice.value.type
                     var.value = lattice.value.value
+            def_use.update_inst(inst)
 
-        dest_var: Operand = inst.ret_dest_variable()
-
+    defining_insts: List[MIRInst] = [def_use.inst(inst_id)
+                                     for inst_ids in def_use.defs.values() for inst_id in inst_ids]
+    for inst in defining_insts:
         if inst.is_arithmetic() and inst.all_constant_operands():
+            dest_var: Operand = inst.ret_dest_variable()
             ret_val: Operand = mir_eval(inst.op, inst.operand1, inst.operand2)
             dest_var.type = ret_val.type
             dest_var.value = ret_val.value
+            def_use.update_inst(inst)
 
         # if inst.is_if() and dest_var.is_true():
         #     inst.if_to_goto()
@@ -1,15 +1,21 @@
-from copy import deepcopy
+from copy import copy
 from typing import Dict, Optional, List, Callable
 
 from cof.analysis.dataflow import DataFlowAnalysisFramework
+from cof.analysis.dataflow.bitvector import UniverseIndex, BitVectorSemilattice, BitVector
 from cof.analysis.dataflow.framework import TransferCluster
 from cof.base.bb import BasicBlock, BasicBlockId
 from cof.base.cfg import ControlFlowGraph
-from cof.base.mir.expr import Expression, has_expr, convert_bin_expr_to_operand, ret_expr_from_mir_inst
+from cof.base.def_use import DefUseIndex
+from cof.base.mir.expr import Expression, convert_bin_expr_to_operand, ret_expr_from_mir_inst
 from cof.base.mir.inst import MIRInst
 from cof.base.mir.operand import OperandType, Operand
 from cof.base.mir.variable import Variable, LCM_TMP_VAR_PREFIX
 from cof.base.semilattice import Semilattice
+from cof.timing import time_pass
+from cof.trace import DEBUG, channel
+
+_log = channel('lcm')
 
 
 class LCMAnticipatedExprSemilattice(Semilattice[set[Expression]]):
@@ -23,6 +29,9 @@ class LCMAnticipatedExprSemilattice(Semilattice[set[Expression]]):
     def meet(self, a: set[Expression], b: set[Expression]) -> set[Expression]:
         return a & b
 
+    def height(self) -> int:
+        return len(self.universal_set)
+
     def top(self) -> set[Expression]:
         return self.universal_set
 
@@ -36,6 +45,9 @@ class LCMAvailableExprSemilattice(Semilattice[set[Expression]]):
     def meet(self, a: set[Expression], b: set[Expression]) -> set[Expression]:
         return a & b
 
+    def height(self) -> int:
+        return len(self.universal_set)
+
     def top(self) -> set[Expression]:
         return self.universal_set
 
@@ -54,6 +66,9 @@ class LCMPostponableExprSemilattice(Semilattice[set[Expression]]):
     def meet(self, a: set[Expression], b: set[Expression]) -> set[Expression]:
         return a & b
 
+    def height(self) -> int:
+        return len(self.universal_set)
+
 class LCMUsedExprSemilattice(Semilattice[set[Expression]]):
 
     def __init__(self, all_exprs: set[Expression]):
@@ -68,6 +83,9 @@ class LCMUsedExprSemilattice(Semilattice[set[Expression]]):
     def meet(self, a: set[Expression], b: set[Expression]) -> set[Expression]:
         return a & b
 
+    def height(self) -> int:
+        return len(self.all_exprs)
+
 
 class LCMAnticipatedExprTransferCluster(TransferCluster[BasicBlock, set[Expression]]):
 
@@ -122,7 +140,11 @@ class LCMUsedExprTransferCluster(TransferCluster[BasicBlock, set[Expression]]):
 
 
 def expr_on_state_change(block: BasicBlock, lattice, before: set[Expression], after: set[Expression]):
-    print(f"Block {block.id}: {{ {", ".join(map(str, before))} }}  --->  {{ {", ".join(map(str, after))} }}")
+    if _log.debug_on:
+        _log.emit(
+            DEBUG, f"Block {block.id}: {{ {", ".join(map(str, before))} }}  --->  {{ {", ".join(map(str, after))} }}",
+            event='state_change', block=block.id, before=list(map(str, before)), after=list(map(str, after)),
+        )
 
 def _comp_e_use_sets(blocks: List[BasicBlock]) -> Dict[BasicBlock, set[Expression]]:
 
@@ -140,39 +162,31 @@ def _comp_e_use_sets(blocks: List[BasicBlock]) -> Dict[BasicBlock, set[Expressio
 
 def _comp_e_kill_sets(
         blocks: List[BasicBlock],
-        all_exprs: set[Expression]
+        all_exprs: set[Expression],
+        def_use: DefUseIndex,
 ) -> Dict[BasicBlock, set[Expression]]:
 
-    e_kill_sets = { }
-
-    for block in blocks:
-        kill = set()
-
-        # Find all variables modified in this block.
-        modified_vars = set()
-        for inst in block.insts.ret_insts():
-            assigned_var = inst.ret_def_var()
-            if assigned_var is not None:
-                modified_vars.add(assigned_var)
-
-        if modified_vars:
-            for expr in all_exprs:
-                if ((expr.operand1.value in modified_vars)
-                        or (expr.operand2.value in modified_vars)):
-                    kill.add(expr)
+    e_kill_sets = {block: set() for block in blocks}
 
-        e_kill_sets[block] = kill
+    # An expression is killed in the blocks defining any of its operands.
+    for expr in all_exprs:
+        for operand in (expr.operand1, expr.operand2):
+            if not isinstance(operand.value, Variable):
+                continue
+            for block in def_use.defining_blocks(operand.value):
+                if block in e_kill_sets:
+                    e_kill_sets[block].add(expr)
 
     return e_kill_sets
 
 def _comp_latest_sets(
         blocks: List[BasicBlock],
         succ: Callable[[BasicBlockId], List[BasicBlock]],
-        all_exprs: set[Expression],
-        earliest_set: Dict[BasicBlock, set[Expression]],
-        postponable_in_set: Dict[BasicBlock, set[Expression]],
-        e_use_set: Dict[BasicBlock, set[Expression]],
-) -> Dict[BasicBlock, set[Expression]]:
+        all_exprs: BitVector,
+        earliest_set: Dict[BasicBlock, BitVector],
+        postponable_in_set: Dict[BasicBlock, BitVector],
+        e_use_set: Dict[BasicBlock, BitVector],
+) -> Dict[BasicBlock, BitVector]:
 
     latest = { }
     for block in blocks:
@@ -209,10 +223,10 @@ def _comp_latest_sets(
 
 def _comp_earliest_sets(
         blocks: List[BasicBlock],
-        all_exprs: set[Expression],
-        antic_in_set: Dict[BasicBlock, set[Expression]],
-        avail_in_set: Dict[BasicBlock, set[Expression]],
-) -> Dict[BasicBlock, set[Expression]]:
+        all_exprs: BitVector,
+        antic_in_set: Dict[BasicBlock, BitVector],
+        avail_in_set: Dict[BasicBlock, BitVector],
+) -> Dict[BasicBlock, BitVector]:
     earliest = { }
 
     for block in blocks:
@@ -226,17 +240,51 @@ def _comp_earliest_sets(
 
 
 
-def lazy_code_motion_optimize(cfg: ControlFlowGraph):
+class ExpressionUniverse:
+    """
+    The expressions of a control flow graph, each owns a bit in the
+    universe, and the per-block sets lazy code motion starts from.
+    """
 
-    blocks: List[BasicBlock] = cfg.all_blocks()
-    all_exprs = cfg.collect_exprs()
+    def __init__(self, cfg: ControlFlowGraph, def_use: Optional[DefUseIndex] = None):
+        """
+        :param def_use: the def-use index of cfg, built here if not given.
+        """
+        blocks: List[BasicBlock] = cfg.all_blocks()
+        self.def_use: DefUseIndex = def_use if def_use is not None else DefUseIndex(cfg)
+        # the bits, and the temporaries, follow the order in which the
+        # expressions first occur, not the hash order of a set.
+        self.universe: UniverseIndex[Expression] = UniverseIndex(
+            expr for expr in map(ret_expr_from_mir_inst, cfg.insts.ret_insts()) if expr is not None)
+        self.all_exprs: set[Expression] = set(self.universe.elements)
+
+        # $e\_use_{B}$ is the set of expressions computed in $B$ and $e\_kill_{B}$ is
+        # the set of expressions killed, that is, the set of expressions any of whose
+        # operands are defined in $B$.
+        self.e_use_sets: Dict[BasicBlock, BitVector] = self.universe.encode_map(
+            _comp_e_use_sets(blocks), blocks)
+        self.e_kill_sets: Dict[BasicBlock, BitVector] = self.universe.encode_map(
+            _comp_e_kill_sets(blocks, self.all_exprs, self.def_use), blocks)
+
+
+def lazy_code_motion_optimize(cfg: ControlFlowGraph, exprs: Optional[ExpressionUniverse] = None):
+    """
+    :param exprs: the expression universe of cfg, computed here if not given.
+        Its def-use index is kept up to date with the transformation.
+    """
 
+    blocks: List[BasicBlock] = cfg.all_blocks()
+    if exprs is None:
+        exprs = ExpressionUniverse(cfg)
 
-    # $e\_use_{B}$ is the set of expressions computed in $B$ and $e\_kill_{B}$ is
-    # the set of expressions killed, that is, the set of expressions any of whose
-    # operands are defined in $B$.
-    e_use_sets: Dict[BasicBlock, set[Expression]] = _comp_e_use_sets(blocks)
-    e_kill_sets: Dict[BasicBlock, set[Expression]] = _comp_e_kill_sets(blocks, all_exprs)
+    # All four data-flow passes run over bit vectors, every expression
+    # owns a bit in the universe. The sets are encoded once.
+    all_exprs: set[Expression] = exprs.all_exprs
+    universe: UniverseIndex[Expression] = exprs.universe
+    all_exprs_bits: BitVector = universe.full
+    e_use_sets: Dict[BasicBlock, BitVector] = exprs.e_use_sets
+    e_kill_sets: Dict[BasicBlock, BitVector] = exprs.e_kill_sets
+    def_use: DefUseIndex = exprs.def_use
 
 
 
@@ -244,7 +292,7 @@ def lazy_code_motion_optimize(cfg: ControlFlowGraph):
     Step 1:
     Find all the expressions anticipated at each program point using a backward data-flow pass.
     """
-    anticipated_exprs_lattice = LCMAnticipatedExprSemilattice(all_exprs)
+    anticipated_exprs_lattice = BitVectorSemilattice(LCMAnticipatedExprSemilattice(all_exprs), universe)
     anticipated_exprs_transfer_cluster = LCMAnticipatedExprTransferCluster(e_use_sets, e_kill_sets)
     anticipated_exprs_analysis = DataFlowAnalysisFramework(
         cfg=cfg,
@@ -255,7 +303,8 @@ def lazy_code_motion_optimize(cfg: ControlFlowGraph):
         safe_value=anticipated_exprs_lattice.top(),
         # on_state_change=expr_on_state_change,
     )
-    anticipated_exprs_analysis.analyze(strategy='worklist')
+    with time_pass('lcm-anticipated'):
+        anticipated_exprs_analysis.analyze(strategy='worklist')
 
     """
     Step 2:
@@ -267,7 +316,7 @@ def lazy_code_motion_optimize(cfg: ControlFlowGraph):
     but are not available.**
     """
 
-    available_exprs_lattice = LCMAvailableExprSemilattice(all_exprs)
+    available_exprs_lattice = BitVectorSemilattice(LCMAvailableExprSemilattice(all_exprs), universe)
     available_exprs_transfer_cluster = LCMAvailableExprTransferCluster(
         anticipated_exprs_analysis.in_states,
         anticipated_exprs_transfer_cluster.e_kill_sets,
@@ -281,7 +330,8 @@ def lazy_code_motion_optimize(cfg: ControlFlowGraph):
         safe_value=available_exprs_lattice.top(),
         # on_state_change=expr_on_state_change
     )
-    available_exprs_analysis.analyze(strategy='worklist')
+    with time_pass('lcm-available'):
+        available_exprs_analysis.analyze(strategy='worklist')
 
     """
     Step 3:
@@ -297,13 +347,13 @@ def lazy_code_motion_optimize(cfg: ControlFlowGraph):
     use of $x + y$ after the last such placement.
     """
 
-    earliest_sets: Dict[BasicBlock, set[Expression]] = _comp_earliest_sets(
+    earliest_sets: Dict[BasicBlock, BitVector] = _comp_earliest_sets(
         blocks,
-        all_exprs,
+        all_exprs_bits,
         anticipated_exprs_analysis.in_states,
         available_exprs_analysis.in_states
     )
-    postponable_expr_lattice = LCMPostponableExprSemilattice(all_exprs)
+    postponable_expr_lattice = BitVectorSemilattice(LCMPostponableExprSemilattice(all_exprs), universe)
     postponable_expr_transfer_cluster = LCMPostponableExprTransferCluster(earliest_sets, e_use_sets)
     postponable_expr_analysis = DataFlowAnalysisFramework(
         cfg=cfg,
@@ -314,7 +364,8 @@ def lazy_code_motion_optimize(cfg: ControlFlowGraph):
         safe_value=postponable_expr_lattice.top(),
         # on_state_change=expr_on_state_change
     )
-    postponable_expr_analysis.analyze(strategy='worklist')
+    with time_pass('lcm-postponable'):
+        postponable_expr_analysis.analyze(strategy='worklist')
 
 
     """
@@ -323,16 +374,16 @@ def lazy_code_motion_optimize(cfg: ControlFlowGraph):
     are used only once in the program.
     """
 
-    latest_sets: Dict[BasicBlock, set[Expression]] = _comp_latest_sets(
+    latest_sets: Dict[BasicBlock, BitVector] = _comp_latest_sets(
         blocks,
         cfg.successors,
-        all_exprs,
+        all_exprs_bits,
         earliest_sets,
         postponable_expr_analysis.in_states,
         e_use_sets,
     )
 
-    used_expr_lattice = LCMUsedExprSemilattice(all_exprs)
+    used_expr_lattice = BitVectorSemilattice(LCMUsedExprSemilattice(all_exprs), universe)
     used_expr_transfer_cluster = LCMUsedExprTransferCluster(
         e_use_set=e_use_sets,
         latest_set=latest_sets,
@@ -346,7 +397,8 @@ def lazy_code_motion_optimize(cfg: ControlFlowGraph):
         safe_value=used_expr_lattice.top(),
         # on_state_change=expr_on_state_change
     )
-    used_expr_analysis.analyze(strategy='worklist')
+    with time_pass('lcm-used'):
+        used_expr_analysis.analyze(strategy='worklist')
 
 
 
@@ -356,7 +408,7 @@ def lazy_code_motion_optimize(cfg: ControlFlowGraph):
 
     # Create a mapping from expressions to temporary variables.
     temp_vars = { }
-    for i, expr in enumerate(all_exprs):
+    for i, expr in enumerate(universe.elements):
         # Generate unique temp var names
         temp_vars[expr] = f"{LCM_TMP_VAR_PREFIX}_{i}"
 
@@ -370,18 +422,19 @@ def lazy_code_motion_optimize(cfg: ControlFlowGraph):
     for block in blocks_exclude_entry:
         if block in latest_sets and latest_sets[block]:
             # Create new statement to insert
-            for expr in latest_sets[block]:
+            for expr in universe.elements_of(latest_sets[block]):
                 tv = temp_vars[expr]
                 new_mir_inst = MIRInst(
                     offset=-1,
-                    operand1=deepcopy(expr.operand1),
-                    operand2=deepcopy(expr.operand2),
+                    operand1=Operand(expr.operand1.type, copy(expr.operand1.value)),
+                    operand2=Operand(expr.operand2.type, copy(expr.operand2.value)),
                     op=expr.op,
                     result=Operand(OperandType.VAR, Variable(tv))
                 )
-                block.insts.insert_insts(insts=new_mir_inst, index=0)
                 insert_index = cfg.insts.index_for_inst(block.first_ordinary_inst)
+                block.insts.insert_insts(insts=new_mir_inst, index=0)
                 cfg.add_new_inst(insert_index, new_mir_inst)
+                def_use.add_inst(new_mir_inst, block)
 
 
     # Second pass:
@@ -401,17 +454,14 @@ def lazy_code_motion_optimize(cfg: ControlFlowGraph):
             dest_var: Variable = statement.result.value
 
             # Check if this statement computes any of our expressions
-            replaced = False
-            for expr in all_exprs:
-                tv = temp_vars[expr]
-
-                if has_expr(statement, expr) and tv != dest_var.varname:
-
-                    # This statement computes the expression
-                    # Replace with temporary variable.
-                    convert_bin_expr_to_operand(
-                        statement,
-                        Operand(OperandType.VAR, Variable(tv)))
-                    break
+            tv = temp_vars.get(ret_expr_from_mir_inst(statement))
+            if tv is not None and tv != dest_var.varname:
+
+                # This statement computes the expression
+                # Replace with temporary variable.
+                convert_bin_expr_to_operand(
+                    statement,
+                    Operand(OperandType.VAR, Variable(tv)))
+                def_use.update_inst(statement)
 
     cfg.reassign_inst_id()
\ No newline at end of file
@@ -1,11 +1,7 @@
-from typing import Optional
+from typing import List, Optional
 
-from cof.analysis.loop import LoopAnalyzer
-from cof.analysis.sccp import SCCPAnalyzer, sccp_analysis
 from cof.base.cfg import ControlFlowGraph
-from cof.base.ssa import SSAEdgeBuilder
-from cof.early import EarlyOptimizer
-from cof.early.const_folding import constant_folding
+from cof.passes import AnalysisManager, LazyCodeMotionPass, Pass, PassManager, PrintPass, SCCPPass, SSAPass
 from utils.cfg_visualizer import visualize_cfg
 
 class LocalCodeOptimizer:
@@ -16,50 +12,50 @@ class LocalCodeOptimizer:
             pre_algorithm: str,
             ssa_period: str,
             analysis_only: bool = False,
+            ssa_flavor: str = 'minimal',
+            pipeline: Optional[List[Pass]] = None,
+            dominator_engine: str = 'cooper-harvey-kennedy',
     ):
         self.cfg: Optional[ControlFlowGraph] = cfg
-        self.loop_analyzer: Optional[LoopAnalyzer] = None
-        self.ssa_edge_builder: Optional[SSAEdgeBuilder] = None
+        self.analysis_manager: Optional[AnalysisManager] = None
 
         self.pre_algorithm : str = pre_algorithm
         self.ssa_period : str = ssa_period
+        self.ssa_flavor : str = ssa_flavor
+        self.dominator_engine : str = dominator_engine
         self.sccp_enable : bool = sccp_enable
         self.analysis_only : bool = analysis_only
 
-    def initialize(self):
-        # control flow graph
-        self.cfg.initialize()
-
-        # print(self.cfg.edges)
-
-        # loop analyzer
-        self.loop_analyzer = LoopAnalyzer(self.cfg)
-        self.loop_analyzer.analyze_loops()
-
-    def optimize(self):
+        # the passes run by optimize(), derived from the options if not given
+        self.pass_manager: PassManager = PassManager(
+            pipeline if pipeline is not None else self.default_pipeline()
+        )
 
+    def default_pipeline(self) -> List[Pass]:
         # +++++++++++++++++++++ SSA Computing +++++++++++++++++++++
-        self.cfg.minimal_ssa()
-        self.ssa_edge_builder = self.cfg.ssa_edges_comp(self.loop_analyzer)
-        print("SSA From: ")
-        print(self.cfg.insts)
+        pipeline: List[Pass] = [SSAPass(self.ssa_flavor), PrintPass("SSA From: ")]
 
         if self.sccp_enable:
             # +++++++++++++++++++++ SCCP Analysis +++++++++++++++++++++
-            sccp_analyzer: SCCPAnalyzer = sccp_analysis(self.cfg, self.ssa_edge_builder)
-            constant_folding(sccp_analyzer)
-
+            pipeline.append(SCCPPass())
 
         match self.pre_algorithm:
             case 'lcm':
-                early_optimizer = EarlyOptimizer(self.cfg)
                 # +++++++++++++++++++++ Lazy-Code Motion Analysis +++++++++++++++++++++
-                early_optimizer.optimize(method='lazy-code motion')
+                pipeline.append(LazyCodeMotionPass())
             case 'cse':
                 pass
             case 'dae':
                 pass
 
-        print(self.cfg.insts)
+        pipeline.append(PrintPass())
+        return pipeline
+
+    def initialize(self):
+        # analyses are computed when a pass asks for them and cached on the cfg
+        self.analysis_manager = AnalysisManager(self.cfg, self.dominator_engine)
 
-        pass
\ No newline at end of file
+    def optimize(self):
+        if self.analysis_manager is None:
+            self.initialize()
+        self.pass_manager.run(self.cfg, self.analysis_manager)
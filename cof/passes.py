@@ -0,0 +1,298 @@
+"""
+    Pass manager.
+
+    Analyses are computed on demand and their results are cached on the
+    control flow graph (ControlFlowGraph.analyses), so every pass of a
+    pipeline asks the AnalysisManager for what it needs instead of
+    recomputing it.
+
+    Transform passes declare the analyses they preserve. After a transform
+    has run, every other cached result is dropped, together with the results
+    computed from a dropped one (see Analysis.requires).
+"""
+from abc import ABC, abstractmethod
+from collections import Counter
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple, Type
+
+from cof.analysis.dataflow import DataFlowAnalyzer
+from cof.analysis.loop import LoopAnalyzer
+from cof.analysis.sccp import sccp_analysis
+from cof.base.bb import BasicBlock, BasicBlockId
+from cof.base.cfg import ControlFlowGraph, ssa_flavors
+from cof.base.def_use import DefUseIndex
+from cof.base.dominator import dominator_engines
+from cof.base.mir.variable import Variable
+from cof.base.ssa import SSAEdgeBuilder
+from cof.early import EarlyOptimizer
+from cof.early.const_folding import constant_folding
+from cof.early.lazy_code_motion import ExpressionUniverse
+from cof.timing import time_pass
+from cof.trace import DEBUG, channel
+
+_ir_log = channel('ir')
+
+
+# ++++++++ Analyses ++++++++
+
+class Analysis(ABC):
+    name: str = ''
+    # analyses whose results this one is computed from
+    requires: Tuple[Type['Analysis'], ...] = ()
+
+    @staticmethod
+    @abstractmethod
+    def run(cfg: ControlFlowGraph, am: 'AnalysisManager') -> object:
+        pass
+
+
+class DominatorAnalysis(Analysis):
+    """
+    Immediate dominators, the dominator tree and its post order, kept in
+    cfg.idom, the blocks and cfg.post_order. The immediate dominators are
+    computed by the dominator engine of the AnalysisManager.
+    """
+    name = 'dominators'
+
+    @staticmethod
+    def run(cfg: ControlFlowGraph, am: 'AnalysisManager') -> Dict[BasicBlockId, BasicBlockId]:
+        cfg.idom_comp(am.dominator_engine)
+        cfg.construct_dominator_tree()
+        cfg.post_order_comp()
+        return cfg.idom
+
+
+class DominanceFrontierAnalysis(Analysis):
+    """
+    Dominance frontiers, kept in cfg.df.
+    """
+    name = 'dominance-frontier'
+    requires = (DominatorAnalysis,)
+
+    @staticmethod
+    def run(cfg: ControlFlowGraph, am: 'AnalysisManager') -> Dict[BasicBlockId, set]:
+        am.get(DominatorAnalysis)
+        cfg._dom_front()
+        return cfg.df
+
+
+class LoopAnalysis(Analysis):
+    """
+    Natural loops, their back edges are found by dominance.
+    """
+    name = 'loops'
+    requires = (DominatorAnalysis,)
+
+    @staticmethod
+    def run(cfg: ControlFlowGraph, am: 'AnalysisManager') -> LoopAnalyzer:
+        am.get(DominatorAnalysis)
+        return LoopAnalyzer(cfg).analyze_loops()
+
+
+class LivenessAnalysis(Analysis):
+    """
+    Live-in variables of every block.
+    """
+    name = 'liveness'
+
+    @staticmethod
+    def run(cfg: ControlFlowGraph, am: 'AnalysisManager') -> Dict[BasicBlock, Set[Variable]]:
+        return DataFlowAnalyzer(cfg).live_vars(verbose=False)
+
+
+class DefUseAnalysis(Analysis):
+    """
+    Def-use and use-def chains of all variables. Transforms which keep the
+    index up to date as they change instructions preserve it.
+    """
+    name = 'def-use'
+
+    @staticmethod
+    def run(cfg: ControlFlowGraph, am: 'AnalysisManager') -> DefUseIndex:
+        return DefUseIndex(cfg)
+
+
+class SSAEdgesAnalysis(Analysis):
+    """
+    SSA def-use edges, the function must be in SSA form.
+    """
+    name = 'ssa-edges'
+    requires = (LoopAnalysis, DefUseAnalysis)
+
+    @staticmethod
+    def run(cfg: ControlFlowGraph, am: 'AnalysisManager') -> SSAEdgeBuilder:
+        return cfg.ssa_edges_comp(am.get(LoopAnalysis), am.get(DefUseAnalysis))
+
+
+class ExpressionAnalysis(Analysis):
+    """
+    Expression universe with the use and kill sets of every block.
+    """
+    name = 'expressions'
+    requires = (DefUseAnalysis,)
+
+    @staticmethod
+    def run(cfg: ControlFlowGraph, am: 'AnalysisManager') -> ExpressionUniverse:
+        return ExpressionUniverse(cfg, am.get(DefUseAnalysis))
+
+
+class AnalysisManager:
+
+    def __init__(self, cfg: ControlFlowGraph, dominator_engine: str = 'cooper-harvey-kennedy'):
+        """
+        :param dominator_engine: one of dominator_engines, used by DominatorAnalysis.
+        """
+        if dominator_engine not in dominator_engines:
+            raise ValueError(f"unknown dominator engine '{dominator_engine}', "
+                             f"expected one of {', '.join(dominator_engines)}")
+        self.cfg: ControlFlowGraph = cfg
+        self.dominator_engine: str = dominator_engine
+        # analysis -> number of times it was computed / taken from the cache
+        self.computed: Counter[Type[Analysis]] = Counter()
+        self.reused: Counter[Type[Analysis]] = Counter()
+
+    def get(self, analysis: Type[Analysis]):
+        """
+        :return: the cached result of analysis, computed first if there is none.
+        """
+        results = self.cfg.analyses
+        if analysis in results:
+            self.reused[analysis] += 1
+            return results[analysis]
+
+        with time_pass(analysis.name):
+            result = analysis.run(self.cfg, self)
+        results[analysis] = result
+        self.computed[analysis] += 1
+        return result
+
+    def invalidate(self, preserved: Iterable[Type[Analysis]] = ()):
+        """
+        Drop every cached result but the preserved ones, and the preserved
+        ones computed from a dropped result.
+        """
+        results = self.cfg.analyses
+        kept = set(preserved)
+        changed = True
+        while changed:
+            changed = False
+            for analysis in list(results):
+                if analysis not in kept or any(req not in results for req in analysis.requires):
+                    del results[analysis]
+                    changed = True
+
+
+# ++++++++ Passes ++++++++
+
+class Pass(ABC):
+    name: str = ''
+    # analyses still valid after the pass has run
+    preserves: FrozenSet[Type[Analysis]] = frozenset()
+    # the pass changes nothing at all
+    preserves_all: bool = False
+
+    @abstractmethod
+    def run(self, cfg: ControlFlowGraph, am: AnalysisManager):
+        pass
+
+
+# the shape of the graph is left alone by all transforms of a local function
+_CFG_ANALYSES: FrozenSet[Type[Analysis]] = frozenset({DominatorAnalysis, DominanceFrontierAnalysis, LoopAnalysis})
+
+
+class SSAPass(Pass):
+    """
+    SSA construction, the flavor is one of ssa_flavors.
+    """
+    name = 'ssa'
+    preserves = _CFG_ANALYSES
+
+    def __init__(self, flavor: str = 'minimal'):
+        if flavor not in ssa_flavors:
+            raise ValueError(f"unknown SSA flavor '{flavor}', expected one of {', '.join(ssa_flavors)}")
+        self.flavor: str = flavor
+
+    def run(self, cfg: ControlFlowGraph, am: AnalysisManager):
+        am.get(DominanceFrontierAnalysis)
+        live_in = am.get(LivenessAnalysis) if self.flavor == 'pruned' else None
+        cfg.construct_ssa(self.flavor, live_in)
+
+
+class SCCPPass(Pass):
+    """
+    Sparse conditional constant propagation followed by constant folding.
+    """
+    name = 'sccp'
+    # constant folding updates the def-use index
+    preserves = _CFG_ANALYSES | {DefUseAnalysis}
+
+    def run(self, cfg: ControlFlowGraph, am: AnalysisManager):
+        sccp_analyzer = sccp_analysis(cfg, am.get(SSAEdgesAnalysis))
+        with time_pass('constant-folding'):
+            constant_folding(sccp_analyzer, am.get(DefUseAnalysis))
+
+
+class LazyCodeMotionPass(Pass):
+    name = 'lcm'
+    # the transformation updates the def-use index
+    preserves = _CFG_ANALYSES | {DefUseAnalysis}
+
+    def run(self, cfg: ControlFlowGraph, am: AnalysisManager):
+        EarlyOptimizer(cfg).optimize(method='lazy-code motion', exprs=am.get(ExpressionAnalysis))
+
+
+class PrintPass(Pass):
+    """
+    Dump the instructions to the ir channel at debug level.
+    """
+    name = 'print'
+    preserves_all = True
+
+    def __init__(self, title: Optional[str] = None):
+        self.title: Optional[str] = title
+
+    def run(self, cfg: ControlFlowGraph, am: AnalysisManager):
+        if not _ir_log.debug_on:
+            return
+        ir = str(cfg.insts)
+        message = ir if self.title is None else f"{self.title}\n{ir}"
+        _ir_log.emit(DEBUG, message, event='ir', title=self.title, ir=ir)
+
+
+passes: Dict[str, Type[Pass]] = {
+    SSAPass.name: SSAPass,
+    SCCPPass.name: SCCPPass,
+    LazyCodeMotionPass.name: LazyCodeMotionPass,
+    PrintPass.name: PrintPass,
+}
+
+
+class PassManager:
+
+    def __init__(self, pipeline: List[Pass]):
+        self.pipeline: List[Pass] = pipeline
+
+    @classmethod
+    def from_names(cls, names: Iterable[str]) -> 'PassManager':
+        """
+        Build a pipeline from pass names, e.g. ['ssa', 'sccp', 'lcm', 'print'].
+        """
+        pipeline = [ ]
+        for name in names:
+            if name not in passes:
+                raise ValueError(f"unknown pass '{name}', expected one of {', '.join(passes)}")
+            pipeline.append(passes[name]())
+        return cls(pipeline)
+
+    def run(self, cfg: ControlFlowGraph, am: Optional[AnalysisManager] = None) -> AnalysisManager:
+        """
+        Run the pipeline over cfg.
+        :return: the analysis manager, with the analyses still valid at the end.
+        """
+        if am is None:
+            am = AnalysisManager(cfg)
+        for p in self.pipeline:
+            with time_pass(p.name):
+                p.run(cfg, am)
+            if not p.preserves_all:
+                am.invalidate(p.preserves)
+        return am
@@ -1,9 +1,10 @@
 from collections import defaultdict
-from typing import Dict, Set, List, Tuple
+from typing import Dict, Set, List, Optional, Tuple
 
 from cof.analysis.dataflow import DataFlowAnalyzer
 from cof.base.bb import BasicBlock, BasicBlockId
 from cof.base.cfg import ControlFlowGraphForDataFlowAnalysis, ControlFlowGraph
+from cof.base.def_use import DefUseIndex
 from cof.base.mir.inst import MIRInst
 from cof.base.mir.operand import Operand, OperandType
 from cof.base.mir.operator import Op
@@ -130,15 +131,18 @@ def compute_live_range(cfg: ControlFlowGraphForDataFlowAnalysis,) -> Dict[Variab
 
 def build_interference_graph(
         cfg: ControlFlowGraph,
-        live_ranges: Dict[Variable, Set[BasicBlock]]
+        live_ranges: Dict[Variable, Set[BasicBlock]],
+        def_use: Optional[DefUseIndex] = None,
 ) -> InterferenceGraph:
+    """
+    :param def_use: the def-use index of cfg, built here if not given.
+    """
     interference_graph = InterferenceGraph()
+    if def_use is None:
+        def_use = DefUseIndex(cfg)
 
-    all_vars = set()
     # 1.    collect all ssa variables.
-    for inst in cfg.insts.ret_insts():
-        all_vars.update({inst.ret_def_var()})
-        all_vars.update({inst.ret_use_var()})
+    all_vars = def_use.variables()
 
     # 2.    add all variables as graph's node.
     for var in all_vars:
@@ -0,0 +1,197 @@
+"""
+    Per-pass timing and memory instrumentation.
+
+    Stages of the optimizer are wrapped in time_pass(name), passes add their
+    counters with count(name, n). Both do nothing unless a PassTimer is
+    active, see use_timer().
+
+    Every record has the wall time and the peak tracemalloc memory above
+    the memory in use when the stage started. Stages nest, the time and
+    memory of a stage include the stages run inside it, counters belong to
+    the innermost stage.
+"""
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional
+
+from tabulate import tabulate
+
+
+class PassRecord:
+    __slots__ = ('name', 'runs', 'seconds', 'peak_memory', 'counters')
+
+    def __init__(self, name: str):
+        self.name: str = name
+        self.runs: int = 0
+        self.seconds: float = 0.0
+        # bytes, the maximum over all runs
+        self.peak_memory: int = 0
+        self.counters: Dict[str, int] = { }
+
+    def merge(self, other: 'PassRecord'):
+        self.runs += other.runs
+        self.seconds += other.seconds
+        self.peak_memory = max(self.peak_memory, other.peak_memory)
+        for counter, n in other.counters.items():
+            self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'runs': self.runs,
+            'seconds': self.seconds,
+            'peak_memory': self.peak_memory,
+            'counters': dict(self.counters),
+        }
+
+
+class _Frame:
+    __slots__ = ('record', 'start', 'start_memory', 'peak')
+
+    def __init__(self, record: PassRecord, start_memory: int):
+        self.record: PassRecord = record
+        self.start: float = time.perf_counter()
+        self.start_memory: int = start_memory
+        # highest traced memory seen before the peak was last reset
+        self.peak: int = start_memory
+
+
+class PassTimer:
+
+    def __init__(self, trace_memory: bool = True):
+        self.trace_memory: bool = trace_memory
+        self.records: Dict[str, PassRecord] = { }
+        self._stack: List[_Frame] = [ ]
+        self._started_tracing: bool = False
+        self._start: float = 0.0
+        self.seconds: float = 0.0
+
+    def start(self):
+        self._start = time.perf_counter()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def stop(self):
+        self.seconds += time.perf_counter() - self._start
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def record(self, name: str) -> PassRecord:
+        record = self.records.get(name)
+        if record is None:
+            record = self.records[name] = PassRecord(name)
+        return record
+
+    @contextmanager
+    def measure(self, name: str) -> Iterator[PassRecord]:
+        record = self.record(name)
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        current = 0
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            # the peak is reset for the new stage, keep it for the outer one
+            if self._stack:
+                self._stack[-1].peak = max(self._stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+
+        frame = _Frame(record, current)
+        self._stack.append(frame)
+        try:
+            yield record
+        finally:
+            self._stack.pop()
+            record.runs += 1
+            record.seconds += time.perf_counter() - frame.start
+            if tracing:
+                peak = max(frame.peak, tracemalloc.get_traced_memory()[1])
+                record.peak_memory = max(record.peak_memory, peak - frame.start_memory)
+                if self._stack:
+                    self._stack[-1].peak = max(self._stack[-1].peak, peak)
+
+    def count(self, counter: str, n: int = 1):
+        if self._stack:
+            counters = self._stack[-1].record.counters
+            counters[counter] = counters.get(counter, 0) + n
+
+    def merge(self, records: Dict[str, PassRecord]):
+        """
+        Add the records of another timer, e.g. of a worker process.
+        """
+        for name, other in records.items():
+            self.record(name).merge(other)
+
+    # ++++++++ Report ++++++++
+    def sorted_records(self) -> List[PassRecord]:
+        return sorted(self.records.values(), key=lambda r: r.seconds, reverse=True)
+
+    def report_table(self) -> str:
+        total = self.seconds
+        rows = [ ]
+        for r in self.sorted_records():
+            rows.append([
+                r.name,
+                r.runs,
+                f"{r.seconds:.4f}",
+                f"{100 * r.seconds / total:.1f}%" if total else "-",
+                f"{r.peak_memory / 1024:.1f}" if self.trace_memory else "-",
+                ", ".join(f"{c}={n}" for c, n in sorted(r.counters.items())),
+            ])
+        headers = ["Pass", "Runs", "Wall (s)", "% Total", "Peak (KiB)", "Counters"]
+        return (
+            "===" + "-" * 70 + "===\n"
+            + "                      ... Pass execution timing report ...\n"
+            + "===" + "-" * 70 + "===\n"
+            + f"  Total Execution Time: {total:.4f} seconds (wall clock)\n"
+            + "  Nested passes are included in the time and memory of the enclosing pass.\n\n"
+            + tabulate(rows, headers=headers, tablefmt="simple")
+        )
+
+    def report_json(self) -> str:
+        return json.dumps({
+            'total_seconds': self.seconds,
+            'trace_memory': self.trace_memory,
+            'passes': [r.to_dict() for r in self.sorted_records()],
+        }, indent=2)
+
+
+_current_timer: ContextVar[Optional[PassTimer]] = ContextVar('pass_timer', default=None)
+
+
+def current_timer() -> Optional[PassTimer]:
+    return _current_timer.get()
+
+
+@contextmanager
+def use_timer(timer: PassTimer) -> Iterator[PassTimer]:
+    """
+    Record the stages run in this thread (or task) with timer until the
+    with block exits.
+    """
+    token = _current_timer.set(timer)
+    timer.start()
+    try:
+        yield timer
+    finally:
+        timer.stop()
+        _current_timer.reset(token)
+
+
+@contextmanager
+def time_pass(name: str) -> Iterator[Optional[PassRecord]]:
+    timer = _current_timer.get()
+    if timer is None:
+        yield None
+        return
+    with timer.measure(name) as record:
+        yield record
+
+
+def count(counter: str, n: int = 1):
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.count(counter, n)
@@ -0,0 +1,190 @@
+"""
+    Logging and tracing.
+
+    Every subsystem logs to a channel of its own (see CHANNELS). A channel
+    exposes one flag per level, callers test the flag before building a
+    message, so a disabled channel costs an attribute lookup and nothing
+    else:
+
+        _log = channel('dataflow')
+        ...
+        if _log.debug_on:
+            _log.emit(DEBUG, tabulate(...), event='result')
+
+    Enabled events are printed to stdout and, with a trace file, written to
+    it as one JSON object per line. Nothing below WARNING is shown unless
+    configure() lowers the level.
+"""
+import json
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+ERROR = 40
+WARNING = 30
+INFO = 20
+DEBUG = 10
+
+level_names: Dict[int, str] = {ERROR: 'error', WARNING: 'warning', INFO: 'info', DEBUG: 'debug'}
+
+CHANNELS: Tuple[str, ...] = ('optimizer', 'ir', 'cfg', 'ssa', 'sccp', 'dataflow', 'lcm', 'cache')
+
+# a level above every level, nothing is emitted
+_OFF = 100
+
+
+class _Settings:
+
+    def __init__(self):
+        # lowest level printed to stdout and written to the trace file
+        self.level: int = WARNING
+        self.trace_level: int = _OFF
+        # enabled channels, None for all
+        self.channels: Optional[frozenset] = None
+        # open trace file, or a list collecting the events of a worker
+        self.trace_file: Optional[TextIO] = None
+        self.trace_events: Optional[List[dict]] = None
+
+    def threshold(self, name: str) -> int:
+        if self.channels is not None and name not in self.channels:
+            return _OFF
+        return min(self.level, self.trace_level)
+
+
+_settings = _Settings()
+
+
+class Channel:
+    __slots__ = ('name', 'error_on', 'warning_on', 'info_on', 'debug_on')
+
+    def __init__(self, name: str):
+        self.name: str = name
+        self._update()
+
+    def _update(self):
+        threshold = _settings.threshold(self.name)
+        self.error_on: bool = threshold <= ERROR
+        self.warning_on: bool = threshold <= WARNING
+        self.info_on: bool = threshold <= INFO
+        self.debug_on: bool = threshold <= DEBUG
+
+    def emit(self, level: int, message: str, event: str = '', **fields):
+        """
+        Print message and record the event in the trace file, if the
+        level is enabled for either of them. Test the flag of the level
+        first, before building message and fields.
+        :param event: name of the event in the trace file.
+        :param fields: data of the event in the trace file.
+        """
+        if level >= _settings.level:
+            print(message)
+        if level >= _settings.trace_level:
+            record = {
+                'time': time.time(),
+                'channel': self.name,
+                'level': level_names.get(level, str(level)),
+                'event': event,
+                'message': message,
+            }
+            record.update(fields)
+            _write_event(record)
+
+
+_channels: Dict[str, Channel] = { }
+
+
+def channel(name: str) -> Channel:
+    ch = _channels.get(name)
+    if ch is None:
+        ch = _channels[name] = Channel(name)
+    return ch
+
+
+def _write_event(record: dict):
+    if _settings.trace_events is not None:
+        _settings.trace_events.append(record)
+    elif _settings.trace_file is not None:
+        _settings.trace_file.write(json.dumps(record, ensure_ascii=False, default=str))
+        _settings.trace_file.write("\n")
+
+
+def write_events(records: Iterable[dict]):
+    """
+    Record events collected elsewhere, e.g. by a worker process.
+    """
+    for record in records:
+        _write_event(record)
+
+
+def configure(
+        level: int = WARNING,
+        channels: Optional[Iterable[str]] = None,
+        trace_file: Optional[TextIO] = None,
+        trace_level: int = DEBUG,
+        trace_events: Optional[List[dict]] = None,
+):
+    """
+    :param level: lowest level printed to stdout.
+    :param channels: the enabled channels, all if None.
+    :param trace_file: file to write the events of trace_level and above to.
+    :param trace_events: collect the events in this list instead of a file.
+    """
+    _settings.level = level
+    _settings.channels = frozenset(channels) if channels is not None else None
+    _settings.trace_file = trace_file
+    _settings.trace_events = trace_events
+    _settings.trace_level = trace_level if trace_file is not None or trace_events is not None else _OFF
+    for ch in _channels.values():
+        ch._update()
+
+
+type TraceSettings = Tuple[int, Optional[frozenset], int, bool]
+
+
+def current_settings() -> TraceSettings:
+    """
+    :return: the configuration to pass to a worker process, see configure_worker().
+    """
+    tracing = _settings.trace_file is not None or _settings.trace_events is not None
+    return _settings.level, _settings.channels, _settings.trace_level, tracing
+
+
+def configure_worker(settings: TraceSettings) -> Optional[List[dict]]:
+    """
+    Take over the configuration of the parent process, trace events are
+    collected and have to be sent back to it.
+    :return: the list the trace events are collected in.
+    """
+    level, channels, trace_level, tracing = settings
+    events = [ ] if tracing else None
+    configure(level, channels, trace_level=trace_level, trace_events=events)
+    return events
+
+
+@contextmanager
+def tracing(
+        level: int = WARNING,
+        channels: Optional[Iterable[str]] = None,
+        trace_file: Optional[str] = None,
+) -> Iterator[None]:
+    """
+    Configure logging until the with block exits, events are written to
+    the file named trace_file.
+    """
+    file = open(trace_file, mode='w', encoding='utf-8') if trace_file else None
+    try:
+        configure(level, channels, file)
+        yield
+    finally:
+        configure()
+        if file is not None:
+            file.close()
+
+
+def verbosity_level(verbose: int) -> int:
+    """
+    Map the number of -v options to a level.
+    """
+    if verbose <= 0:
+        return WARNING
+    return INFO if verbose == 1 else DEBUG
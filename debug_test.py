@@ -3,18 +3,19 @@ from typing import List, Tuple
 
 from cof import LocalCodeOptimizer, CodeOptimizer
 from cof.base.cfg import ControlFlowGraph
+from cof.base.mir.context import MIRContext, use_context
 from cof.base.mir.function import MIRFunction
 from cof.base.mir.inst import MIRInsts
 from ir_file_parser import Parser
 from utils.cfg_visualizer import visualize_cfg
 
 
-def testing() -> Tuple[MIRInsts, List[MIRFunction]]:
+def testing() -> Tuple[MIRInsts, List[MIRFunction], MIRContext]:
     # p = Parser("ir_examples/example1.ir")
     p = Parser("ir_examples/sccp_example.ir")
     p.parse()
     p.insts.assign_addr()
-    return p.insts, p.func_list
+    return p.insts, p.func_list, p.context
 
 
 # ++++++++ Output ++++++++
@@ -30,12 +31,13 @@ def output_mir(insts, output_file):
 
 
 if __name__ == "__main__":
-    global_insts, func_list = testing()
+    global_insts, func_list, context = testing()
 
-    print(global_insts)
-    opter = CodeOptimizer(global_insts, func_list, sccp_enable=True, pre_algorithm='', ssa_period='always')
-    opter.optimize()
-    print(global_insts)
+    with use_context(context):
+        print(global_insts)
+        opter = CodeOptimizer(global_insts, func_list, sccp_enable=True, pre_algorithm='', ssa_period='always')
+        opter.optimize()
+        print(global_insts)
 
     # func = func_list[0]
     # cfg = ControlFlowGraph(func.insts)
@@ -1,11 +1,15 @@
+import mmap
 import sys
-from typing import List, Dict
+from contextlib import contextmanager
+from itertools import product
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple, Union
 
 from cof.base.mir.args import Args
+from cof.base.mir.context import MIRContext, MIRInstId, current_context, use_context
 from cof.base.mir.function import MIRFunction
 from cof.base.mir.inst import MIRInsts, MIRInst
 from cof.base.mir.operand import OperandType, Operand
-from cof.base.mir.variable import Variable
+from cof.timing import count, time_pass
 from .tokentype import *
 
 token_type_2_operand_type: Dict[TokenType, OperandType] = {
@@ -25,139 +29,276 @@ def _token_type_to_operand_type(token_type: TokenType) -> OperandType:
     return token_type_2_operand_type[token_type]
 
 
-def _recognize_token(text) -> List[Token]:
-    tokens = text.split()
+@contextmanager
+def _mapped_file(filename: str) -> Iterator[Union[mmap.mmap, BinaryIO]]:
+    """
+    Map the file read-only. Empty files and files that cannot be mapped
+    (pipes, ...) are read through the file object instead.
+    """
+    with open(filename, 'rb') as ir_file:
+        try:
+            buffer = mmap.mmap(ir_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            yield ir_file
+            return
+        with buffer:
+            yield buffer
+
+
+def _fatal_token(value: str):
+    print("\nfatal error: ")
+    print(f"Cannot recognize the token '{value}'...")
+    import traceback
+    traceback.print_exc()
+
+    sys.exit(-1)
+
+
+def _value_token(token_type: TokenType, value) -> Token:
+    return Token(token_type, value, VALUE_SHAPES[token_type])
+
+
+def _new_token(value: str) -> Token:
+    """
+    Classify a token with a single match of TOKEN_PATTERN.
+    """
+    match = TOKEN_PATTERN.match(value)
+    kind = match.lastgroup
+    # variables and constants are interned in the module being parsed
+    context = current_context()
+
+    if kind == 'VAR':
+        return _value_token(TokenType.VAR, context.variable(value))
+    elif kind == 'OP':
+        return Token(TokenType.OP, get_op_type(value), ':=' if value == ':=' else 'op')
+    elif kind == 'INT':
+        return _value_token(TokenType.INT, context.inst_table.canonical(int(value)))
+    elif kind == 'KEYWORD':
+        if value == BOOL_TRUE_VALUE:
+            return _value_token(TokenType.BOOL, True)
+        elif value == BOOL_FALSE_VALUE:
+            return _value_token(TokenType.BOOL, False)
+        return Token(TokenType.OP, get_op_type(value), value)
+    elif kind == 'ADDR':
+        return _value_token(TokenType.ADDR, value[1:])
+    elif kind == 'PRUN':
+        return Token(TokenType.PRUN, value, value)
+    elif kind == 'FLOAT':
+        return _value_token(TokenType.FLOAT, context.inst_table.canonical(float(value)))
+
+    _fatal_token(value)
+
+
+def _recognize_token(text, known_tokens: Dict[str, Token]) -> List[Token]:
+    """
+    Tokenize a line. Tokens are never modified, so every spelling is
+    classified once and its token is shared by the rest of the module.
+    :param known_tokens: spelling -> token of the module being parsed
+    """
     token_sequence: List[Token] = [ ]
+    for value in text.split():
+        token = known_tokens.get(value)
+        if token is None:
+            token = known_tokens[value] = _new_token(value)
+        token_sequence.append(token)
+    return token_sequence
 
-    for value in tokens:
-        if value in OP_KEYWORDS:
-            token_sequence.append(Token(TokenType.OP, get_op_type(value)))
-        elif value == BOOL_FALSE_VALUE:
-            token_sequence.append(Token(TokenType.BOOL, False))
-        elif value == BOOL_TRUE_VALUE:
-            token_sequence.append(Token(TokenType.BOOL, True))
-        elif re.match(OP_PATTERN, value):
-            token_sequence.append(Token(TokenType.OP, get_op_type(value)))
-        elif re.match(VAR_NAME_PATTERN, value):
-            token_sequence.append(Token(TokenType.VAR, Variable(value)))
-        elif re.match(INT_PATTERN, value):
-            try:
-                num = int(value)
-                token_sequence.append(Token(TokenType.INT, num))
-            except ValueError as e:
-                print("\nfatal error: ")
-                # print(f"error processing value on line {current_line} ")
-                print(f"value: '{value}' cannot be converted to an integer")
-                print(f"error type: {type(e).__name__}")
-                print(f"details: {str(e)}")
-
-                import traceback
-                traceback.print_exc()
-
-                sys.exit(-1)
-        elif re.match(FLOAT_PATTERN, value):
-            try:
-                num = float(value)
-                token_sequence.append(Token(TokenType.FLOAT, num))
-            except ValueError as e:
-                print("\nfatal error: ")
-                # print(f"error processing value on line {current_line} ")
-                print(f"value: '{value}' cannot be converted to an float")
-                print(f"error type: {type(e).__name__}")
-                print(f"details: {str(e)}")
-
-                import traceback
-                traceback.print_exc()
-
-                sys.exit(-1)
-        elif re.match(LABEL_REF_PATTERN, value):
-            # token_sequence.append(Token(TokenType.ADDR, self.labels_table[value[1:]]))
-            token_sequence.append(Token(TokenType.ADDR, value[1:]))
-
-        elif re.match(PARENTHESIS_PATTERN, value):
-            token_sequence.append(Token(TokenType.PRUN, value))
-        else:
-            print("\nfatal error: ")
-            print("Cannot recognize the token...")
-            import traceback
-            traceback.print_exc()
 
-            sys.exit(-1)
+def _operand(token: Token) -> Operand:
+    return Operand(_token_type_to_operand_type(token.token_type), token.value)
+
+
+# ++++++++ instruction patterns ++++++++
+#
+# Every builder fills the instruction of a fixed token shape.
+
+def _build_binary(inst: MIRInst, token_seq: List[Token]):
+    # result := operand1 Op operand2
+    inst.op = token_seq[3].value
+    inst.operand1 = _operand(token_seq[2])
+    inst.operand2 = _operand(token_seq[4])
+    inst.result = _operand(token_seq[0])
+
+def _build_branch(inst: MIRInst, token_seq: List[Token]):
+    # if operand goto Label
+    inst.op = Op.IF
+    inst.operand1 = _operand(token_seq[1])
+    inst.result = _operand(token_seq[3])
+
+def _build_assign(inst: MIRInst, token_seq: List[Token]):
+    # result := var
+    inst.op = Op.ASSIGN
+    inst.operand1 = _operand(token_seq[2])
+    inst.result = _operand(token_seq[0])
+
+def _build_jump(inst: MIRInst, token_seq: List[Token]):
+    # goto Label
+    inst.op = Op.GOTO
+    inst.result = _operand(token_seq[1])
+
+def _build_call_assign(inst: MIRInst, token_seq: List[Token]):
+    # m = max ( a 4 )
+    inst.op = Op.CALL_ASSIGN
+    inst.result = _operand(token_seq[0])
+    inst.operand1 = _operand(token_seq[2])
+    inst.operand2 = Operand(OperandType.ARGS, Args([_operand(t) for t in token_seq[4:-1]]))
+
+def _build_call(inst: MIRInst, token_seq: List[Token]):
+    # phi ( v1 v2 v3 )
+    inst.op = Op.CALL
+    inst.operand1 = _operand(token_seq[0])
+    inst.operand2 = Operand(OperandType.ARGS, Args([_operand(t) for t in token_seq[2:-1]]))
+
+def _build_print(inst: MIRInst, token_seq: List[Token]):
+    # print operand
+    inst.op = Op.PRINT
+    inst.operand1 = _operand(token_seq[1])
+
+def _build_init(inst: MIRInst, token_seq: List[Token]):
+    # init operand
+    inst.op = Op.INIT
+    inst.result = _operand(token_seq[1])
+
+def _build_entry_exit(inst: MIRInst, token_seq: List[Token]):
+    # entry/exit
+    inst.op = token_seq[0].value
+
+
+_VALUE = ('var', 'literal')
+
+# token shapes -> builder, a tuple in a shape stands for any of its shapes.
+_inst_patterns: List[Tuple[tuple, Callable[[MIRInst, List[Token]], None]]] = [
+    (('var', ':=', _VALUE, 'op', _VALUE), _build_binary),
+    (('%if', _VALUE, '%goto', 'addr'), _build_branch),
+    (('var', ':=', _VALUE), _build_assign),
+    (('%goto', 'addr'), _build_jump),
+    (('%print', _VALUE), _build_print),
+    (('%init', _VALUE), _build_init),
+    (('%entry',), _build_entry_exit),
+    (('%exit',), _build_entry_exit),
+]
+
+_inst_builders: Dict[Tuple[str, ...], Callable[[MIRInst, List[Token]], None]] = {
+    shape: builder
+    for pattern, builder in _inst_patterns
+    for shape in product(*(s if isinstance(s, tuple) else (s,) for s in pattern))
+}
 
-    return token_sequence
+# calls take any number of arguments, they are matched on the tokens before
+# the arguments and end with ')'.
+_call_builders: Dict[Tuple[str, ...], Callable[[MIRInst, List[Token]], None]] = {
+    ('var', ':=', 'var', '('): _build_call_assign,
+    ('var', '('): _build_call,
+}
+
+
+def _ret_inst_builder(token_seq: List[Token]) -> Optional[Callable[[MIRInst, List[Token]], None]]:
+    shape = tuple(token.shape for token in token_seq)
+    builder = _inst_builders.get(shape)
+    if builder is None and shape and shape[-1] == ')':
+        builder = _call_builders.get(shape[:4]) or _call_builders.get(shape[:2])
+    return builder
 
 
 class Parser:
     counter = 0
     def __init__(self, filename):
-        self.labels_table = { }
+        # labels of all functions, for the top level code
+        self.labels_table: Dict[str, MIRInstId] = { }
         self.ir_file = filename
         self.insts: MIRInsts = MIRInsts()
         self.func_list: List[MIRFunction] = [ ]
-
-    def _ignore_comments(self) -> List[str]:
-        lines = [ ]
-        with open(self.ir_file, 'r', encoding="utf-8") as ir_file:
+        # instruction ids and registry of the parsed module
+        self.context: MIRContext = MIRContext()
+        # spelling -> token, see _recognize_token()
+        self.known_tokens: Dict[str, Token] = { }
+        # address of the next top level instruction
+        self.next_addr: int = 0
+
+    def _code_lines(self, buffer: Union[mmap.mmap, BinaryIO]) -> Iterator[str]:
+        """
+        Scan the mapped file line by line as bytes, only the lines that are
+        not blank or comments are decoded.
+        """
+        for line in iter(buffer.readline, b''):
+            line = line.strip()
             # ignore comments
-            for line in ir_file.read().split('\n'):
-                line = line.strip()
-                if line and line[0] == '#' or not line:
-                    continue
-                lines.append(line)
-        return lines
-
-    def _handle_branch_jump(self, insts):
+            if line and line[0] != 0x23:  # '#'
+                yield line.decode('utf-8')
+
+    def _handle_branch_jump(self, insts: MIRInsts, labels: Dict[str, MIRInstId]):
         for inst in insts.ret_insts():
-            if inst.is_func():
-                func: MIRFunction = inst.operand1.value
-                func_insts = func.insts
-                self._handle_branch_jump(func_insts)
-            elif inst.is_if():
-                inst.result.value = self.labels_table[inst.result.value]
+            if inst.is_if():
+                inst.result.value = labels[inst.result.value]
             elif inst.is_goto():
-                inst.result.value = self.labels_table[inst.result.value]
+                inst.result.value = labels[inst.result.value]
 
     def parse(self):
-        lines = self._ignore_comments()
-        num_of_lines = len(lines)
-        i_for_lines = 0
-
-        while i_for_lines < num_of_lines:
-
-            func_def_match = re.match(FUNCTION_DEF_PATTERN, lines[i_for_lines])
-
-            if not re.match(LABEL_DEF_PATTERN, lines[i_for_lines]) and not func_def_match:
-                self.insts.insert_insts(self._generate_an_inst(lines[i_for_lines]))
-
+        for _ in self.iter_functions():
+            pass
+
+    def iter_functions(self, keep: bool = True) -> Iterator[MIRFunction]:
+        """
+        Read the file incrementally and yield every function as soon as its
+        `$end function` has been read. The labels of a function are resolved
+        and its addresses assigned before it is yielded, the labels of the
+        top level code after the last function. Functions are added to the
+        top level instructions like parse() does, the caller may remove
+        what it has written of them while the parser waits.
+
+        The module context is only active while the parser runs, activate
+        self.context to work on a yielded function.
+
+        :param keep: add the functions to func_list and their labels to
+            labels_table. Otherwise nothing of a yielded function is kept,
+            so the parser needs as much memory as the largest function, and
+            the top level code cannot branch to the labels of functions.
+        """
+        with _mapped_file(self.ir_file) as buffer:
+            lines = self._code_lines(buffer)
+            while True:
+                with use_context(self.context), time_pass('parse'):
+                    start = self.insts.num
+                    func = self._parse_until_function(lines, keep)
+                    self._assign_addr(start)
+                if func is None:
+                    break
+                if not keep:
+                    # the tokens would pile up over the whole module
+                    self.known_tokens.clear()
+                yield func
+
+        with use_context(self.context), time_pass('parse'):
+            self._handle_branch_jump(self.insts, self.labels_table)
+
+    def _assign_addr(self, start: int):
+        """
+        Continue MIRInsts.assign_addr() over the top level instructions
+        parsed from position start on.
+        """
+        for inst in self.insts.ret_insts_by_pos(start, self.insts.num):
+            inst.addr = self.next_addr
+            if inst.is_func():
+                self.next_addr = inst.operand1.value.insts.assign_addr(base=self.next_addr)
+            self.next_addr += 1
+
+    def _parse_until_function(self, lines: Iterator[str], keep: bool = True) -> Optional[MIRFunction]:
+        """
+        Parse top level code up to and including the next function.
+        :param keep: see iter_functions()
+        :return: the function, None at the end of the file.
+        """
+        for line in lines:
+            func_def_match = FUNCTION_DEF_PATTERN.match(line)
             if func_def_match:
+                return self._parse_a_function(func_def_match, lines, keep)
 
-                function_name = func_def_match.group(1)
-                args_list = [arg.strip() for arg in func_def_match.group(2).split() if arg.strip()]
-                func = MIRFunction(function_name, args_list)
-                self.func_list.append(func)
-                self.insts.insert_insts(MIRInst(
-                    self.counter,
-                    op=Op.FUNCTION_DEF,
-                    operand1=Operand(OperandType.FUNCTION, func),
-                    operand2=None,
-                    result=None))
-
-                func_code = [ ]
-                i_for_lines += 1
-                while i_for_lines < num_of_lines and not re.match(FUNCTION_END_PATTERN, lines[i_for_lines]):
-                    func_code.append(lines[i_for_lines])
-                    i_for_lines += 1
+            if not LABEL_DEF_PATTERN.match(line):
+                self.insts.insert_insts(self._generate_an_inst(line))
 
-                if i_for_lines >= num_of_lines:
-                    raise "fatal: syntax error"
+        return None
 
-                self._parse_a_function(func_code, func)
-
-            i_for_lines += 1
-
-        self._handle_branch_jump(self.insts)
-
-    def _generate_an_inst(self, text, label:str = None) -> MIRInst:
+    def _generate_an_inst(self, text) -> MIRInst:
 
         inst = MIRInst(
             offset=self.counter,
@@ -167,160 +308,9 @@ class Parser:
             result=None)
         self.counter += 1
 
-        if label is not None:
-            self.labels_table[label] = inst.unique_id
-
-
-        token_seq: List[Token] = _recognize_token(text)
-        # result := operand1 Op operand2
-        if (
-            len(token_seq) == 5
-            and token_seq[0].is_id()
-            and token_seq[1].is_assign()
-            and (token_seq[2].is_id() or token_seq[2].is_literal())
-            and (not token_seq[3].is_assign())
-            and (token_seq[4].is_id() or token_seq[4].is_literal())
-        ):
-            inst.op = token_seq[3].value
-
-            inst.operand1 = Operand(
-                _token_type_to_operand_type(token_seq[2].token_type)
-                , token_seq[2].value
-            )
-
-            inst.operand2 = Operand(
-                _token_type_to_operand_type(token_seq[4].token_type)
-                , token_seq[4].value
-            )
-
-            inst.result = Operand(
-                _token_type_to_operand_type(token_seq[0].token_type)
-                , token_seq[0].value
-            )
-
-        # if operand goto Label
-        elif (
-            len(token_seq) == 4
-            and token_seq[0].is_if()
-            and token_seq[1].is_value()
-            and token_seq[2].is_goto()
-            and token_seq[3].is_label()
-        ):
-            inst.op = Op.IF
-            inst.operand1 = Operand(
-                _token_type_to_operand_type(token_seq[1].token_type)
-                , token_seq[1].value
-            )
-
-            inst.result = Operand(
-                _token_type_to_operand_type(token_seq[3].token_type)
-                , token_seq[3].value
-            )
-
-        # result := var
-        elif (
-            len(token_seq) == 3
-            and token_seq[0].is_id()
-            and token_seq[1].is_assign()
-            and token_seq[2].is_value()
-        ):
-            inst.op = Op.ASSIGN
-            inst.operand1 = Operand(
-                _token_type_to_operand_type(token_seq[2].token_type)
-                , token_seq[2].value
-            )
-            inst.result = Operand(
-                _token_type_to_operand_type(token_seq[0].token_type)
-                , token_seq[0].value
-            )
-
-        # goto Label
-        elif (
-            len(token_seq) == 2
-            and token_seq[0].is_goto()
-            and token_seq[1].is_label()
-        ):
-            inst.op = Op.GOTO
-            inst.result = Operand(
-                _token_type_to_operand_type(token_seq[1].token_type)
-                , token_seq[1].value
-            )
-
-        # m = max ( a 4 )
-        elif (
-            token_seq[0].is_id()
-            and token_seq[1].is_assign()
-            and token_seq[2].is_id()
-            and token_seq[3].is_left_parenthesis()
-            and token_seq[-1].is_right_parenthesis()
-        ):
-            inst.op = Op.CALL_ASSIGN
-            inst.result = Operand(
-                _token_type_to_operand_type(token_seq[0].token_type)
-                , token_seq[0].value
-            )
-            inst.operand1 = Operand(
-                _token_type_to_operand_type(token_seq[2].token_type)
-                , token_seq[2].value
-            )
-            args = [ ]
-            for i in range(4, len(token_seq) - 1):
-                args.append(Operand(
-                    _token_type_to_operand_type(token_seq[i].token_type)
-                    , token_seq[i].value
-                ))
-            inst.operand2 = Operand(OperandType.ARGS, Args(args))
-
-        # phi ( v1 v2 v3 )
-        elif (
-            token_seq[0].is_id()
-            and token_seq[1].is_left_parenthesis()
-            and token_seq[-1].is_right_parenthesis()
-        ):
-            inst.op = Op.CALL
-            inst.operand1 = Operand(
-                _token_type_to_operand_type(token_seq[0].token_type)
-                , token_seq[0].value
-            )
-            args = [ ]
-            for i in range(2, len(token_seq) - 1):
-                args.append(Operand(
-                    _token_type_to_operand_type(token_seq[i].token_type)
-                    , token_seq[i].value
-                ))
-            inst.operand2 = Operand(OperandType.ARGS, Args(args))
-
-        # print operand
-        elif (
-            len(token_seq) == 2
-            and (token_seq[0].is_print() and token_seq[1].is_value())
-        ):
-            inst.op = Op.PRINT
-            inst.operand1 = Operand(
-                _token_type_to_operand_type(token_seq[1].token_type)
-                , token_seq[1].value
-            )
-
-        # init operand
-        elif (
-            len(token_seq) == 2
-            and (token_seq[0].is_init() and token_seq[1].is_value())
-        ):
-            inst.op = Op.INIT
-            inst.result = Operand(
-                _token_type_to_operand_type(token_seq[1].token_type)
-                , token_seq[1].value
-            )
-
-
-        # entry/exit
-        elif (
-            len(token_seq) == 1
-            and (token_seq[0].is_entry() or token_seq[0].is_exit())
-        ):
-            inst.op = token_seq[0].value
-
-        else:
+        token_seq: List[Token] = _recognize_token(text, self.known_tokens)
+        builder = _ret_inst_builder(token_seq)
+        if builder is None:
             print("\nfatal error: ")
             print("unsupported syntax...")
             import traceback
@@ -328,19 +318,45 @@ class Parser:
 
             sys.exit(-1)
 
+        builder(inst, token_seq)
+
         return inst
 
-    def _parse_a_function(self, local_code: List[str], func: MIRFunction):
+    def _parse_a_function(self, func_def_match: re.Match, lines: Iterator[str], keep: bool = True) -> MIRFunction:
+
+        function_name = func_def_match.group(1)
+        args_list = [arg.strip() for arg in func_def_match.group(2).split() if arg.strip()]
+        func = MIRFunction(function_name, args_list)
+        if keep:
+            self.func_list.append(func)
+        self.insts.insert_insts(MIRInst(
+            self.counter,
+            op=Op.FUNCTION_DEF,
+            operand1=Operand(OperandType.FUNCTION, func),
+            operand2=None,
+            result=None))
 
+        # label -> id of the labeled instruction
+        labels: Dict[str, MIRInstId] = { }
         label = None
-        for line in local_code:
-            if not re.match(LABEL_DEF_PATTERN, line):
-                inst = self._generate_an_inst(line, label)
-                # self.insts.insert_insts(inst)
-                func.insts.insert_insts(inst)
+        for line in lines:
+            if FUNCTION_END_PATTERN.match(line):
+                break
+
+            if not LABEL_DEF_PATTERN.match(line):
+                inst = self._generate_an_inst(line)
                 if label is not None:
+                    labels[label] = inst.unique_id
                     label = None
+                func.insts.insert_insts(inst)
             else:
                 label = line[:-1]
-                continue
-
+        else:
+            raise SyntaxError(f"fatal: missing $end function of {function_name}")
+
+        self._handle_branch_jump(func.insts, labels)
+        if keep:
+            self.labels_table.update(labels)
+        count('functions')
+        count('instructions', func.insts.num)
+        return func
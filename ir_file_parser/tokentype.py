@@ -46,8 +46,22 @@ OP_PATTERN = re.compile(r'^[+\-*/=<>!&|^%:]+$')
 PARENTHESIS_PATTERN = re.compile(r'^[()]$')
 
 # function def
-FUNCTION_DEF_PATTERN = r'\$function\s+(\w+)\s*\(\s*([^)]*?)\s*\)\s*'
-FUNCTION_END_PATTERN = r'\$end\s*function\s*'
+FUNCTION_DEF_PATTERN = re.compile(r'\$function\s+(\w+)\s*\(\s*([^)]*?)\s*\)\s*')
+FUNCTION_END_PATTERN = re.compile(r'\$end\s*function\s*')
+
+# All token patterns above in one regex, a match of a whitespace separated
+# token has the token class as lastgroup. Variables and label references
+# only have to start like one, as with the single patterns.
+TOKEN_PATTERN = re.compile(r'''
+      (?P<KEYWORD>%(?:if|goto|entry|exit|print|init|true|false))(?=\s|$)
+    | (?P<OP>[+\-*/=<>!&|^%:]+)(?=\s|$)
+    | (?P<VAR>[A-Za-z_]\S*)
+    | (?P<INT>\d+)(?=\s|$)
+    | (?P<FLOAT>\d+\.\d+)(?=\s|$)
+    | (?P<ADDR>&[A-Za-z_]\S*)
+    | (?P<PRUN>[()])(?=\s|$)
+    | (?P<UNKNOWN>\S+)
+''', re.VERBOSE)
 
 OP_MAP = {
     ":=": Op.ASSIGN,
@@ -74,10 +88,29 @@ def get_op_type(op_token: str):
     return OP_MAP.get(op_token, Op.UNKNOWN)
 
 
+# shape of the tokens that are not operators, see Token.shape
+VALUE_SHAPES = {
+    TokenType.VAR: 'var',
+    TokenType.BOOL: 'literal',
+    TokenType.FLOAT: 'literal',
+    TokenType.INT: 'literal',
+    TokenType.STR: 'literal',
+    TokenType.ADDR: 'addr',
+}
+
+
 class Token:
-    def __init__(self, token_type: TokenType, value):
+    """
+    shape is what the instruction patterns match on: 'var', 'literal',
+    'addr', the parenthesis, ':=' and the keywords themselves, and 'op' for
+    every other operator.
+    """
+    __slots__ = ('token_type', 'value', 'shape')
+
+    def __init__(self, token_type: TokenType, value, shape: str = ''):
         self.token_type = token_type
         self.value = value
+        self.shape = shape
 
 
     def is_id(self):